@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.responses import OrjsonResponse
+
+logger = logging.getLogger(__name__)
+
+# Instante (time.monotonic) em que a requisição atual deixa de interessar
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """O prazo da requisição acabou antes da operação terminar (vira 504)."""
+
+
+# =========================================================
+# Prazo da requisição
+# =========================================================
+def set_deadline(seconds: float) -> None:
+    """Define o prazo da requisição atual (vale para as tarefas e threads criadas depois)."""
+    _deadline.set(time.monotonic() + seconds)
+
+
+def remaining() -> Optional[float]:
+    """Segundos até o prazo; None sem prazo definido."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def timeout(default: float) -> float:
+    """
+    Timeout para uma chamada externa: o padrão dela, limitado pelo que resta
+    do prazo. Com o prazo já vencido nem vale a pena começar.
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("Prazo da requisição esgotado")
+    return min(default, left)
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def parse_timeout_header(value: Optional[str]) -> Optional[float]:
+    """X-Request-Timeout em segundos (aceita fração); inválido ou <= 0 é ignorado."""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        return None
+    return seconds if seconds > 0 else None
+
+
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded) -> OrjsonResponse:
+    cancellation_metrics.deadline_exceeded += 1
+    return OrjsonResponse(status_code=504, content={"detail": "Tempo limite da requisição esgotado."})
+
+
+# =========================================================
+# Métricas
+# =========================================================
+class CancellationMetrics:
+    def __init__(self):
+        self.client_disconnects = 0
+        self.generations_cancelled = 0
+        self.deadline_exceeded = 0
+
+    def stats(self) -> dict:
+        return {
+            "client_disconnects": self.client_disconnects,
+            "generations_cancelled": self.generations_cancelled,
+            "deadline_exceeded": self.deadline_exceeded,
+        }
+
+
+# Instância global
+cancellation_metrics = CancellationMetrics()
+
+
+# =========================================================
+# Middleware ASGI
+# =========================================================
+class DisconnectMiddleware:
+    """
+    Cancela o processamento da requisição quando o cliente desconecta antes
+    da resposta terminar (jogador fechou o app no meio da geração): a
+    chamada ao OpenRouter em andamento é abortada e a reserva de moedas
+    liberada pelos handlers de cancelamento das rotas.
+
+    O corpo da requisição (pequeno nesta API) é lido antes de chamar o app
+    e entregue a ele de uma vez; a partir daí o middleware é o único leitor
+    do `receive` original e repassa o http.disconnect. Corpos acima de
+    `max_body_bytes` (pelo Content-Length ou pelo que chegou) recebem 413
+    sem chegar ao app.
+    """
+
+    def __init__(self, app: ASGIApp, max_body_bytes: int):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def _too_large(self, scope: Scope, receive: Receive, send: Send) -> None:
+        response = OrjsonResponse(status_code=413, content={"detail": "Corpo da requisição grande demais."})
+        await response(scope, receive, send)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit() and int(value) > self.max_body_bytes:
+                    await self._too_large(scope, receive, send)
+                    return
+                break
+
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                await self._too_large(scope, receive, send)
+                return
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                break
+        body = {"type": "http.request", "body": b"".join(chunks), "more_body": False}
+
+        disconnected = asyncio.Event()
+        body_delivered = False
+        response_done = False
+
+        async def app_receive() -> Message:
+            nonlocal body_delivered
+            if not body_delivered:
+                body_delivered = True
+                return body
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def app_send(message: Message) -> None:
+            nonlocal response_done
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_done = True
+            await send(message)
+
+        app_task = asyncio.ensure_future(self.app(scope, app_receive, app_send))
+
+        async def watch() -> None:
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+            # Depois da resposta completa o servidor também avisa desconexão;
+            # aí não há mais nada a cancelar
+            if not response_done and not app_task.done():
+                cancellation_metrics.client_disconnects += 1
+                logger.info("Cliente desconectou; cancelando a requisição",
+                            extra={"fields": {"path": scope["path"]}})
+                app_task.cancel()
+
+        watcher = asyncio.ensure_future(watch())
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            if not disconnected.is_set():
+                raise  # cancelamento do servidor (shutdown), não do cliente
+        finally:
+            watcher.cancel()
@@ -0,0 +1,372 @@
+import functools
+import inspect
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator
+
+from fastapi import Request
+
+from app.core.cancellation import DeadlineExceeded, expired
+from app.core.config import settings
+from app.core.responses import OrjsonResponse
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """O circuito está aberto: a chamada nem é tentada (vira 503 com Retry-After)."""
+
+    def __init__(self, name: str, retry_after: int):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"Circuito '{name}' aberto; tente novamente em {retry_after}s")
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker com janela deslizante das últimas `window_size` chamadas.
+
+    Abre quando, com pelo menos `min_calls` chamadas na janela, a fração de
+    falhas passa de `failure_rate` ou a de chamadas lentas (>=
+    `slow_call_seconds`) passa de `slow_call_rate`. Aberto, rejeita tudo
+    por `open_seconds`; depois deixa passar `half_open_probes` chamadas de
+    teste: se todas forem bem e rápidas ele fecha, senão abre de novo.
+
+    Thread-safe (os serviços de Firestore rodam em threads). Chamadas
+    aninhadas no mesmo breaker (um método do serviço chamando outro) contam
+    uma vez só.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        window_size: int,
+        min_calls: int,
+        failure_rate: float,
+        slow_call_seconds: float,
+        slow_call_rate: float,
+        open_seconds: float,
+        half_open_probes: int,
+        is_failure: Callable[[BaseException], bool] = lambda exc: True,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.is_failure = is_failure
+
+        self._lock = threading.Lock()
+        self._calls: deque = deque(maxlen=window_size)  # (falhou, lenta)
+        self._active: ContextVar[bool] = ContextVar(f"breaker_{name}", default=False)
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.times_opened = 0
+        self.rejected = 0
+
+    # =========================================================
+    # Estado
+    # =========================================================
+    def _retry_after(self) -> float:
+        return self._opened_at + self.open_seconds - time.monotonic()
+
+    def is_rejecting(self) -> bool:
+        """True se uma chamada agora seria rejeitada (sem ocupar vaga de teste)."""
+        with self._lock:
+            if self.state == OPEN:
+                return self._retry_after() > 0
+            if self.state == HALF_OPEN:
+                return self._probes_in_flight >= self.half_open_probes
+            return False
+
+    def ensure_available(self) -> None:
+        """Falha rápido antes de começar um trabalho que dependeria deste serviço."""
+        if self.is_rejecting():
+            with self._lock:
+                self.rejected += 1
+            raise CircuitOpenError(self.name, max(1, math.ceil(self._retry_after())))
+
+    def _trip(self) -> None:
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+        self.times_opened += 1
+        logger.warning("Circuito aberto", extra={"fields": {"breaker": self.name}})
+
+    def _acquire(self) -> None:
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self._retry_after()
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, max(1, math.ceil(remaining)))
+                self.state = HALF_OPEN
+                self._probes_in_flight = 0
+                self._probe_successes = 0
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, 1)
+                self._probes_in_flight += 1
+
+    def _record(self, failed: bool, duration: float, probe: bool = True) -> None:
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            if self.state == OPEN:
+                return  # chamada que começou antes de abrir
+            if self.state == HALF_OPEN:
+                if not probe:
+                    return  # só as sondas decidem o half-open
+                self._probes_in_flight -= 1
+                if failed or slow:
+                    self._trip()
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self.state = CLOSED
+                    logger.info("Circuito fechado", extra={"fields": {"breaker": self.name}})
+                return
+
+            self._calls.append((failed, slow))
+            if len(self._calls) < self.min_calls:
+                return
+            failures = sum(1 for f, _ in self._calls if f) / len(self._calls)
+            slow_calls = sum(1 for _, s in self._calls if s) / len(self._calls)
+            if failures >= self.failure_rate or slow_calls >= self.slow_call_rate:
+                self._trip()
+
+    def _release(self) -> None:
+        """Chamada que não conta (cancelada, erro de negócio numa sonda...)."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes_in_flight -= 1
+
+    # =========================================================
+    # Uso
+    # =========================================================
+    @contextmanager
+    def guard(self):
+        """Protege o bloco (sync, ou com awaits dentro de uma coroutine)."""
+        if self._active.get():
+            yield
+            return
+
+        self._acquire()
+        token = self._active.set(True)
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as exc:
+            if self.is_failure(exc):
+                self._record(True, time.monotonic() - start)
+            else:
+                self._record(False, time.monotonic() - start)
+            raise
+        except BaseException:
+            # Cancelamento não diz nada sobre a saúde do serviço
+            self._release()
+            raise
+        else:
+            self._record(False, time.monotonic() - start)
+        finally:
+            self._active.reset(token)
+
+    @contextmanager
+    def observe(self):
+        """
+        Como guard, mas nunca rejeita: o resultado entra na janela (com o
+        circuito fechado) sem pedir passagem. Para chamadas que precisam
+        terminar mesmo com o serviço instável (ver unguarded).
+        """
+        if self._active.get():
+            yield
+            return
+
+        token = self._active.set(True)
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as exc:
+            self._record(self.is_failure(exc), time.monotonic() - start, probe=False)
+            raise
+        else:
+            self._record(False, time.monotonic() - start, probe=False)
+        finally:
+            self._active.reset(token)
+
+    def guard_iter(self, iterator: Iterator) -> Iterator:
+        """
+        Protege um iterador consumido aos poucos (stream do Firestore): a
+        chamada vai do primeiro item ao último, e só o tempo dentro do
+        next() conta para lentidão (não o do consumidor). Consumidor que
+        para antes do fim não é falha. Sem ContextVar: os itens podem ser
+        pedidos de threads/contextos diferentes.
+        """
+        if self._active.get():
+            yield from iterator  # já dentro de uma chamada protegida
+            return
+
+        self._acquire()
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.monotonic()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.monotonic() - start
+                yield item
+        except GeneratorExit:
+            self._record(False, elapsed)
+            raise
+        except Exception as exc:
+            self._record(self.is_failure(exc), elapsed)
+            raise
+        except BaseException:
+            self._release()
+            raise
+        else:
+            self._record(False, elapsed)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            calls = len(self._calls)
+            return {
+                "state": self.state,
+                "window_calls": calls,
+                "window_failures": sum(1 for f, _ in self._calls if f),
+                "window_slow": sum(1 for _, s in self._calls if s),
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+                "retry_after": max(0, math.ceil(self._retry_after())) if self.state == OPEN else 0,
+            }
+
+
+def unguarded(func: Callable) -> Callable:
+    """
+    Marca um método que guarded_methods não pode recusar (só observa): o
+    que finaliza um trabalho já feito, como o débito de um passo gravado.
+    """
+    func._breaker_unguarded = True
+    return func
+
+
+def guarded_methods(breaker: CircuitBreaker) -> Callable:
+    """
+    Decorator de classe: todos os métodos públicos passam pelo breaker
+    (os marcados com @unguarded só são observados).
+    """
+
+    def wrap(func: Callable) -> Callable:
+        if getattr(func, "_breaker_unguarded", False):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def observed_async_wrapper(*args, **kwargs):
+                    with breaker.observe():
+                        return await func(*args, **kwargs)
+                return observed_async_wrapper
+
+            @functools.wraps(func)
+            def observed_wrapper(*args, **kwargs):
+                with breaker.observe():
+                    return func(*args, **kwargs)
+            return observed_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with breaker.guard():
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            # O trabalho acontece enquanto o gerador é consumido, não na chamada
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                yield from breaker.guard_iter(func(*args, **kwargs))
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with breaker.guard():
+                return func(*args, **kwargs)
+        return wrapper
+
+    def decorator(cls):
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith("_") or not inspect.isfunction(value):
+                continue
+            setattr(cls, attr, wrap(value))
+        return cls
+
+    return decorator
+
+
+async def circuit_open_handler(request: Request, exc: CircuitOpenError) -> OrjsonResponse:
+    return OrjsonResponse(
+        status_code=503,
+        content={"detail": "Serviço temporariamente indisponível, tente novamente.", "service": exc.name},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+# =========================================================
+# Breakers da aplicação
+# =========================================================
+def _llm_failure(exc: BaseException) -> bool:
+    """Prazo do próprio cliente esgotado não é falha do OpenRouter."""
+    return not isinstance(exc, DeadlineExceeded)
+
+
+def _firestore_failure(exc: BaseException) -> bool:
+    """Só erros de infraestrutura contam; NotFound, AlreadyExists etc. são respostas normais."""
+    from google.api_core import exceptions as gexc
+
+    if isinstance(exc, DeadlineExceeded) or expired():
+        return False  # o prazo que acabou foi o da requisição
+
+    if isinstance(exc, (gexc.ServiceUnavailable, gexc.DeadlineExceeded, gexc.InternalServerError,
+                        gexc.TooManyRequests, gexc.ResourceExhausted, gexc.Unknown, gexc.RetryError)):
+        return True
+    return isinstance(exc, (TimeoutError, ConnectionError))
+
+
+def _build(name: str, slow_call_seconds: float, is_failure) -> CircuitBreaker:
+    return CircuitBreaker(
+        name,
+        window_size=settings.breaker_window_size,
+        min_calls=settings.breaker_min_calls,
+        failure_rate=settings.breaker_failure_rate,
+        slow_call_seconds=slow_call_seconds,
+        slow_call_rate=settings.breaker_slow_call_rate,
+        open_seconds=settings.breaker_open_seconds,
+        half_open_probes=settings.breaker_half_open_probes,
+        is_failure=is_failure,
+    )
+
+
+# Instâncias globais
+llm_breaker = _build("openrouter", settings.llm_slow_call_seconds, _llm_failure)
+firestore_breaker = _build("firestore", settings.firestore_slow_call_seconds, _firestore_failure)
+
+breakers: Dict[str, CircuitBreaker] = {b.name: b for b in (llm_breaker, firestore_breaker)}
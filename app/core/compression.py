@@ -0,0 +1,212 @@
+import zlib
+from typing import Callable, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+try:
+    import brotli
+except ImportError:  # opcional: sem ele o br não é oferecido
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # opcional: sem ele o zstd não é oferecido
+    zstandard = None
+
+# Tipos que já vêm comprimidos (PNG do PIX, por exemplo) passam direto
+_COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+# =========================================================
+# Compressores incrementais (mesma interface para os três)
+# =========================================================
+class _GzipCompressor:
+    def __init__(self, level: int):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes, flush: bool = True) -> bytes:
+        # SYNC_FLUSH entrega o bloco já decodificável para o cliente
+        out = self._obj.compress(data)
+        return out + self._obj.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self) -> bytes:
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+class _BrotliCompressor:
+    def __init__(self, quality: int):
+        self._obj = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, flush: bool = True) -> bytes:
+        out = self._obj.process(data)
+        return out + self._obj.flush() if flush else out
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+class _ZstdCompressor:
+    def __init__(self, level: int):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes, flush: bool = True) -> bytes:
+        out = self._obj.compress(data)
+        return out + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK) if flush else out
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+def available_encodings() -> dict[str, Callable[[], object]]:
+    """Codificações suportadas, na ordem de preferência do servidor."""
+    encodings = {}
+    if zstandard is not None:
+        encodings["zstd"] = lambda: _ZstdCompressor(settings.compression_zstd_level)
+    if brotli is not None:
+        encodings["br"] = lambda: _BrotliCompressor(settings.compression_brotli_quality)
+    encodings["gzip"] = lambda: _GzipCompressor(settings.compression_gzip_level)
+    return encodings
+
+
+def negotiate(accept_encoding: str, offered) -> Optional[str]:
+    """
+    Escolhe a codificação pelo Accept-Encoding (com q-values). Em empate
+    vale a ordem de `offered`; q=0 recusa, '*' cobre as não citadas.
+    """
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+
+    best, best_q = None, 0.0
+    for encoding in offered:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+# =========================================================
+# Middleware ASGI
+# =========================================================
+class CompressionMiddleware:
+    """
+    Compressão negociada (zstd, br, gzip) para respostas acima de
+    `minimum_size` bytes.
+
+    Corpos enviados de uma vez são comprimidos inteiros. Respostas em
+    streaming (listagens longas) são comprimidas bloco a bloco, sem
+    bufferizar o corpo todo: os primeiros blocos só são segurados até
+    passar do limite, para respostas pequenas saírem sem compressão.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = available_encodings()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressedResponder(send, encoding, self.encodings[encoding], self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressedResponder:
+    def __init__(self, send: Send, encoding: str, factory, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.factory = factory
+        self.minimum_size = minimum_size
+        self.start: Optional[Message] = None
+        self.pending: list[bytes] = []
+        self.pending_size = 0
+        self.compressor = None
+        self.passthrough = False
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            self.passthrough = (
+                "content-encoding" in headers
+                or message["status"] in (204, 304)
+                or not content_type.startswith(_COMPRESSIBLE_TYPES)
+            )
+            if self.passthrough:
+                await self._send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is not None:
+            await self._send_chunk(self.compressor.compress(body) if body else b"", more_body)
+            return
+
+        self.pending.append(body)
+        self.pending_size += len(body)
+        if more_body and self.pending_size < self.minimum_size:
+            return  # ainda não dá para saber se vale comprimir
+
+        buffered = b"".join(self.pending)
+        self.pending = []
+
+        if not more_body:
+            # Corpo completo: comprime de uma vez (ou manda como veio se for pequeno)
+            if len(buffered) < self.minimum_size:
+                await self._start(compressed=False, content_length=len(buffered))
+                await self._send({"type": "http.response.body", "body": buffered})
+                return
+            compressor = self.factory()
+            payload = compressor.compress(buffered, flush=False) + compressor.finish()
+            await self._start(compressed=True, content_length=len(payload))
+            await self._send({"type": "http.response.body", "body": payload})
+            return
+
+        # Streaming: comprime bloco a bloco
+        self.compressor = self.factory()
+        await self._start(compressed=True, content_length=None)
+        await self._send_chunk(self.compressor.compress(buffered), more_body=True)
+
+    async def _send_chunk(self, data: bytes, more_body: bool) -> None:
+        if not more_body:
+            data += self.compressor.finish()
+        await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    async def _start(self, compressed: bool, content_length: Optional[int]) -> None:
+        headers = MutableHeaders(raw=self.start["headers"])
+        headers.add_vary_header("Accept-Encoding")
+        if compressed:
+            headers["Content-Encoding"] = self.encoding
+        if content_length is None:
+            if "content-length" in headers:
+                del headers["content-length"]
+        else:
+            headers["Content-Length"] = str(content_length)
+        self.start["headers"] = headers.raw
+        await self._send(self.start)
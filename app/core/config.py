@@ -3,7 +3,9 @@ from pydantic import Field
 
 class Settings(BaseSettings):
     app_name: str = Field("fastapi-firebase", alias="APP_NAME")
-    app_env: str = Field("dev", alias="APP_ENV")
+    # Sem APP_ENV o app se comporta como produção (exige SESSION_TOKEN_SECRETS);
+    # desenvolvimento local declara APP_ENV=dev no .env
+    app_env: str = Field("production", alias="APP_ENV")
     app_host: str = Field("0.0.0.0", alias="APP_HOST")
     app_port: int = Field(8000, alias="APP_PORT")
     
@@ -14,6 +16,51 @@ class Settings(BaseSettings):
     firebase_client_email: str | None = Field(None, alias="FIREBASE_CLIENT_EMAIL")
     firebase_private_key: str | None = Field(None, alias="FIREBASE_PRIVATE_KEY")
     
+    # ============ IDENTITY TOOLKIT (REST) ============
+    identity_toolkit_url: str = Field("https://identitytoolkit.googleapis.com/v1", alias="IDENTITY_TOOLKIT_URL")
+    securetoken_url: str = Field("https://securetoken.googleapis.com/v1", alias="SECURETOKEN_URL")
+    identity_http_max_connections: int = Field(100, alias="IDENTITY_HTTP_MAX_CONNECTIONS")
+    identity_http_max_keepalive: int = Field(20, alias="IDENTITY_HTTP_MAX_KEEPALIVE")
+    # Limites por minuto (token bucket) para register/login/refresh
+    auth_throttle_ip_per_minute: int = Field(60, alias="AUTH_THROTTLE_IP_PER_MINUTE")
+    auth_throttle_email_per_minute: int = Field(10, alias="AUTH_THROTTLE_EMAIL_PER_MINUTE")
+    # Proxies confiáveis na frente da API (Render = 1). Cada um acrescenta
+    # à direita do X-Forwarded-For o IP que viu; o IP do cliente é o que o
+    # mais externo deles anotou. Com 0 o cabeçalho é ignorado.
+    trusted_proxy_hops: int = Field(0, alias="TRUSTED_PROXY_HOPS")
+    
+    # ============ RATE LIMITING (por usuário e classe de rota) ============
+    rate_limit_backend: str = Field("memory", alias="RATE_LIMIT_BACKEND")  # memory | redis
+    rate_limit_redis_url: str | None = Field(None, alias="RATE_LIMIT_REDIS_URL")
+    rate_limit_llm_per_minute: int = Field(10, alias="RATE_LIMIT_LLM_PER_MINUTE")
+    rate_limit_read_per_minute: int = Field(120, alias="RATE_LIMIT_READ_PER_MINUTE")
+    rate_limit_checkout_per_minute: int = Field(5, alias="RATE_LIMIT_CHECKOUT_PER_MINUTE")
+    rate_limit_auth_per_minute: int = Field(30, alias="RATE_LIMIT_AUTH_PER_MINUTE")
+    
+    # ============ LOGGING ============
+    log_level: str = Field("INFO", alias="LOG_LEVEL")
+    # Ex.: "app.deps.auth=DEBUG,app.routers.webhooks=WARNING"
+    log_levels: str = Field("", alias="LOG_LEVELS")
+    # Fração de registros DEBUG/INFO mantidos por módulo. Ex.: "app.deps.auth=0.01"
+    log_sample_rates: str = Field("", alias="LOG_SAMPLE_RATES")
+    
+    # ============ CERTIFICADOS DO GOOGLE (ID TOKENS) ============
+    google_certs_url: str = Field(
+        "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com",
+        alias="GOOGLE_CERTS_URL"
+    )
+    google_certs_refresh_margin_seconds: int = Field(300, alias="GOOGLE_CERTS_REFRESH_MARGIN_SECONDS")
+    
+    # ============ SESSION TOKENS (HMAC) ============
+    # Chaves no formato "kid1:segredo1,kid2:segredo2"; a primeira assina,
+    # as demais só verificam (rotação sem derrubar sessões abertas)
+    session_token_secrets: str | None = Field(None, alias="SESSION_TOKEN_SECRETS")
+    session_token_ttl_seconds: int = Field(900, alias="SESSION_TOKEN_TTL_SECONDS")
+    
+    # ============ CACHE DE TOKENS VERIFICADOS ============
+    token_cache_max_entries: int = Field(10000, alias="TOKEN_CACHE_MAX_ENTRIES")
+    token_cache_skew_seconds: int = Field(30, alias="TOKEN_CACHE_SKEW_SECONDS")
+    
     # ============ STRIPE CONFIGURATION ============
     stripe_secret_key: str = Field(..., alias="STRIPE_SECRET_KEY")
     stripe_publishable_key: str = Field(..., alias="STRIPE_PUBLISHABLE_KEY")
@@ -26,6 +73,81 @@ class Settings(BaseSettings):
         "http://localhost:8080/store",
         alias="STRIPE_CANCEL_URL"
     )
+    # Permite apontar o SDK para um stand-in local (testes/benchmarks)
+    stripe_api_base: str | None = Field(None, alias="STRIPE_API_BASE")
+    # Chamadas ao SDK (síncrono) rodam neste pool de threads
+    stripe_executor_workers: int = Field(8, alias="STRIPE_EXECUTOR_WORKERS")
+    # Reaproveita a sessão de checkout aberta do mesmo (usuário, pacote)
+    stripe_checkout_reuse_seconds: int = Field(600, alias="STRIPE_CHECKOUT_REUSE_SECONDS")
+    # Fila de eventos do webhook
+    stripe_webhook_workers: int = Field(4, alias="STRIPE_WEBHOOK_WORKERS")
+    stripe_webhook_max_attempts: int = Field(5, alias="STRIPE_WEBHOOK_MAX_ATTEMPTS")
+    # ==============================================
+
+    # ============ COMPRESSÃO ============
+    # Respostas menores que isso saem sem compressão
+    compression_min_size: int = Field(1024, alias="COMPRESSION_MIN_SIZE")
+    compression_gzip_level: int = Field(6, alias="COMPRESSION_GZIP_LEVEL")
+    compression_brotli_quality: int = Field(4, alias="COMPRESSION_BROTLI_QUALITY")
+    compression_zstd_level: int = Field(3, alias="COMPRESSION_ZSTD_LEVEL")
+    # Histórias com mais passos que isso são listadas em streaming
+    steps_stream_threshold: int = Field(100, alias="STEPS_STREAM_THRESHOLD")
+    # ==============================================
+
+    # ============ TRACING (OpenTelemetry) ============
+    tracing_enabled: bool = Field(False, alias="TRACING_ENABLED")
+    # Fração dos traces novos que são gravados (o traceparent do cliente manda)
+    trace_sample_ratio: float = Field(1.0, alias="TRACE_SAMPLE_RATIO")
+    # console | file | otlp (este precisa de opentelemetry-exporter-otlp)
+    trace_exporter: str = Field("console", alias="TRACE_EXPORTER")
+    trace_file_path: str = Field("traces.jsonl", alias="TRACE_FILE_PATH")
+    # ==============================================
+
+    # ============ PRAZOS (deadline por requisição) ============
+    # Prazo padrão das rotas; o cliente pode pedir outro via X-Request-Timeout
+    request_timeout_seconds: float = Field(15.0, alias="REQUEST_TIMEOUT_SECONDS")
+    # Prazo padrão das rotas que geram passo com o LLM
+    llm_request_timeout_seconds: float = Field(60.0, alias="LLM_REQUEST_TIMEOUT_SECONDS")
+    # Teto para o prazo pedido pelo cliente
+    request_timeout_max_seconds: float = Field(120.0, alias="REQUEST_TIMEOUT_MAX_SECONDS")
+    # Timeout de cada chamada ao Firestore (limitado pelo prazo restante)
+    firestore_timeout_seconds: float = Field(10.0, alias="FIRESTORE_TIMEOUT_SECONDS")
+    # Maior corpo de requisição aceito (lido inteiro pelo DisconnectMiddleware); acima, 413
+    max_request_body_bytes: int = Field(1024 * 1024, alias="MAX_REQUEST_BODY_BYTES")
+    # ==============================================
+
+    # ============ CIRCUIT BREAKERS (OpenRouter e Firestore) ============
+    # Janela das últimas N chamadas; só avalia com pelo menos min_calls nela
+    breaker_window_size: int = Field(20, alias="BREAKER_WINDOW_SIZE")
+    breaker_min_calls: int = Field(10, alias="BREAKER_MIN_CALLS")
+    # Abre quando a fração de falhas ou de chamadas lentas passa disso
+    breaker_failure_rate: float = Field(0.5, alias="BREAKER_FAILURE_RATE")
+    breaker_slow_call_rate: float = Field(0.8, alias="BREAKER_SLOW_CALL_RATE")
+    # Tempo aberto antes de deixar passar as chamadas de teste
+    breaker_open_seconds: float = Field(30.0, alias="BREAKER_OPEN_SECONDS")
+    breaker_half_open_probes: int = Field(3, alias="BREAKER_HALF_OPEN_PROBES")
+    # A partir de quanto tempo uma chamada conta como lenta
+    llm_slow_call_seconds: float = Field(20.0, alias="LLM_SLOW_CALL_SECONDS")
+    firestore_slow_call_seconds: float = Field(3.0, alias="FIRESTORE_SLOW_CALL_SECONDS")
+    # ==============================================
+
+    # ============ CONSUMO DO LLM ============
+    # Intervalo entre gravações dos contadores de tokens/custo no Firestore
+    llm_usage_flush_seconds: float = Field(60.0, alias="LLM_USAGE_FLUSH_SECONDS")
+    # ==============================================
+
+    # ============ GERAÇÃO ASSÍNCRONA (jobs com polling) ============
+    # Gerações simultâneas dos workers (cada uma segura uma chamada ao LLM)
+    generation_job_workers: int = Field(4, alias="GENERATION_JOB_WORKERS")
+    generation_job_max_attempts: int = Field(3, alias="GENERATION_JOB_MAX_ATTEMPTS")
+    # Jobs na fila + em execução antes de recusar novos com 503
+    generation_job_max_pending: int = Field(200, alias="GENERATION_JOB_MAX_PENDING")
+    # ==============================================
+
+    # ============ STARTUP ============
+    # Constrói os singletons (Firebase, Firestore, Stripe) no lifespan, antes
+    # do primeiro request. Com False eles nascem no primeiro uso.
+    warm_services_on_startup: bool = Field(True, alias="WARM_SERVICES_ON_STARTUP")
     # ==============================================
     
     model_config = SettingsConfigDict(
@@ -0,0 +1,81 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+_PROXY_FIELDS = ("_name", "_factory", "_instance", "_lock")
+
+
+class LazyService:
+    """
+    Proxy para um singleton de serviço. O objeto real só é construído no
+    primeiro acesso a um atributo, ou antes disso pelo warm-up do lifespan,
+    então importar o módulo não abre conexões nem inicializa o Firebase.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self._name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def _get(self) -> Any:
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+                instance = self._instance
+        return instance
+
+    def override(self, instance: Any) -> None:
+        """Troca a instância real (stand-ins locais e benchmarks)."""
+        self._instance = instance
+
+    @property
+    def is_built(self) -> bool:
+        return self._instance is not None
+
+    def __getattr__(self, item: str) -> Any:
+        return getattr(self._get(), item)
+
+    def __setattr__(self, key: str, value: Any) -> None:
+        if key in _PROXY_FIELDS:
+            object.__setattr__(self, key, value)
+        else:
+            setattr(self._get(), key, value)
+
+    def __repr__(self) -> str:
+        state = "built" if self.is_built else "lazy"
+        return f"<LazyService {self._name} ({state})>"
+
+
+class ServiceContainer:
+    """Registro dos singletons da aplicação (um cliente de cada, construído uma vez)."""
+
+    def __init__(self):
+        self._services: Dict[str, LazyService] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]) -> LazyService:
+        service = LazyService(name, factory)
+        self._services[name] = service
+        return service
+
+    def warm(self) -> Dict[str, float]:
+        """Constrói todos os serviços registrados. Retorna o tempo de cada um (s)."""
+        timings = {}
+        for name, service in self._services.items():
+            start = time.perf_counter()
+            service._get()
+            timings[name] = round(time.perf_counter() - start, 4)
+        logger.info("Serviços inicializados", extra={"fields": {"timings": timings}})
+        return timings
+
+    def stats(self) -> Dict[str, bool]:
+        return {name: service.is_built for name, service in self._services.items()}
+
+
+# Instância global
+container = ServiceContainer()
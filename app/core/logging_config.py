@@ -0,0 +1,147 @@
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.core.tracing import current_trace_id
+
+# Id da requisição atual, preenchido pelo middleware em main.py
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# X-Request-ID aceito do cliente (vai para todos os logs e para a resposta)
+_REQUEST_ID_RE = re.compile(r"[A-Za-z0-9._:-]{1,64}")
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+def request_id_from(header: Optional[str]) -> str:
+    """O X-Request-ID do cliente, se for curto e só com caracteres seguros; senão um novo."""
+    if header and _REQUEST_ID_RE.fullmatch(header):
+        return header
+    return new_request_id()
+
+
+def _parse_mapping(raw: str) -> Dict[str, str]:
+    """Converte "a=1,b=2" em {"a": "1", "b": "2"}."""
+    out = {}
+    for item in raw.split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            out[name.strip()] = value.strip()
+    return out
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro; campos extras vão em extra={"fields": {...}}."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            data["trace_id"] = trace_id
+        fields = getattr(record, "fields", None)
+        if fields:
+            data.update(fields)
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Copia o request id e o trace id do contexto para o registro antes de ir para a fila."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.trace_id = current_trace_id()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Mantém só uma fração dos registros DEBUG/INFO dos módulos configurados.
+    WARNING e acima nunca são amostrados.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # Prefixos mais longos primeiro: "app.deps.auth" vence "app.deps"
+        self.rates = sorted(rates.items(), key=lambda kv: len(kv[0]), reverse=True)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                return random.random() < rate
+        return True
+
+
+def _add_filters(handler: logging.Handler) -> logging.Handler:
+    handler.addFilter(RequestContextFilter())
+    rates = {k: float(v) for k, v in _parse_mapping(settings.log_sample_rates).items()}
+    if rates:
+        handler.addFilter(SamplingFilter(rates))
+    return handler
+
+
+def _stream_handler() -> logging.Handler:
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    return stream_handler
+
+
+def setup_logging() -> None:
+    """
+    Configura o logger "app": os módulos só enfileiram o registro e uma
+    thread (QueueListener) formata e escreve no stdout, fora do event loop.
+    Idempotente; chamado de novo depois de shutdown_logging (outro
+    lifespan), volta a usar a fila com uma thread nova.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _add_filters(logging.handlers.QueueHandler(log_queue))
+
+    app_logger = logging.getLogger("app")
+    app_logger.handlers = [queue_handler]
+    app_logger.setLevel(settings.log_level.upper())
+    app_logger.propagate = False
+
+    for name, level in _parse_mapping(settings.log_levels).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, _stream_handler())
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """
+    Esvazia a fila e para a thread de escrita. Sem a thread, o logger
+    "app" passa a escrever direto no stdout: nada fica parado numa fila
+    que ninguém lê.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        logging.getLogger("app").handlers = [_add_filters(_stream_handler())]
@@ -0,0 +1,65 @@
+from datetime import datetime
+from itertools import islice
+from typing import Any, Iterable, Iterator
+
+import orjson
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+
+def _dumps(content: Any) -> bytes:
+    return orjson.dumps(
+        content,
+        default=_default,
+        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+    )
+
+
+def _default(obj: Any) -> Any:
+    # Timestamps do Firestore são subclasses de datetime, que o orjson não aceita
+    if isinstance(obj, datetime):
+        return datetime(
+            obj.year, obj.month, obj.day,
+            obj.hour, obj.minute, obj.second, obj.microsecond,
+            tzinfo=obj.tzinfo
+        )
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Tipo não serializável: {type(obj).__name__}")
+
+
+class OrjsonResponse(ORJSONResponse):
+    """Resposta padrão da API: orjson, com datetimes UTC terminando em 'Z'."""
+
+    def render(self, content: Any) -> bytes:
+        return _dumps(content)
+
+
+def trusted_response(model: type[BaseModel], docs: list[dict]) -> OrjsonResponse:
+    """
+    Para dados que nós mesmos gravamos (Firestore): projeta os dicts nos
+    campos do modelo e serializa direto, sem revalidar item por item pelo
+    response_model. O modelo continua na rota para a documentação.
+    """
+    fields = tuple(model.model_fields)
+    return OrjsonResponse([{name: doc.get(name) for name in fields} for doc in docs])
+
+
+def trusted_stream(model: type[BaseModel], docs: Iterable[dict], batch_size: int = 32) -> StreamingResponse:
+    """
+    Igual ao trusted_response, mas emite o array JSON em blocos de
+    `batch_size` itens conforme os docs chegam, sem montar o corpo inteiro.
+    """
+    fields = tuple(model.model_fields)
+
+    def chunks() -> Iterator[bytes]:
+        it = iter(docs)
+        yield b"["
+        first = True
+        while batch := list(islice(it, batch_size)):
+            body = _dumps([{name: doc.get(name) for name in fields} for doc in batch])[1:-1]
+            yield body if first else b"," + body
+            first = False
+        yield b"]"
+
+    return StreamingResponse(chunks(), media_type="application/json")
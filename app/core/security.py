@@ -1,6 +1,145 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import time
 from fastapi import HTTPException, status
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SESSION_PREFIX = "sess"
+# Ambientes em que um segredo efêmero (por processo) é aceitável
+EPHEMERAL_SECRET_ENVS = ("dev", "local", "test")
 
 def bearer_token_from_header(authorization: str | None) -> str:
     if not authorization or not authorization.lower().startswith("bearer "):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing or invalid Authorization header")
     return authorization.split(" ", 1)[1].strip()
+
+
+# =========================================================
+# Session tokens
+# =========================================================
+class SessionTokenError(Exception):
+    """Session token malformado, com assinatura inválida ou expirado"""
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def is_session_token(token: str) -> bool:
+    return token.startswith(SESSION_PREFIX + ".")
+
+
+class SessionTokenSigner:
+    """
+    Tokens de sessão curtos, assinados com HMAC-SHA256:
+
+        sess.<kid>.<payload base64url>.<assinatura base64url>
+
+    Verificar é só um HMAC + compare_digest, sem buscar chaves em lugar
+    nenhum. O kid permite rotacionar o segredo mantendo os antigos só
+    para verificação.
+    """
+
+    def __init__(self, keys: dict[str, bytes], current_kid: str, ttl_seconds: int):
+        self.keys = keys
+        self.current_kid = current_kid
+        self.ttl_seconds = ttl_seconds
+
+    @classmethod
+    def from_settings(cls) -> "SessionTokenSigner":
+        keys: dict[str, bytes] = {}
+        current_kid = None
+        for item in (settings.session_token_secrets or "").split(","):
+            if ":" not in item:
+                continue
+            kid, secret = item.split(":", 1)
+            keys[kid.strip()] = secret.strip().encode("utf-8")
+            current_kid = current_kid or kid.strip()
+
+        if not keys:
+            # Sem segredo configurado os tokens só valem neste processo: com
+            # vários workers as sessões falhariam ao acaso, e todas caem a
+            # cada restart. Só serve para desenvolvimento.
+            if settings.app_env not in EPHEMERAL_SECRET_ENVS:
+                raise RuntimeError(
+                    f"SESSION_TOKEN_SECRETS é obrigatório com APP_ENV={settings.app_env} "
+                    "(formato \"kid:segredo\"; veja .env.example)"
+                )
+            logger.warning("SESSION_TOKEN_SECRETS não configurado; usando segredo efêmero")
+            current_kid = "ephemeral"
+            keys[current_kid] = secrets.token_bytes(32)
+
+        return cls(keys, current_kid, settings.session_token_ttl_seconds)
+
+    def _sign(self, key: bytes, signing_input: str) -> bytes:
+        return hmac.new(key, signing_input.encode("ascii"), hashlib.sha256).digest()
+
+    def issue(self, user: dict, auth_exp: int | None = None) -> tuple[str, int]:
+        """
+        Emite um token para o usuário já autenticado. A sessão nunca passa
+        de auth_exp (o exp do ID token Firebase que originou a sessão).
+        Retorna (token, segundos até expirar).
+        """
+        now = int(time.time())
+        exp = now + self.ttl_seconds
+        if auth_exp:
+            exp = min(exp, int(auth_exp))
+
+        payload = {
+            "u": user["uid"],
+            "e": user.get("email"),
+            "v": user.get("email_verified", False),
+            "iat": now,
+            "exp": exp,
+            "ax": int(auth_exp) if auth_exp else exp,
+        }
+        body = _b64encode(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+        signing_input = f"{SESSION_PREFIX}.{self.current_kid}.{body}"
+        signature = _b64encode(self._sign(self.keys[self.current_kid], signing_input))
+        return f"{signing_input}.{signature}", max(0, exp - now)
+
+    def verify(self, token: str) -> dict:
+        """Valida assinatura e expiração e devolve as claims no formato do Firebase."""
+        try:
+            prefix, kid, body, signature = token.split(".")
+        except ValueError:
+            raise SessionTokenError("Session token malformado")
+        if prefix != SESSION_PREFIX or kid not in self.keys:
+            raise SessionTokenError("Session token com chave desconhecida")
+
+        expected = self._sign(self.keys[kid], f"{prefix}.{kid}.{body}")
+        try:
+            provided = _b64decode(signature)
+        except Exception:
+            raise SessionTokenError("Session token malformado")
+        if not hmac.compare_digest(expected, provided):
+            raise SessionTokenError("Assinatura do session token inválida")
+
+        payload = json.loads(_b64decode(body))
+        if payload["exp"] <= time.time():
+            raise SessionTokenError("Session token expirado")
+
+        return {
+            "uid": payload["u"],
+            "user_id": payload["u"],
+            "email": payload.get("e"),
+            "email_verified": payload.get("v", False),
+            "iat": payload["iat"],
+            "exp": payload["exp"],
+            "auth_exp": payload.get("ax"),
+            "session": True,
+        }
+
+
+# Instância global
+session_signer = SessionTokenSigner.from_settings()
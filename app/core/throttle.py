@@ -0,0 +1,63 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from app.core.config import settings
+
+
+class TokenBucketLimiter:
+    """
+    Token bucket em memória, uma bucket por chave (IP, email, uid...).
+
+    Cada bucket começa cheia com `capacity` fichas e recarrega `rate`
+    fichas por segundo. As chaves ficam num LRU limitado a `max_keys`
+    para a memória não crescer com o número de clientes distintos.
+    """
+
+    def __init__(self, rate: float, capacity: float, max_keys: int = 100_000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.throttled = 0
+
+    @classmethod
+    def per_minute(cls, limit: int, max_keys: int = 100_000) -> "TokenBucketLimiter":
+        return cls(rate=limit / 60.0, capacity=limit, max_keys=max_keys)
+
+    def acquire(self, key: str, cost: float = 1.0) -> tuple[bool, int]:
+        """Consome `cost` fichas. Retorna (permitido, segundos até poder tentar de novo)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                self._buckets.move_to_end(key)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                self.allowed += 1
+                return True, 0
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            self.throttled += 1
+            retry_after = math.ceil((cost - tokens) / self.rate) if self.rate else 60
+            return False, max(1, retry_after)
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._buckets),
+            "allowed": self.allowed,
+            "throttled": self.throttled,
+        }
+
+
+# Instâncias globais: rajadas de register/login/refresh não podem esgotar
+# a cota do Identity Toolkit
+auth_ip_throttle = TokenBucketLimiter.per_minute(settings.auth_throttle_ip_per_minute)
+auth_email_throttle = TokenBucketLimiter.per_minute(settings.auth_throttle_email_per_minute)
@@ -0,0 +1,201 @@
+import functools
+import inspect
+import logging
+from typing import Any, Callable, Optional
+
+from opentelemetry import context as otel_context
+from opentelemetry import propagate, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Sem TracerProvider configurado (TRACING_ENABLED=false) o tracer da API
+# do OpenTelemetry é no-op: os spans abaixo custam quase nada
+tracer = trace.get_tracer("app")
+
+_provider = None
+
+
+# =========================================================
+# Setup
+# =========================================================
+def _build_exporter():
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+    exporter = settings.trace_exporter.lower()
+    if exporter == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning(
+                "TRACE_EXPORTER=otlp mas opentelemetry-exporter-otlp-proto-http "
+                "não está instalado; exportando para o console"
+            )
+            return ConsoleSpanExporter()
+        return OTLPSpanExporter()
+    if exporter == "file":
+        # Uma linha JSON por span, para análise offline
+        out = open(settings.trace_file_path, "a", encoding="utf-8")
+        return ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+    return ConsoleSpanExporter()
+
+
+def setup_tracing() -> None:
+    """
+    Configura o TracerProvider do SDK com amostragem por razão (respeitando
+    a decisão do pai vinda no traceparent). Idempotente; sem o SDK
+    instalado os spans continuam no-op.
+    """
+    global _provider
+    if _provider is not None or not settings.tracing_enabled:
+        return
+
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    except ImportError:
+        logger.warning("TRACING_ENABLED=true mas opentelemetry-sdk não está instalado")
+        return
+
+    _provider = TracerProvider(
+        resource=Resource.create({"service.name": settings.app_name}),
+        sampler=ParentBased(TraceIdRatioBased(settings.trace_sample_ratio)),
+    )
+    _provider.add_span_processor(BatchSpanProcessor(_build_exporter()))
+    trace.set_tracer_provider(_provider)
+
+
+def shutdown_tracing() -> None:
+    """Exporta os spans pendentes."""
+    global _provider
+    if _provider is not None:
+        _provider.shutdown()
+        _provider = None
+
+
+def current_trace_id() -> Optional[str]:
+    span_context = trace.get_current_span().get_span_context()
+    return format(span_context.trace_id, "032x") if span_context.is_valid else None
+
+
+# =========================================================
+# Spans
+# =========================================================
+def _record_error(span, exc: BaseException) -> None:
+    span.record_exception(exc)
+    span.set_status(Status(StatusCode.ERROR, type(exc).__name__))
+
+
+def traced(name: str, **attributes: Any) -> Callable:
+    """Decorator: envolve a função (sync, async ou geradora) em um span."""
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.isgeneratorfunction(func):
+            # O span cobre o consumo do gerador. Não vira o span atual: os
+            # itens podem ser pedidos de threads/contextos diferentes
+            # (respostas em streaming) e o contexto não sobrevive entre eles
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                span = tracer.start_span(name, attributes=attributes, record_exception=False)
+                try:
+                    yield from func(*args, **kwargs)
+                except GeneratorExit:
+                    raise  # consumidor parou antes do fim
+                except BaseException as exc:
+                    _record_error(span, exc)
+                    raise
+                finally:
+                    span.end()
+            return generator_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.start_as_current_span(name, attributes=attributes, record_exception=False) as span:
+                    try:
+                        return await func(*args, **kwargs)
+                    except BaseException as exc:
+                        _record_error(span, exc)
+                        raise
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(name, attributes=attributes, record_exception=False) as span:
+                try:
+                    return func(*args, **kwargs)
+                except BaseException as exc:
+                    _record_error(span, exc)
+                    raise
+        return wrapper
+
+    return decorator
+
+
+def traced_methods(prefix: str, **attributes: Any) -> Callable:
+    """
+    Decorator de classe: um span "<prefix>.<método>" para cada método
+    público (as operações dos serviços de Firestore, por exemplo).
+    """
+
+    def decorator(cls):
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith("_") or not inspect.isfunction(value):
+                continue
+            setattr(cls, attr, traced(f"{prefix}.{attr}", **attributes)(value))
+        return cls
+
+    return decorator
+
+
+# =========================================================
+# Middleware ASGI
+# =========================================================
+class TracingMiddleware:
+    """
+    Abre o span SERVER de cada requisição, continuando o trace do cliente
+    (cabeçalhos traceparent/tracestate, W3C) quando vier um.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        token = otel_context.attach(propagate.extract(carrier))
+        try:
+            with tracer.start_as_current_span(
+                f"{scope['method']} {scope['path']}",
+                kind=SpanKind.SERVER,
+                attributes={"http.request.method": scope["method"], "url.path": scope["path"]},
+                record_exception=False,
+            ) as span:
+                async def send_wrapper(message: Message) -> None:
+                    if message["type"] == "http.response.start":
+                        span.set_attribute("http.response.status_code", message["status"])
+                        if message["status"] >= 500:
+                            span.set_status(Status(StatusCode.ERROR))
+                    await send(message)
+
+                try:
+                    await self.app(scope, receive, send_wrapper)
+                except BaseException as exc:
+                    _record_error(span, exc)
+                    raise
+                finally:
+                    # Nome pelo template da rota ("/stories/{story_id}/choose")
+                    route = scope.get("route")
+                    if route is not None and getattr(route, "path", None):
+                        span.update_name(f"{scope['method']} {route.path}")
+                        span.set_attribute("http.route", route.path)
+        finally:
+            otel_context.detach(token)
@@ -1,8 +1,12 @@
+import logging
 from typing import Optional
 from fastapi import Security, HTTPException, status, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from app.core.security import is_session_token, session_signer, SessionTokenError
 from app.services.firebase_admin_svc import verify_id_token
-import traceback
+from app.services.token_cache import token_cache
+
+logger = logging.getLogger(__name__)
 
 bearer = HTTPBearer(auto_error=False)
 
@@ -11,52 +15,72 @@ def firebase_current_user(
     authorization: Optional[str] = Header(default=None),
 ):
     """
-    Valida o token Firebase e retorna os dados do usuário.
-    Aceita Authorization: Bearer <id_token>
+    Valida o token e retorna os dados do usuário.
+    Aceita Authorization: Bearer <id_token> ou Bearer <session_token>
     """
     token = None
     
     # Tenta pegar o token do HTTPBearer primeiro
     if credentials and credentials.scheme.lower() == "bearer":
         token = credentials.credentials
-        print(f"[AUTH] Token recebido via HTTPBearer")
     # Fallback para o header Authorization direto
     elif authorization:
         parts = authorization.split()
         if len(parts) >= 2 and parts[0].lower() == "bearer":
             token = parts[1]
-            print(f"[AUTH] Token recebido via Header direto")
 
     if not token:
-        print(f"[AUTH] ❌ Nenhum token fornecido")
+        logger.info("Nenhum token fornecido")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Forneça Authorization: Bearer <id_token>."
         )
 
-    # Log dos primeiros caracteres do token (para debug sem expor o token completo)
-    print(f"[AUTH] Token recebido (primeiros 50 chars): {token[:50]}...")
-    print(f"[AUTH] Tamanho do token: {len(token)} caracteres")
-    
+    # Session token: só um HMAC, sem RSA nem chaves remotas
+    if is_session_token(token):
+        try:
+            claims = session_signer.verify(token)
+        except SessionTokenError as e:
+            logger.info("Session token rejeitado", extra={"fields": {"error": str(e)}})
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token inválido ou expirado."
+            )
+        return _reject_revoked(claims)
+
+    # Token já verificado recentemente: evita refazer a verificação RSA
+    cached = token_cache.get(token)
+    if cached is not None:
+        return _reject_revoked(cached)
+
     try:
         # Tenta validar o token
         result = verify_id_token(token)
-        user_id = result.get('user_id', 'UNKNOWN')
-        email = result.get('email', 'UNKNOWN')
-        print(f"[AUTH] ✅ Token válido!")
-        print(f"[AUTH] User ID: {user_id}")
-        print(f"[AUTH] Email: {email}")
-        return result
-        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Token válido", extra={"fields": {
+                "uid": result.get("user_id"),
+                "token_length": len(token),
+            }})
     except Exception as e:
-        # Log detalhado do erro
-        print(f"[AUTH] ❌ ERRO ao validar token:")
-        print(f"[AUTH] Tipo de erro: {type(e).__name__}")
-        print(f"[AUTH] Mensagem: {str(e)}")
-        print(f"[AUTH] Stacktrace completo:")
-        traceback.print_exc()
-        
+        logger.warning(
+            "Erro ao validar token",
+            exc_info=logger.isEnabledFor(logging.DEBUG),
+            extra={"fields": {"error_type": type(e).__name__, "error": str(e)}}
+        )
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado."
+        )
+
+    token_cache.put(token, result)
+    return _reject_revoked(result)
+
+def _reject_revoked(claims: dict) -> dict:
+    """Token emitido antes de um logout do usuário (ver token_cache.revoke_user)."""
+    if token_cache.is_revoked(claims):
+        logger.info("Token revogado rejeitado", extra={"fields": {"uid": claims.get("uid")}})
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido ou expirado."
-        )
\ No newline at end of file
+        )
+    return claims
@@ -0,0 +1,19 @@
+from fastapi import Request
+
+from app.core.cancellation import parse_timeout_header, set_deadline
+from app.core.config import settings
+
+
+def request_deadline(default_seconds: float):
+    """
+    Dependência que define o prazo da requisição: o pedido pelo cliente no
+    cabeçalho X-Request-Timeout (segundos, limitado pelo teto configurado)
+    ou o padrão da rota. As chamadas ao LLM e ao Firestore usam o que resta
+    dele como timeout.
+    """
+
+    async def dependency(request: Request) -> None:
+        seconds = parse_timeout_header(request.headers.get("x-request-timeout")) or default_seconds
+        set_deadline(min(seconds, settings.request_timeout_max_seconds))
+
+    return dependency
@@ -0,0 +1,142 @@
+import logging
+import math
+import time
+from collections import Counter
+from typing import Dict, Protocol
+
+from fastapi import Depends, HTTPException, status
+
+from app.core.config import settings
+from app.core.throttle import TokenBucketLimiter
+from app.deps.auth import firebase_current_user
+
+logger = logging.getLogger(__name__)
+
+# Classes de rota: (fichas por minuto). O bucket tem capacidade = limite/min.
+ROUTE_CLASSES: Dict[str, int] = {
+    "llm": settings.rate_limit_llm_per_minute,    # gera passo com IA + escritas no Firestore
+    "read": settings.rate_limit_read_per_minute,  # leituras simples
+    "checkout": settings.rate_limit_checkout_per_minute,  # cria sessão de pagamento no Stripe
+    "auth": settings.rate_limit_auth_per_minute,  # sessão / verificação de token
+}
+
+
+class RateLimitBackend(Protocol):
+    async def acquire(self, key: str, per_minute: int) -> tuple[bool, int]:
+        ...
+
+
+class MemoryBackend:
+    """Buckets no próprio processo; suficiente com um único worker."""
+
+    def __init__(self):
+        self._limiters: Dict[int, TokenBucketLimiter] = {}
+
+    async def acquire(self, key: str, per_minute: int) -> tuple[bool, int]:
+        limiter = self._limiters.get(per_minute)
+        if limiter is None:
+            limiter = self._limiters[per_minute] = TokenBucketLimiter.per_minute(per_minute)
+        return limiter.acquire(key)
+
+
+# Token bucket atômico no Redis: um hash {tokens, ts} por chave
+_REDIS_TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+if allowed == 1 then
+  return {1, 0}
+end
+return {0, math.ceil((1 - tokens) / rate)}
+"""
+
+
+class RedisBackend:
+    """
+    Buckets compartilhados entre workers. Se o Redis falhar a requisição
+    passa (fail open): melhor deixar jogar do que derrubar a API.
+    """
+
+    def __init__(self, url: str):
+        from redis import asyncio as redis_asyncio
+
+        self.client = redis_asyncio.from_url(url)
+        # EVALSHA com o hash do script (reenvia o código só se o Redis não o tiver)
+        self._token_bucket = self.client.register_script(_REDIS_TOKEN_BUCKET)
+
+    async def acquire(self, key: str, per_minute: int) -> tuple[bool, int]:
+        try:
+            allowed, retry_after = await self._token_bucket(
+                keys=[f"ratelimit:{key}"],
+                args=[per_minute / 60.0, per_minute, time.time()]
+            )
+            return bool(int(allowed)), int(retry_after)
+        except Exception as e:
+            logger.warning("Rate limit indisponível no Redis", extra={"fields": {"error": str(e)}})
+            return True, 0
+
+
+_backend: RateLimitBackend | None = None
+throttled_counts: Counter = Counter()
+allowed_counts: Counter = Counter()
+
+
+def get_backend() -> RateLimitBackend:
+    global _backend
+    if _backend is None:
+        if settings.rate_limit_backend == "redis" and settings.rate_limit_redis_url:
+            _backend = RedisBackend(settings.rate_limit_redis_url)
+        else:
+            _backend = MemoryBackend()
+    return _backend
+
+
+def set_backend(backend: RateLimitBackend) -> None:
+    global _backend
+    _backend = backend
+
+
+def rate_limit(route_class: str):
+    """
+    Dependency que autentica o usuário e consome uma ficha do bucket
+    (uid, classe de rota). Use no lugar de Depends(firebase_current_user).
+    """
+    per_minute = ROUTE_CLASSES[route_class]
+
+    async def dependency(user=Depends(firebase_current_user)):
+        allowed, retry_after = await get_backend().acquire(f"{route_class}:{user['uid']}", per_minute)
+        if not allowed:
+            throttled_counts[route_class] += 1
+            logger.info("Requisição limitada", extra={"fields": {
+                "uid": user["uid"],
+                "route_class": route_class,
+                "retry_after": retry_after,
+            }})
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Muitas requisições. Aguarde um pouco e tente novamente.",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+        allowed_counts[route_class] += 1
+        return user
+
+    return dependency
+
+
+def stats() -> dict:
+    return {
+        "backend": type(get_backend()).__name__,
+        "allowed": dict(allowed_counts),
+        "throttled": dict(throttled_counts),
+    }
@@ -1,15 +1,80 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from app.core.cancellation import DeadlineExceeded, DisconnectMiddleware, deadline_exceeded_handler
+from app.core.circuit_breaker import CircuitOpenError, circuit_open_handler
 from app.core.config import settings
+from app.core.container import container
+from app.core.compression import CompressionMiddleware
+from app.core.responses import OrjsonResponse
+from app.core.tracing import TracingMiddleware, setup_tracing, shutdown_tracing
+from app.core.logging_config import setup_logging, shutdown_logging, request_id_var, request_id_from
+from app.services.google_certs import google_certs
+from app.services import firebase_identity_svc
+from app.services.stripe_events import stripe_event_queue
+from app.services.llm_usage import llm_usage
+from app.services.generation_jobs import generation_jobs
 from app.routers import health, auth, users
 from app.routers import stories
 from app.routers import pix
 from app.routers import coins
 from app.routers import webhooks  # ← ADICIONE ESTE IMPORT
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # A thread de escrita dos logs vive junto com o lifespan (create_app já
+    # configurou o logger; aqui ela volta se um lifespan anterior a parou)
+    setup_logging()
+    # Importar app.main não toca no Firebase: os singletons são construídos
+    # aqui, fora do event loop, antes de aceitar requisições
+    if settings.warm_services_on_startup:
+        await asyncio.to_thread(container.warm)
+    # Mantém os certificados do Google sempre em memória para verificar tokens
+    certs_refresher = asyncio.create_task(google_certs.run_refresher())
+    await firebase_identity_svc.start_client()
+    stripe_event_queue.start()
+    llm_usage.start()
+    generation_jobs.start()
+    yield
+    # Para os workers antes do flush do consumo (o job interrompido volta para a fila)
+    await generation_jobs.stop()
+    await llm_usage.stop()
+    await stripe_event_queue.stop()
+    await firebase_identity_svc.close_client()
+    certs_refresher.cancel()
+    with suppress(asyncio.CancelledError):
+        await certs_refresher
+    shutdown_tracing()
+    shutdown_logging()
+
 def create_app() -> FastAPI:
+    setup_logging()
+    setup_tracing()
+
     # 1. Instância única do FastAPI
-    app = FastAPI(title=settings.app_name)
+    app = FastAPI(
+        title=settings.app_name,
+        lifespan=lifespan,
+        default_response_class=OrjsonResponse
+    )
+
+    # Compressão negociada (zstd/br/gzip). Registrada antes dos outros
+    # middlewares para ficar mais perto das rotas e ver o corpo original
+    # (inteiro ou em streaming)
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_min_size)
+
+    # 2. Id de requisição propagado para todos os logs
+    @app.middleware("http")
+    async def request_id_middleware(request: Request, call_next):
+        request_id = request_id_from(request.headers.get("x-request-id"))
+        token = request_id_var.set(request_id)
+        try:
+            response = await call_next(request)
+        finally:
+            request_id_var.reset(token)
+        response.headers["X-Request-ID"] = request_id
+        return response
 
     # Configurar CORS para permitir requisições do frontend
     app.add_middleware(
@@ -24,7 +89,19 @@ def create_app() -> FastAPI:
         allow_methods=["*"],              # Permite todos os métodos (GET, POST, OPTIONS, etc)
         allow_headers=["*"],              # Permite todos os headers
     )
+
+    # Cliente desconectou no meio (ex.: fechou o app durante a geração):
+    # cancela a requisição em vez de gerar e gravar um passo que ninguém vai ler
+    app.add_middleware(DisconnectMiddleware, max_body_bytes=settings.max_request_body_bytes)
+
+    # Span de cada requisição (o mais externo, continua o traceparent do cliente)
+    app.add_middleware(TracingMiddleware)
     
+    # Circuito aberto (OpenRouter/Firestore fora): 503 com Retry-After
+    app.add_exception_handler(CircuitOpenError, circuit_open_handler)
+    # Prazo da requisição esgotado: 504
+    app.add_exception_handler(DeadlineExceeded, deadline_exceeded_handler)
+
     # 3. Rota raiz
     @app.get("/")
     def root():
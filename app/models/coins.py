@@ -13,6 +13,17 @@ class CoinTransaction(BaseModel):
     reference_id: Optional[str] = None  # story_id ou payment_id
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class CoinHold(BaseModel):
+    """Reserva de moedas (hold) aguardando confirmação ou liberação"""
+    hold_id: str
+    user_id: str
+    amount: int
+    description: str
+    reference_id: Optional[str] = None
+    status: Literal["active", "committed", "released", "expired"] = "active"
+    expires_at: datetime
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
 class CoinPackage(BaseModel):
     """Pacotes de moedas disponíveis"""
     package_id: str
@@ -32,6 +43,60 @@ class UserCoins(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class LedgerSnapshot(BaseModel):
+    """Saldo recalculado a partir de coin_transactions até um cursor"""
+    user_id: str
+    computed_balance: int = 0
+    transactions_count: int = 0
+    last_created_at: Optional[datetime] = None
+    last_transaction_id: Optional[str] = None
+    # balance_after da última transação somada (saldo que o ledger registrou)
+    last_balance_after: Optional[int] = None
+    last_run_id: Optional[str] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class LedgerDrift(BaseModel):
+    """Divergência entre user_coins.balance e o saldo recalculado"""
+    user_id: str
+    stored_balance: Optional[int] = None
+    computed_balance: int
+    difference: int
+    # "ledger": soma das transações != balance_after da última delas
+    # "user_coins": saldo atual != saldo recalculado (snapshot em dia)
+    source: str = "user_coins"
+
+class ReconciliationReport(BaseModel):
+    """Resultado de uma execução da reconciliação do ledger"""
+    run_id: str
+    transactions_processed: int = 0
+    users_touched: int = 0
+    # Chegou ao fim da coleção (sem max_pages cortando): só então o saldo
+    # atual de user_coins é comparado
+    reached_head: bool = False
+    # Usuários com movimento depois do cursor, não comparados nesta execução
+    users_pending: int = 0
+    pages: int = 0
+    cursor_created_at: Optional[datetime] = None
+    cursor_transaction_id: Optional[str] = None
+    # Total de divergências; `drifts` guarda só as primeiras (MAX_REPORTED_DRIFTS)
+    drifts_found: int = 0
+    drifts: list[LedgerDrift] = []
+
+class PaymentReconciliationReport(BaseModel):
+    """Resultado da reconciliação de checkouts do Stripe com coin_transactions"""
+    watermark_start: int = 0
+    watermark_end: int = 0
+    pages: int = 0
+    sessions_seen: int = 0
+    sessions_paid: int = 0
+    already_credited: int = 0
+    # Pagas há menos de RECENT_SESSION_GRACE_SECONDS (ficam com o webhook)
+    skipped_recent: int = 0
+    credited: list[str] = []
+    # Sessões que nunca vão ser creditadas (metadata inválido): não seguram a marca
+    skipped: dict[str, str] = {}
+    errors: dict[str, str] = {}
+
 # Schemas para requisições/respostas
 class CoinBalanceResponse(BaseModel):
     balance: int
@@ -18,6 +18,9 @@ class StepOut(BaseModel):
     choices: List[str]  # 2..4 escolhas
     created_at: datetime
 
+    # 🔥 NOVO CAMPO (opcional, não quebra nada)
+    state: Optional[Dict[str, Any]] = None
+
 # entrada para escolher um caminho
 class ChooseIn(BaseModel):
     choice_index: int = Field(ge=0, description="Índice da escolha (0-based)")
@@ -42,13 +45,13 @@ class StorySummaryOut(BaseModel):
     last_text: Optional[str] = None
 
 
-class StepOut(BaseModel):
+# job de geração assíncrona (202 + polling)
+class GenerationJobOut(BaseModel):
+    job_id: str
     story_id: str
-    step_id: str
-    index: int
-    text: str
-    choices: List[str]
+    kind: str
+    status: str  # queued | running | retry | done | failed
     created_at: datetime
-
-    # 🔥 NOVO CAMPO (opcional, não quebra nada)
-    state: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    updated_at: datetime
+    result: Optional[StepOut] = None  # preenchido com status "done"
+    error: Optional[Dict[str, Any]] = None  # {"status_code", "detail"} com status "failed"
@@ -14,6 +14,11 @@ class TokenOut(BaseModel):
     expires_in: int
     local_id: str
 
+class SessionOut(BaseModel):
+    session_token: str
+    token_type: str = "session"
+    expires_in: int
+
 class MeOut(BaseModel):
     uid: str
     email: EmailStr | None = None
@@ -1,7 +1,14 @@
-from fastapi import APIRouter, HTTPException, Depends
-from app.models.user import RegisterIn, LoginIn, TokenOut
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, status
+from app.core.config import settings
+from app.core.security import session_signer
+from app.core.throttle import auth_ip_throttle, auth_email_throttle
+from app.models.user import RegisterIn, LoginIn, TokenOut, SessionOut
+from app.services.firebase_admin_svc import revoke_refresh_tokens
+from app.services.token_cache import token_cache
 from app.services.firebase_identity_svc import signup_email_password, signin_email_password, refresh_id_token
-from app.deps.auth import firebase_current_user
+from app.deps.rate_limit import rate_limit
 from app.services.coins_service import coins_service
 from app.services import firebase_identity_svc
 
@@ -12,8 +19,38 @@ from app.services import firebase_identity_svc
 router = APIRouter(prefix="/auth/auth", tags=["Auth", "auth"])
 
 
+def _client_ip(request: Request) -> str:
+    """
+    IP para o limite por IP. As entradas à esquerda do X-Forwarded-For vêm
+    do cliente e podem ser inventadas; só valem as anotadas pelos proxies
+    confiáveis (TRUSTED_PROXY_HOPS, contadas da direita).
+    """
+    hops = settings.trusted_proxy_hops
+    forwarded = request.headers.get("x-forwarded-for")
+    if hops and forwarded:
+        chain = [ip.strip() for ip in forwarded.split(",") if ip.strip()]
+        if chain:
+            return chain[-min(hops, len(chain))]
+    return request.client.host if request.client else "unknown"
+
+
+def _throttle(request: Request, email: Optional[str] = None):
+    checks = [(auth_ip_throttle, f"ip:{_client_ip(request)}")]
+    if email:
+        checks.append((auth_email_throttle, f"email:{email.lower()}"))
+
+    for limiter, key in checks:
+        allowed, retry_after = limiter.acquire(key)
+        if not allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Muitas tentativas. Tente novamente em instantes.",
+                headers={"Retry-After": str(retry_after)}
+            )
+
+
 @router.get("/verify")
-def verify(user = Depends(firebase_current_user)):
+def verify(user = Depends(rate_limit("auth"))):
     """
     Endpoint: GET /auth/auth/verify
     """
@@ -26,17 +63,49 @@ def verify(user = Depends(firebase_current_user)):
     }
 
 
+@router.post("/session", response_model=SessionOut)
+def create_session(user = Depends(rate_limit("auth"))):
+    """
+    Troca um ID token Firebase (ou um session token ainda válido, para
+    rotação) por um session token curto verificável localmente.
+    A sessão nunca dura mais que o ID token que a originou.
+
+    Endpoint: POST /auth/auth/session
+    """
+    auth_exp = user.get("auth_exp") if user.get("session") else user.get("exp")
+    token, expires_in = session_signer.issue(user, auth_exp=auth_exp)
+    return {"session_token": token, "expires_in": expires_in}
+
+
+@router.post("/logout", status_code=204)
+async def logout(user = Depends(rate_limit("auth"))):
+    """
+    Encerra as sessões do usuário: revoga os refresh tokens no Firebase e
+    passa a recusar os ID tokens e session tokens emitidos até agora.
+
+    Endpoint: POST /auth/auth/logout
+    """
+    uid = user["uid"]
+    token_cache.revoke_user(uid)
+    try:
+        await asyncio.to_thread(revoke_refresh_tokens, uid)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Logout falhou: {str(e)}")
+    return Response(status_code=204)
+
+
 # ============================================
 # CORREÇÃO 2: Manter apenas UM endpoint /register
 # Combinei os dois em um só
 # ============================================
 @router.post("/register", response_model=TokenOut)
-async def register(body: RegisterIn):
+async def register(body: RegisterIn, request: Request):
     """
     Register a new user
     
     Endpoint: POST /auth/auth/register
     """
+    _throttle(request, body.email)
     try:
         # Registra o usuário no Firebase
         data = await signup_email_password(body.email, body.password)
@@ -58,12 +127,13 @@ async def register(body: RegisterIn):
 
 
 @router.post("/login", response_model=TokenOut)
-async def login(body: LoginIn):
+async def login(body: LoginIn, request: Request):
     """
     Login a user
     
     Endpoint: POST /auth/auth/login
     """
+    _throttle(request, body.email)
     try:
         data = await signin_email_password(body.email, body.password)
         return {
@@ -77,12 +147,13 @@ async def login(body: LoginIn):
 
 
 @router.post("/refresh", response_model=TokenOut)
-async def refresh(refresh_token: str):
+async def refresh(refresh_token: str, request: Request):
     """
     Refresh token
     
     Endpoint: POST /auth/auth/refresh
     """
+    _throttle(request)
     try:
         data = await refresh_id_token(refresh_token)
         # resposta do securetoken usa chaves diferentes:
@@ -1,6 +1,7 @@
+import logging
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List
-from app.deps.auth import firebase_current_user
+from app.deps.rate_limit import rate_limit
 from app.services.coins_service import coins_service
 from app.services.stripe_service import stripe_service
 from app.models.coins import (
@@ -11,11 +12,13 @@ from app.models.coins import (
     PurchasePackageResponse
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/coins", tags=["coins"])
 
 @router.get("/balance", response_model=CoinBalanceResponse)
 async def get_coin_balance(
-    user = Depends(firebase_current_user)
+    user = Depends(rate_limit("read"))
 ):
     """
     Retorna o saldo atual de moedas do usuário
@@ -32,7 +35,7 @@ async def get_coin_balance(
 @router.get("/transactions", response_model=List[CoinTransaction])
 async def get_transactions_history(
     limit: int = 50,
-    user = Depends(firebase_current_user)
+    user = Depends(rate_limit("read"))
 ):
     """
     Retorna o histórico de transações de moedas
@@ -51,57 +54,44 @@ async def get_coin_packages():
 @router.post("/purchase", response_model=PurchasePackageResponse, status_code=status.HTTP_201_CREATED)
 async def purchase_coin_package(
     request: PurchasePackageRequest,
-    user = Depends(firebase_current_user)
+    user = Depends(rate_limit("checkout"))
 ):
     """
     Inicia o processo de compra de um pacote de moedas via Stripe
     """
-    print(f"\n{'='*80}")
-    print(f"[PURCHASE] 🛒 Nova solicitação de compra")
-    print(f"{'='*80}")
-    
     user_id = user["uid"]
     user_email = user.get("email")
     
-    print(f"[PURCHASE] User ID: {user_id}")
-    print(f"[PURCHASE] User Email: {user_email}")
-    print(f"[PURCHASE] Package ID solicitado: {request.package_id}")
-    
     # Busca o pacote
     package = coins_service.get_package_by_id(request.package_id)
     if not package:
-        print(f"[PURCHASE] ❌ Pacote não encontrado: {request.package_id}")
+        logger.info("Pacote não encontrado", extra={"fields": {
+            "user_id": user_id,
+            "package_id": request.package_id,
+        }})
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Pacote não encontrado"
         )
     
-    print(f"[PURCHASE] ✅ Pacote encontrado:")
-    print(f"  - Nome: {package.name}")
-    print(f"  - Moedas: {package.coins}")
-    print(f"  - Preço: R$ {package.price_brl}")
-    
     # ============ INTEGRAÇÃO COM STRIPE ============
     try:
-        print(f"\n[PURCHASE] 💳 Criando sessão de checkout no Stripe...")
-        
         # Cria sessão de checkout no Stripe
-        checkout_data = stripe_service.create_checkout_session(
+        checkout_data = await stripe_service.get_or_create_checkout_session(
             package=package,
             user_id=user_id,
             user_email=user_email
         )
         
-        print(f"[PURCHASE] ✅ Checkout criado com sucesso!")
-        print(f"  - Session ID: {checkout_data['session_id']}")
-        print(f"  - Checkout URL: {checkout_data['checkout_url'][:50]}...")
-        
         # Pega saldo atual
         current_balance = (await coins_service.get_user_balance(user_id)).balance
-        print(f"[PURCHASE] Saldo atual do usuário: {current_balance}")
-        
-        print(f"[PURCHASE] ⚠️ Moedas serão adicionadas APÓS confirmação do webhook")
-        print(f"{'='*80}\n")
+
+        # Moedas serão adicionadas APÓS confirmação do webhook
+        logger.info("Checkout criado", extra={"fields": {
+            "user_id": user_id,
+            "package_id": package.package_id,
+            "session_id": checkout_data["session_id"],
+        }})
         
         return PurchasePackageResponse(
             transaction_id=checkout_data['session_id'],
@@ -111,12 +101,10 @@ async def purchase_coin_package(
         )
         
     except Exception as e:
-        print(f"\n[PURCHASE] ❌ ERRO ao criar checkout:")
-        print(f"  - Tipo: {type(e).__name__}")
-        print(f"  - Mensagem: {str(e)}")
-        import traceback
-        print(f"  - Traceback: {traceback.format_exc()}")
-        print(f"{'='*80}\n")
+        logger.exception("Erro ao criar checkout", extra={"fields": {
+            "user_id": user_id,
+            "package_id": package.package_id,
+        }})
         
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -137,31 +125,25 @@ async def admin_add_coins(
     user_id: str,
     amount: int,
     description: str = "Moedas adicionadas pelo admin",
-    user = Depends(firebase_current_user)
+    user = Depends(rate_limit("read"))
 ):
     """
     Endpoint administrativo para adicionar moedas manualmente
     """
-    print(f"\n[ADMIN] 🔧 Adicionando moedas manualmente:")
-    print(f"  - User ID: {user_id}")
-    print(f"  - Amount: {amount}")
-    print(f"  - Description: {description}")
+    logger.info("Adição manual de moedas", extra={"fields": {
+        "user_id": user_id,
+        "amount": amount,
+        "admin_uid": user["uid"],
+    }})
     
-    try:
-        updated_coins = await coins_service.add_coins(
-            user_id=user_id,
-            amount=amount,
-            transaction_type="admin_bonus",
-            description=description
-        )
-        
-        print(f"[ADMIN] ✅ Moedas adicionadas!")
-        print(f"  - Novo saldo: {updated_coins.balance}\n")
-        
-        return {
-            "message": f"{amount} moedas adicionadas com sucesso",
-            "new_balance": updated_coins.balance
-        }
-    except Exception as e:
-        print(f"[ADMIN] ❌ Erro: {e}\n")
-        raise
+    updated_coins = await coins_service.add_coins(
+        user_id=user_id,
+        amount=amount,
+        transaction_type="admin_bonus",
+        description=description
+    )
+    
+    return {
+        "message": f"{amount} moedas adicionadas com sucesso",
+        "new_balance": updated_coins.balance
+    }
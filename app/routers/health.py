@@ -1,7 +1,46 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
+from app.core.cancellation import cancellation_metrics
+from app.core.circuit_breaker import breakers
+from app.core.container import container
+from app.core.throttle import auth_ip_throttle, auth_email_throttle
+from app.deps import rate_limit
+from app.services.ai_orchestrator import generation_stats
+from app.services.generation_jobs import generation_jobs
+from app.services.google_certs import google_certs
+from app.services.llm_usage import llm_usage
+from app.services.stripe_events import stripe_event_queue
+from app.services.token_cache import token_cache
 
 router = APIRouter(prefix="/health", tags=["health"])
 
 @router.get("")
 def health():
     return {"status": "ok"}
+
+@router.get("/ready")
+def ready(response: Response):
+    """Readiness: 503 enquanto algum circuito (OpenRouter, Firestore) estiver aberto."""
+    states = {name: breaker.stats() for name, breaker in breakers.items()}
+    degraded = sorted(name for name, breaker in breakers.items() if breaker.is_rejecting())
+    if degraded:
+        response.status_code = 503
+    return {"status": "degraded" if degraded else "ready", "degraded": degraded, "breakers": states}
+
+@router.get("/metrics")
+def metrics():
+    return {
+        "token_cache": token_cache.stats(),
+        "google_certs": google_certs.stats(),
+        "rate_limit": rate_limit.stats(),
+        "stripe_events": stripe_event_queue.stats(),
+        "auth_throttle": {
+            "ip": auth_ip_throttle.stats(),
+            "email": auth_email_throttle.stats(),
+        },
+        "services": container.stats(),
+        "breakers": {name: breaker.stats() for name, breaker in breakers.items()},
+        "cancellation": cancellation_metrics.stats(),
+        "llm_usage": llm_usage.stats(),
+        "generation": generation_stats(),
+        "generation_jobs": generation_jobs.stats(),
+    }
@@ -1,10 +1,23 @@
-from fastapi import APIRouter
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Response
 from app.services.pix_service import PixService
+from app.services.coins_service import coins_service
 
 router = APIRouter(prefix="/pix", tags=["PIX"])
 
 pix_service = PixService()
 
+# Payloads são determinísticos para (valor, txid): o cliente pode cachear
+CACHE_HEADERS = {"Cache-Control": "public, max-age=300"}
+
+def _payload(package_id: Optional[str]) -> str:
+    if not package_id:
+        return pix_service.generate_static_payload()
+    package = coins_service.get_package_by_id(package_id)
+    if not package:
+        raise HTTPException(status_code=404, detail="Pacote não encontrado")
+    return pix_service.payload_for_package(package)
+
 @router.get("/")
 def get_pix_key():
     return {
@@ -12,7 +25,13 @@ def get_pix_key():
     }
 
 @router.get("/payload")
-def get_pix_payload():
+async def get_pix_payload(response: Response, package_id: Optional[str] = None):
+    response.headers.update(CACHE_HEADERS)
     return {
-        "payload": pix_service.generate_static_payload()
+        "payload": _payload(package_id)
     }
+
+@router.get("/qrcode.png")
+async def get_pix_qrcode(package_id: Optional[str] = None):
+    png = pix_service.qrcode_png(_payload(package_id))
+    return Response(content=png, media_type="image/png", headers=CACHE_HEADERS)
@@ -1,243 +1,364 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from itertools import chain, islice
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from datetime import datetime
 from typing import List
 from fastapi.responses import JSONResponse
 
-from app.deps.auth import firebase_current_user
-from app.models.story import StartStoryIn, StepOut, ChooseIn, StoryMetaOut, StorySummaryOut
-from app.services.story_service import StoryService
+from app.core.cancellation import cancellation_metrics
+from app.core.circuit_breaker import CircuitOpenError, llm_breaker
+from app.core.config import settings
+from app.core.responses import OrjsonResponse, trusted_response, trusted_stream
+from app.deps.deadline import request_deadline
+from app.deps.rate_limit import rate_limit
+from app.models.story import StartStoryIn, StepOut, ChooseIn, StoryMetaOut, StorySummaryOut, GenerationJobOut
+from app.models.coins import CoinHold
+from app.services.story_service import S
 from app.services.ai_orchestrator import generate_next_step
-from app.services.coins_service import coins_service, STORY_CREATION_COST, CHOICE_COST
+from app.services.generation_jobs import generation_jobs, job_handler, job_id_var, JobInProgressError, JobQueueFullError
+from app.services.llm_usage import llm_usage
+from app.services.coins_service import (
+    coins_service,
+    InsufficientBalanceError,
+    STORY_CREATION_COST,
+    CHOICE_COST
+)
 
-S = StoryService()
-router = APIRouter(prefix="/stories", tags=["stories"])
+router = APIRouter(
+    prefix="/stories",
+    tags=["stories"],
+    dependencies=[Depends(request_deadline(settings.request_timeout_seconds))]
+)
+
+# Intervalo sugerido (Retry-After) para o polling dos jobs de geração
+JOB_POLL_AFTER_SECONDS = 2
+
+async def _llm_available():
+    """Com o circuito do LLM aberto, recusa o turno antes de ler ou reservar qualquer coisa."""
+    llm_breaker.ensure_available()
+
+# Rotas que chamam o LLM: prazo maior e recusa imediata com o circuito aberto
+_GENERATION_DEPS = [
+    Depends(request_deadline(settings.llm_request_timeout_seconds)),
+    Depends(_llm_available),
+]
 
 def _ensure_owner(story_id: str, uid: str):
     story = S.get_story(story_id)
+    return _check_owner(story, uid)
+
+def _check_owner(story, uid: str):
     if not story:
         raise HTTPException(status_code=404, detail="História não encontrada")
     if story["owner_uid"] != uid:
         raise HTTPException(status_code=403, detail="Sem permissão")
     return story
 
-@router.post("", response_model=StepOut, status_code=201)
-async def start_story(body: StartStoryIn, user=Depends(firebase_current_user)):
-    uid = user["uid"]
-    
-    has_coins = await coins_service.has_sufficient_coins(uid, STORY_CREATION_COST)
-    if not has_coins:
-        user_coins = await coins_service.get_user_balance(uid)
-        raise HTTPException(
-            status_code=402,
-            detail=f"Moedas insuficientes. Você tem {user_coins.balance} moedas, mas precisa de {STORY_CREATION_COST}."
-        )
-    
-    story_id = S.new_story(uid, body.theme_prompt, body.character_prompt)
-    
+async def _reserve_and_generate(uid: str, cost: int, description: str, reference_id, generation, *writes):
+    """
+    Reserva as moedas e gera o próximo passo em paralelo. As escritas que
+    não dependem do passo (a escolha feita, por exemplo) chegam como
+    funções e só começam depois da reserva: um to_thread não pode ser
+    cancelado, então com saldo insuficiente nada do turno é gravado.
+    Se a reserva falhar a geração é cancelada; se a geração falhar a
+    reserva é liberada, então o jogador só paga por passos entregues.
+    """
+    hold_task = asyncio.create_task(
+        coins_service.reserve_coins(uid, cost, description, reference_id)
+    )
+    gen_task = asyncio.ensure_future(generation)
+
     try:
-        await coins_service.deduct_coins(
-            user_id=uid,
-            amount=STORY_CREATION_COST,
-            description="Criação de nova história",
-            reference_id=story_id
-        )
+        hold = await asyncio.shield(hold_task)
+    except asyncio.CancelledError:
+        # Cliente desconectou durante a reserva: a geração para aqui e a
+        # reserva, que pode já estar gravada, é devolvida assim que terminar
+        gen_task.cancel()
+        gen_task.add_done_callback(_consume_result)
+        cancellation_metrics.generations_cancelled += 1
+        _release_when_reserved(hold_task)
+        raise
     except Exception as e:
+        gen_task.cancel()
+        if isinstance(e, CircuitOpenError):
+            raise
+        if isinstance(e, InsufficientBalanceError):
+            raise HTTPException(
+                status_code=402,
+                detail=f"Moedas insuficientes. Você tem {e.balance} moedas, mas precisa de {cost}."
+            )
         raise HTTPException(status_code=500, detail=f"Erro ao processar moedas: {str(e)}")
 
-    step_payload = await generate_next_step(
-        theme=body.theme_prompt,
-        character=body.character_prompt,
-        history=[],
-        max_choices=body.initial_choices
-    )
+    turn_task = asyncio.ensure_future(asyncio.gather(gen_task, *(write() for write in writes)))
+    try:
+        payload, *_ = await turn_task
+    except BaseException as e:
+        if isinstance(e, asyncio.CancelledError):
+            # O cancelamento pode chegar de novo antes de lermos o resultado
+            turn_task.add_done_callback(_consume_result)
+            cancellation_metrics.generations_cancelled += 1
+        await asyncio.shield(coins_service.release_hold(hold))
+        raise
 
-    step_id = S.add_step(
-        story_id, 
-        step_payload["index"], 
-        step_payload["text"], 
-        step_payload["choices"],
-        step_payload.get("state")  # 🔥 PASSANDO STATE
+    return payload, hold
+
+def _consume_result(task: asyncio.Future):
+    if not task.cancelled():
+        task.exception()
+
+# Liberações em segundo plano (referência forte até terminarem)
+_pending_releases = set()
+
+def _release_when_reserved(hold_task: asyncio.Task):
+    async def release():
+        try:
+            hold = await hold_task
+        except Exception:
+            return  # a reserva não chegou a ser feita
+        await coins_service.release_hold(hold)
+
+    task = asyncio.create_task(release())
+    _pending_releases.add(task)
+    task.add_done_callback(_pending_releases.discard)
+
+async def _load_turn(story_id: str, uid: str, read):
+    """
+    Fase pré-LLM de um turno em um único round trip: a história e o
+    histórico são lidos juntos, e o dono é conferido antes de gerar.
+    """
+    story, history = await asyncio.gather(
+        asyncio.to_thread(S.get_story, story_id),
+        asyncio.to_thread(read, story_id)
     )
+    _check_owner(story, uid)
+    return story, sorted(history, key=lambda d: d["index"])
+
+async def _persist_and_commit(story_id: str, payload: dict, hold: CoinHold, **commit_kwargs) -> StepOut:
+    """
+    Grava o passo e só então debita a reserva. Protegido de cancelamento:
+    com a geração já paga, uma desconexão aqui não pode deixar passo
+    gravado sem débito (ou débito sem passo).
+    """
+    return await asyncio.shield(_persist_step(story_id, payload, hold, **commit_kwargs))
+
+async def _persist_step(story_id: str, payload: dict, hold: CoinHold, **commit_kwargs) -> StepOut:
+    try:
+        step_id = await asyncio.to_thread(
+            S.add_step,
+            story_id,
+            payload["index"],
+            payload["text"],
+            payload["choices"],
+            payload.get("state"),  # 🔥 PASSANDO STATE
+            payload.get("usage"),
+            job_id_var.get()
+        )
+    except BaseException:
+        await coins_service.release_hold(hold)
+        raise
+
+    await coins_service.commit_hold(hold, **commit_kwargs)
 
     return StepOut(
         story_id=story_id,
         step_id=step_id,
-        index=step_payload["index"],
-        text=step_payload["text"],
-        choices=step_payload["choices"],
+        index=payload["index"],
+        text=payload["text"],
+        choices=payload["choices"],
         created_at=datetime.utcnow(),
-        state=step_payload.get("state")
+        state=payload.get("state")
     )
 
-@router.post("/{story_id}/choose", response_model=StepOut)
-async def choose_and_continue(story_id: str, body: ChooseIn, user=Depends(firebase_current_user)):
+@router.post("", response_model=StepOut, status_code=201, dependencies=_GENERATION_DEPS)
+async def start_story(body: StartStoryIn, user=Depends(rate_limit("llm"))):
     uid = user["uid"]
-    story = _ensure_owner(story_id, uid)
+
+    step_payload, hold = await _reserve_and_generate(
+        uid,
+        STORY_CREATION_COST,
+        "Criação de nova história",
+        None,
+        generate_next_step(
+            theme=body.theme_prompt,
+            character=body.character_prompt,
+            history=[],
+            max_choices=body.initial_choices,
+            uid=uid
+        )
+    )
+
+    try:
+        story_id = await asyncio.to_thread(S.new_story, uid, body.theme_prompt, body.character_prompt)
+    except BaseException:
+        await coins_service.release_hold(hold)
+        raise
+
+    # Usuário e modelo já contaram a geração; agora a história existe
+    llm_usage.record_story(story_id, step_payload.get("usage"))
+    return await _persist_and_commit(story_id, step_payload, hold, reference_id=story_id)
+
+# =========================================================
+# Turnos (executados pela rota ou por um job de geração)
+# =========================================================
+@job_handler("choose")
+async def _choose_turn(story_id: str, uid: str, choice_index: int) -> StepOut:
+    story, hist = await _load_turn(story_id, uid, lambda sid: S.recent_history(sid, k=10))
+
     current_step_id = story.get("current_step_id")
     if not current_step_id:
         raise HTTPException(status_code=400, detail="História sem passo atual")
 
-    step = S.get_step(story_id, current_step_id)
+    # O passo atual normalmente é o último do histórico; só lê à parte se não for
+    if hist and hist[-1]["step_id"] == current_step_id:
+        step = hist[-1]
+    else:
+        step = await asyncio.to_thread(S.get_step, story_id, current_step_id)
     if not step:
         raise HTTPException(status_code=500, detail="Passo atual não encontrado")
-    if body.choice_index < 0 or body.choice_index >= len(step["choices"]):
+    if choice_index < 0 or choice_index >= len(step["choices"]):
         raise HTTPException(status_code=400, detail="Índice de escolha inválido")
 
-    has_coins = await coins_service.has_sufficient_coins(uid, CHOICE_COST)
-    if not has_coins:
-        user_coins = await coins_service.get_user_balance(uid)
-        raise HTTPException(
-            status_code=402,
-            detail=f"Moedas insuficientes. Você tem {user_coins.balance} moedas, mas precisa de {CHOICE_COST}."
-        )
-    
-    try:
-        await coins_service.deduct_coins(
-            user_id=uid,
-            amount=CHOICE_COST,
-            description=f"Escolha na história: {step['choices'][body.choice_index]}",
-            reference_id=story_id
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao processar moedas: {str(e)}")
-
-    S.choose(story_id, current_step_id, body.choice_index)
-
-    hist = S.recent_history(story_id, k=10)
-    hist = sorted(hist, key=lambda d: d["index"])
+    # A escolha entra no prompt pelo histórico em memória; a gravação dela
+    # roda junto com a geração, depois da reserva
+    step["chosen_choice"] = choice_index
     max_choices = min(4, 2 + len(hist) // 2)
 
-    next_payload = await generate_next_step(
-        theme=story["theme_prompt"],
-        character=story["character_prompt"],
-        history=hist,
-        max_choices=max_choices
+    next_payload, hold = await _reserve_and_generate(
+        uid,
+        CHOICE_COST,
+        f"Escolha na história: {step['choices'][choice_index]}",
+        story_id,
+        generate_next_step(
+            theme=story["theme_prompt"],
+            character=story["character_prompt"],
+            history=hist,
+            max_choices=max_choices,
+            uid=uid,
+            story_id=story_id
+        ),
+        lambda: asyncio.to_thread(S.choose, story_id, current_step_id, choice_index)
     )
 
-    next_step_id = S.add_step(
-        story_id, 
-        next_payload["index"], 
-        next_payload["text"], 
-        next_payload["choices"],
-        next_payload.get("state")  # 🔥 PASSANDO STATE
+    return await _persist_and_commit(story_id, next_payload, hold)
+
+@job_handler("send")
+async def _send_turn(story_id: str, uid: str) -> StepOut:
+    story, steps = await _load_turn(story_id, uid, S.list_steps)
+    max_choices = min(4, 2 + len(steps) // 2)
+
+    next_payload, hold = await _reserve_and_generate(
+        uid,
+        CHOICE_COST,
+        "Envio de passos da história",
+        story_id,
+        generate_next_step(
+            theme=story["theme_prompt"],
+            character=story["character_prompt"],
+            history=steps,
+            max_choices=max_choices,
+            uid=uid,
+            story_id=story_id
+        )
     )
 
-    return StepOut(
-        story_id=story_id,
-        step_id=next_step_id,
-        index=next_payload["index"],
-        text=next_payload["text"],
-        choices=next_payload["choices"],
-        created_at=datetime.utcnow(),
-        state=next_payload.get("state")
+    return await _persist_and_commit(story_id, next_payload, hold)
+
+@job_handler("continue")
+async def _continue_turn(story_id: str, uid: str) -> StepOut:
+    story, hist = await _load_turn(story_id, uid, lambda sid: S.recent_history(sid, k=10))
+    max_choices = min(4, 2 + len(hist) // 2)
+
+    next_payload, hold = await _reserve_and_generate(
+        uid,
+        CHOICE_COST,
+        "Continuação da história",
+        story_id,
+        generate_next_step(
+            theme=story["theme_prompt"],
+            character=story["character_prompt"],
+            history=hist,
+            max_choices=max_choices,
+            uid=uid,
+            story_id=story_id
+        )
     )
 
-@router.post("/{story_id}/steps/send", response_model=StepOut)
-async def send_steps(story_id: str, user=Depends(firebase_current_user)):
-    uid = user["uid"]
-    story = _ensure_owner(story_id, uid)
+    return await _persist_and_commit(story_id, next_payload, hold)
 
-    has_coins = await coins_service.has_sufficient_coins(uid, CHOICE_COST)
-    if not has_coins:
-        user_coins = await coins_service.get_user_balance(uid)
+async def _enqueue_turn(kind: str, story_id: str, uid: str, **params) -> OrjsonResponse:
+    """
+    Modo assíncrono (?async=1): confere o dono, grava o job e responde 202
+    com a URL de polling. A reserva e a geração acontecem no worker.
+    """
+    story = _check_owner(await asyncio.to_thread(S.get_story, story_id), uid)
+    try:
+        job = await generation_jobs.enqueue(kind, story_id, uid, story.get("current_step_id"), **params)
+    except JobInProgressError as e:
         raise HTTPException(
-            status_code=402,
-            detail=f"Moedas insuficientes. Você tem {user_coins.balance} moedas, mas precisa de {CHOICE_COST}."
+            status_code=409,
+            detail=f"Já existe uma geração em andamento para esta história (job {e.job_id})"
         )
-    
-    try:
-        await coins_service.deduct_coins(
-            user_id=uid,
-            amount=CHOICE_COST,
-            description="Envio de passos da história",
-            reference_id=story_id
+    except JobQueueFullError:
+        raise HTTPException(
+            status_code=503,
+            detail="Fila de geração cheia. Tente novamente em instantes.",
+            headers={"Retry-After": str(JOB_POLL_AFTER_SECONDS * 5)}
         )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao processar moedas: {str(e)}")
-
-    steps = S.list_steps(story_id)
-    steps = sorted(steps, key=lambda d: d["index"])
-    max_choices = min(4, 2 + len(steps) // 2)
 
-    next_payload = await generate_next_step(
-        theme=story["theme_prompt"],
-        character=story["character_prompt"],
-        history=steps,
-        max_choices=max_choices
+    return OrjsonResponse(
+        status_code=202,
+        content=_job_out(job),
+        headers={
+            "Location": f"{router.prefix}/{story_id}/jobs/{job['job_id']}",
+            "Retry-After": str(JOB_POLL_AFTER_SECONDS),
+        }
     )
 
-    step_id = S.add_step(
-        story_id, 
-        next_payload["index"], 
-        next_payload["text"], 
-        next_payload["choices"],
-        next_payload.get("state")  # 🔥 PASSANDO STATE
-    )
+def _job_out(job: dict) -> dict:
+    return {name: job.get(name) for name in GenerationJobOut.model_fields}
 
-    return StepOut(
-        story_id=story_id,
-        step_id=step_id,
-        index=next_payload["index"],
-        text=next_payload["text"],
-        choices=next_payload["choices"],
-        created_at=datetime.utcnow(),
-        state=next_payload.get("state")
-    )
+# Respostas extras das rotas de turno que aceitam ?async=1
+_ASYNC_RESPONSES = {202: {"model": GenerationJobOut, "description": "Job de geração criado (?async=1)"}}
 
-@router.post("/{story_id}/continue", response_model=StepOut)
-async def continue_story(story_id: str, user=Depends(firebase_current_user)):
+@router.post("/{story_id}/choose", response_model=StepOut, dependencies=_GENERATION_DEPS, responses=_ASYNC_RESPONSES)
+async def choose_and_continue(
+    story_id: str,
+    body: ChooseIn,
+    run_async: bool = Query(False, alias="async"),
+    user=Depends(rate_limit("llm"))
+):
     uid = user["uid"]
-    story = _ensure_owner(story_id, uid)
-
-    has_coins = await coins_service.has_sufficient_coins(uid, CHOICE_COST)
-    if not has_coins:
-        user_coins = await coins_service.get_user_balance(uid)
-        raise HTTPException(
-            status_code=402,
-            detail=f"Moedas insuficientes. Você tem {user_coins.balance} moedas, mas precisa de {CHOICE_COST}."
-        )
-    
-    try:
-        await coins_service.deduct_coins(
-            user_id=uid,
-            amount=CHOICE_COST,
-            description="Continuação da história",
-            reference_id=story_id
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao processar moedas: {str(e)}")
-
-    hist = S.recent_history(story_id, k=10)
-    hist = sorted(hist, key=lambda d: d["index"])
-    max_choices = min(4, 2 + len(hist) // 2)
+    if run_async:
+        return await _enqueue_turn("choose", story_id, uid, choice_index=body.choice_index)
+    return await _choose_turn(story_id, uid, body.choice_index)
 
-    next_payload = await generate_next_step(
-        theme=story["theme_prompt"],
-        character=story["character_prompt"],
-        history=hist,
-        max_choices=max_choices
-    )
+@router.post("/{story_id}/steps/send", response_model=StepOut, dependencies=_GENERATION_DEPS, responses=_ASYNC_RESPONSES)
+async def send_steps(story_id: str, run_async: bool = Query(False, alias="async"), user=Depends(rate_limit("llm"))):
+    uid = user["uid"]
+    if run_async:
+        return await _enqueue_turn("send", story_id, uid)
+    return await _send_turn(story_id, uid)
 
-    next_step_id = S.add_step(
-        story_id,
-        next_payload["index"],
-        next_payload["text"],
-        next_payload["choices"],
-        next_payload.get("state")  # 🔥 PASSANDO STATE
-    )
+@router.post("/{story_id}/continue", response_model=StepOut, dependencies=_GENERATION_DEPS, responses=_ASYNC_RESPONSES)
+async def continue_story(story_id: str, run_async: bool = Query(False, alias="async"), user=Depends(rate_limit("llm"))):
+    uid = user["uid"]
+    if run_async:
+        return await _enqueue_turn("continue", story_id, uid)
+    return await _continue_turn(story_id, uid)
 
-    return StepOut(
-        story_id=story_id,
-        step_id=next_step_id,
-        index=next_payload["index"],
-        text=next_payload["text"],
-        choices=next_payload["choices"],
-        created_at=datetime.utcnow(),
-        state=next_payload.get("state")
-    )
+@router.get("/{story_id}/jobs/{job_id}", response_model=GenerationJobOut)
+async def get_generation_job(story_id: str, job_id: str, response: Response, user=Depends(rate_limit("read"))):
+    job = await generation_jobs.get(job_id)
+    if not job or job["story_id"] != story_id:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    if job["uid"] != user["uid"]:
+        raise HTTPException(status_code=403, detail="Sem permissão")
+    if job["status"] not in ("done", "failed"):
+        response.headers["Retry-After"] = str(JOB_POLL_AFTER_SECONDS)
+    return _job_out(job)
 
 @router.get("/{story_id}", response_model=StoryMetaOut)
-def get_story_meta(story_id: str, user=Depends(firebase_current_user)):
+def get_story_meta(story_id: str, user=Depends(rate_limit("read"))):
     uid = user["uid"]
     story = _ensure_owner(story_id, uid)
     return {
@@ -252,21 +373,26 @@ def get_story_meta(story_id: str, user=Depends(firebase_current_user)):
     }
 
 @router.get("/{story_id}/steps", response_model=List[StepOut])
-def list_steps(story_id: str, user=Depends(firebase_current_user)):
+def list_steps(story_id: str, user=Depends(rate_limit("read"))):
     uid = user["uid"]
     _ensure_owner(story_id, uid)
-    return S.list_steps(story_id)
+
+    # Histórias longas saem em streaming (e comprimidas bloco a bloco)
+    steps = S.iter_steps(story_id)
+    head = list(islice(steps, settings.steps_stream_threshold))
+    if len(head) < settings.steps_stream_threshold:
+        return trusted_response(StepOut, head)
+    return trusted_stream(StepOut, chain(head, steps))
 
 @router.get("", response_model=List[StorySummaryOut])
-def list_my_stories(user=Depends(firebase_current_user)):
+def list_my_stories(user=Depends(rate_limit("read"))):
     uid = user["uid"]
     docs = S.list_user_stories(uid, limit=50)
+    current_steps = S.get_current_steps(docs)
     out = []
     for d in docs:
-        last_text = None
-        if d.get("current_step_id"):
-            step = S.get_step(d["story_id"], d["current_step_id"])
-            last_text = step["text"] if step else None
+        step = current_steps.get(d["story_id"])
+        last_text = step["text"] if step else None
         out.append({
             "story_id": d["story_id"],
             "created_at": d["created_at"],
@@ -274,4 +400,4 @@ def list_my_stories(user=Depends(firebase_current_user)):
             "status": d["status"],
             "last_text": last_text
         })
-    return out
\ No newline at end of file
+    return trusted_response(StorySummaryOut, out)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends
-from app.deps.auth import firebase_current_user
+from app.deps.rate_limit import rate_limit
 from app.models.user import MeOut
 
 # ============ ADICIONE ESTE IMPORT ============
@@ -9,7 +9,7 @@ from app.services.coins_service import coins_service
 router = APIRouter(prefix="/users", tags=["users"])
 
 @router.get("/me", response_model=MeOut)
-async def me(user = Depends(firebase_current_user)):  # ← MUDOU PARA async
+async def me(user = Depends(rate_limit("read"))):  # ← MUDOU PARA async
     # ============ ADICIONE ESTAS LINHAS ============
     uid = user["uid"]
     user_coins = await coins_service.get_user_balance(uid)
@@ -0,0 +1,104 @@
+"""
+Benchmark de compressão da listagem de passos: bytes no fio e CPU por
+codificação e nível, com o corpo inteiro e em streaming (blocos de 32
+passos, como o trusted_stream envia histórias longas).
+
+Uso: python -m app.scripts.bench_compression
+"""
+import os, random, statistics, time, uuid
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.core import compression
+from app.core.responses import trusted_response
+from app.models.story import StepOut
+
+STEPS = int(os.environ.get("BENCH_STEPS", "100"))
+ROUNDS = int(os.environ.get("BENCH_ROUNDS", "20"))
+
+WORDS = (
+    "você avança pelo corredor úmido da masmorra enquanto a tocha tremula "
+    "um goblin surge das sombras com uma adaga enferrujada e grita ao ver "
+    "o brilho do seu escudo as paredes cobertas de runas antigas parecem "
+    "sussurrar segredos esquecidos sobre o rei caído e o dragão adormecido "
+    "no fundo da caverna há um baú trancado guardado por esqueletos"
+).split()
+
+LEVELS = {
+    "gzip": (1, 6, 9),
+    "br": (1, 4, 6, 11),
+    "zstd": (1, 3, 9, 19),
+}
+
+
+def make_body(n: int) -> bytes:
+    rng = random.Random(42)
+    story_id = str(uuid.uuid4())
+    base = datetime.now(timezone.utc)
+    steps = [
+        {
+            "step_id": str(uuid.uuid4()),
+            "story_id": story_id,
+            "index": i,
+            "text": " ".join(rng.choice(WORDS) for _ in range(140)).capitalize() + ".",
+            "choices": [" ".join(rng.choice(WORDS) for _ in range(5)) for _ in range(rng.randint(2, 4))],
+            "state": {"player_hp": rng.randint(0, 10), "gold": rng.randint(0, 500)},
+            "created_at": base + timedelta(seconds=i),
+        }
+        for i in range(n)
+    ]
+    return trusted_response(StepOut, steps).body
+
+
+def compressor_for(encoding: str, level: int):
+    if encoding == "gzip":
+        return compression._GzipCompressor(level)
+    if encoding == "br":
+        return compression._BrotliCompressor(level)
+    return compression._ZstdCompressor(level)
+
+
+def oneshot(encoding: str, level: int, body: bytes) -> bytes:
+    c = compressor_for(encoding, level)
+    return c.compress(body, flush=False) + c.finish()
+
+
+def streamed(encoding: str, level: int, chunks: list[bytes]) -> bytes:
+    c = compressor_for(encoding, level)
+    return b"".join(c.compress(chunk) for chunk in chunks) + c.finish()
+
+
+def bench(func, *args) -> tuple[float, int]:
+    timings, size = [], 0
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        size = len(func(*args))
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, size
+
+
+def main():
+    body = make_body(STEPS)
+    chunk_size = max(1, len(body) * 32 // STEPS)
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    available = compression.available_encodings()
+
+    print(f"{STEPS} passos: {len(body) / 1024:.1f} KB sem compressão, mediana de {ROUNDS} rodadas")
+    print(f"{'codificação':<12}{'nível':>6}{'KB':>9}{'razão':>8}{'ms':>9}{'MB/s':>9}{'KB stream':>11}{'ms stream':>11}")
+    for encoding, levels in LEVELS.items():
+        if encoding not in available:
+            print(f"{encoding:<12} (biblioteca não instalada)")
+            continue
+        for level in levels:
+            ms, size = bench(oneshot, encoding, level, body)
+            stream_ms, stream_size = bench(streamed, encoding, level, chunks)
+            mbps = len(body) / 1024 / 1024 / (ms / 1000)
+            print(
+                f"{encoding:<12}{level:>6}{size / 1024:>9.1f}{len(body) / size:>8.1f}"
+                f"{ms:>9.2f}{mbps:>9.0f}{stream_size / 1024:>11.1f}{stream_ms:>11.2f}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Dispara logins concorrentes contra a API e mede requisições por segundo.
+Use junto com identity_standin.py para não depender do Google.
+
+A API medida precisa confiar no X-Forwarded-For que o script manda (um IP
+por worker); com o padrão TRUSTED_PROXY_HOPS=0 todos os workers caem no
+mesmo IP e o que se mede são os 429 do throttle de 60/min:
+
+    TRUSTED_PROXY_HOPS=1 IDENTITY_TOOLKIT_URL=http://localhost:9098/v1 \
+        SECURETOKEN_URL=http://localhost:9098/v1 uvicorn app.main:app --port 8000
+    BENCH_API_URL=http://localhost:8000 BENCH_REQUESTS=2000 BENCH_CONCURRENCY=50 \
+        python -m app.scripts.bench_login
+
+Com BENCH_SPREAD_IPS=0 (um IP só), suba a API com
+AUTH_THROTTLE_IP_PER_MINUTE acima de BENCH_REQUESTS.
+"""
+import asyncio, os, time
+from collections import Counter
+import httpx
+
+API_URL = os.environ.get("BENCH_API_URL", "http://localhost:8000")
+REQUESTS = int(os.environ.get("BENCH_REQUESTS", "1000"))
+CONCURRENCY = int(os.environ.get("BENCH_CONCURRENCY", "50"))
+# Cada worker usa um IP "falso" para medir o caminho de login e não o throttle
+SPREAD_IPS = os.environ.get("BENCH_SPREAD_IPS", "1") == "1"
+
+async def worker(client: httpx.AsyncClient, worker_id: int, queue: asyncio.Queue, statuses: Counter):
+    headers = {"X-Forwarded-For": f"10.0.{worker_id // 250}.{worker_id % 250}"} if SPREAD_IPS else {}
+    while True:
+        try:
+            i = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        r = await client.post(
+            f"{API_URL}/auth/auth/login",
+            json={"email": f"bench{i}@example.com", "password": "secret123"},
+            headers=headers,
+        )
+        statuses[r.status_code] += 1
+
+async def main():
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(REQUESTS):
+        queue.put_nowait(i)
+    statuses: Counter = Counter()
+
+    limits = httpx.Limits(max_connections=CONCURRENCY)
+    async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client, w, queue, statuses) for w in range(CONCURRENCY)))
+        elapsed = time.perf_counter() - start
+
+    print(f"{REQUESTS} logins em {elapsed:.2f}s -> {REQUESTS / elapsed:.1f} req/s")
+    print(f"Status: {dict(statuses)}")
+    if statuses[429]:
+        print(
+            "Aviso: houve 429 do throttle por IP. Suba a API com TRUSTED_PROXY_HOPS=1 "
+            "(ou AUTH_THROTTLE_IP_PER_MINUTE maior) para medir o login, não o throttle."
+        )
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""
+Benchmark de serialização da listagem de passos (GET /stories/{id}/steps)
+para uma história de 200 passos.
+
+Compara o caminho antigo (revalidação pelo response_model List[StepOut] +
+json da biblioteca padrão, como o JSONResponse do Starlette faz) com o
+atual (projeção dos campos + orjson).
+
+Uso: python -m app.scripts.bench_serialization
+"""
+import json, os, statistics, time, uuid
+from datetime import datetime, timedelta, timezone
+from typing import List
+from dotenv import load_dotenv
+from pydantic import TypeAdapter
+
+load_dotenv()
+
+from app.core.responses import trusted_response
+from app.models.story import StepOut
+
+STEPS = int(os.environ.get("BENCH_STEPS", "200"))
+ROUNDS = int(os.environ.get("BENCH_ROUNDS", "200"))
+
+
+def make_steps(n: int) -> list[dict]:
+    """Passos no formato gravado pelo StoryService.add_step."""
+    story_id = str(uuid.uuid4())
+    base = datetime.now(timezone.utc)
+    return [
+        {
+            "step_id": str(uuid.uuid4()),
+            "story_id": story_id,
+            "index": i,
+            "text": "Você avança pelo corredor úmido da masmorra. " * 14,
+            "choices": ["Abrir a porta", "Voltar", "Acender a tocha", "Esperar"],
+            "state": {"player_hp": 10 - i % 10, "inventory": ["tocha", "corda"], "location": "masmorra"},
+            "created_at": base + timedelta(seconds=i),
+            "chosen_choice": i % 4,
+            "chosen_at": base + timedelta(seconds=i, milliseconds=500),
+        }
+        for i in range(n)
+    ]
+
+
+def old_path(adapter: TypeAdapter, docs: list[dict]) -> bytes:
+    validated = adapter.validate_python(docs)
+    content = adapter.dump_python(validated, mode="json")
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def new_path(docs: list[dict]) -> bytes:
+    return trusted_response(StepOut, docs).body
+
+
+def bench(func, *args) -> float:
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    docs = make_steps(STEPS)
+    adapter = TypeAdapter(List[StepOut])
+
+    # Mesmo conteúdo nos dois caminhos
+    assert json.loads(old_path(adapter, docs)) == json.loads(new_path(docs))
+
+    old_ms = bench(old_path, adapter, docs)
+    new_ms = bench(new_path, docs)
+    size_kb = len(new_path(docs)) / 1024
+    print(f"{STEPS} passos ({size_kb:.0f} KB), mediana de {ROUNDS} rodadas")
+    print(f"response_model + json: {old_ms:.2f}ms")
+    print(f"projeção + orjson:     {new_ms:.2f}ms ({old_ms / new_ms:.1f}x mais rápido)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark da fase pré-LLM de /stories/{id}/choose contra um stand-in em
+memória do Firestore com latência por chamada (BENCH_RTT_MS, padrão 20ms).
+
+Compara a sequência antiga (história → passo atual → escolha → histórico,
+uma chamada após a outra) com a rota atual, medindo o tempo até a IA ser
+chamada.
+
+Uso: python -m app.scripts.bench_story_turn
+"""
+import asyncio, os, statistics, time, uuid
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+# O benchmark faz muitos turnos seguidos com o mesmo usuário
+os.environ.setdefault("RATE_LIMIT_LLM_PER_MINUTE", "100000")
+
+import httpx
+from benchmarks.fakes import FakeFirestore
+from app.deps.auth import firebase_current_user
+from app.main import app
+from app.models.coins import CoinHold, UserCoins
+from app.services.coins_service import coins_service
+from app.services.llm_usage import LlmUsageRecorder, llm_usage
+from app.services.story_service import S
+import app.routers.stories as stories_router
+
+RTT = int(os.environ.get("BENCH_RTT_MS", "20")) / 1000
+TURNS = int(os.environ.get("BENCH_TURNS", "20"))
+
+
+class StandinStoryService:
+    """Mesma interface do StoryService; cada chamada ao "Firestore" custa um RTT."""
+
+    def __init__(self):
+        self.stories, self.steps = {}, {}
+
+    def _rtt(self, calls=1):
+        time.sleep(RTT * calls)
+
+    def new_story(self, uid, theme, character):
+        self._rtt()
+        story_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        self.stories[story_id] = {
+            "story_id": story_id, "owner_uid": uid, "theme_prompt": theme,
+            "character_prompt": character, "created_at": now, "updated_at": now,
+            "status": "active", "current_step_id": None,
+        }
+        return story_id
+
+    def add_step(self, story_id, index, text, choices, state=None, usage=None, job_id=None):
+        self._rtt(2)
+        step_id = str(uuid.uuid4())
+        self.steps.setdefault(story_id, {})[step_id] = {
+            "step_id": step_id, "story_id": story_id, "index": index, "text": text,
+            "choices": choices, "state": state or {}, "created_at": datetime.utcnow(),
+        }
+        self.stories[story_id]["current_step_id"] = step_id
+        return step_id
+
+    def get_story(self, story_id):
+        self._rtt()
+        return dict(self.stories[story_id]) if story_id in self.stories else None
+
+    def get_step(self, story_id, step_id):
+        self._rtt()
+        step = self.steps.get(story_id, {}).get(step_id)
+        return dict(step) if step else None
+
+    def choose(self, story_id, step_id, choice_index):
+        self._rtt(2)
+        self.steps[story_id][step_id]["chosen_choice"] = choice_index
+
+    def recent_history(self, story_id, k=10):
+        self._rtt()
+        steps = sorted(self.steps.get(story_id, {}).values(), key=lambda d: d["index"])
+        return [dict(s) for s in steps[-k:]]
+
+    def list_steps(self, story_id):
+        return self.recent_history(story_id, k=10_000)
+
+
+class StandinCoinsService:
+    """Reserva em dois RTTs (saldo + reservas, depois a gravação da reserva)."""
+
+    async def reserve_coins(self, user_id, amount, description, reference_id=None):
+        await asyncio.sleep(RTT * 2)
+        return CoinHold(
+            hold_id=str(uuid.uuid4()), user_id=user_id, amount=amount,
+            description=description, reference_id=reference_id,
+            expires_at=datetime.now(timezone.utc) + timedelta(minutes=2),
+        )
+
+    async def commit_hold(self, hold, reference_id=None):
+        await asyncio.sleep(RTT)
+        return UserCoins(user_id=hold.user_id, balance=0)
+
+    async def release_hold(self, hold):
+        await asyncio.sleep(RTT)
+
+
+llm_called_at = []
+
+async def fake_generate(theme, character, history, max_choices=3, **kwargs):
+    llm_called_at.append(time.perf_counter())
+    index = history[-1]["index"] + 1 if history else 0
+    return {"index": index, "text": f"passo {index}", "choices": ["a", "b"], "state": {}}
+
+
+def sequential_pre_llm(story_id, choice_index):
+    """A ordem antiga da rota: quatro etapas, uma depois da outra."""
+    story = S.get_story(story_id)
+    S.get_step(story_id, story["current_step_id"])
+    S.choose(story_id, story["current_step_id"], choice_index)
+    S.recent_history(story_id, k=10)
+
+
+async def main():
+    S.override(StandinStoryService())
+    coins_service.override(StandinCoinsService())
+    # As rotas registram o consumo do LLM; aqui ele fica só em memória
+    llm_usage.override(LlmUsageRecorder(flush_interval=3600, db=FakeFirestore()))
+    stories_router.generate_next_step = fake_generate
+    app.dependency_overrides[firebase_current_user] = lambda: {"uid": "bench_user", "email": "bench@example.com"}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        r = await client.post("/stories", json={"theme_prompt": "masmorra", "character_prompt": "ladino"})
+        story_id = r.json()["story_id"]
+
+        sequential, parallel = [], []
+        for _ in range(TURNS):
+            start = time.perf_counter()
+            sequential_pre_llm(story_id, 0)
+            sequential.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            r = await client.post(f"/stories/{story_id}/choose", json={"choice_index": 0})
+            r.raise_for_status()
+            parallel.append(llm_called_at[-1] - start)
+
+    seq_ms = statistics.median(sequential) * 1000
+    par_ms = statistics.median(parallel) * 1000
+    print(f"RTT do stand-in: {RTT * 1000:.0f}ms | turnos: {TURNS}")
+    print(f"Pré-LLM sequencial: {seq_ms:.1f}ms ({seq_ms / (RTT * 1000):.1f} RTT)")
+    print(f"Pré-LLM atual:      {par_ms:.1f}ms ({par_ms / (RTT * 1000):.1f} RTT)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
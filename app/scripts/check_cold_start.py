@@ -0,0 +1,50 @@
+"""
+Mede o cold start de `import app.main` em um processo novo e falha
+(exit 1) se passar do orçamento ou se o import tiver inicializado o
+Firebase, o Firestore ou o SDK do Stripe.
+
+Uso: python -m app.scripts.check_cold_start [orçamento_em_segundos]
+Orçamento padrão: COLD_START_BUDGET_SECONDS ou 2.0
+"""
+import json, os, subprocess, sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+from app.core.container import container
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "heavy_modules": [m for m in ("firebase_admin", "google.cloud.firestore_v1", "stripe") if m in sys.modules],
+    "built_services": [name for name, built in container.stats().items() if built],
+}))
+"""
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else float(os.environ.get("COLD_START_BUDGET_SECONDS", "2.0"))
+    proc = subprocess.run([sys.executable, "-c", PROBE], capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(proc.stderr)
+        sys.exit(1)
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    print(f"import app.main: {result['seconds']:.3f}s (orçamento {budget:.3f}s)")
+    failures = []
+    if result["seconds"] > budget:
+        failures.append("cold start acima do orçamento")
+    if result["heavy_modules"]:
+        failures.append(f"módulos pesados importados no import: {result['heavy_modules']}")
+    if result["built_services"]:
+        failures.append(f"serviços construídos no import: {result['built_services']}")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✅ OK")
+
+if __name__ == "__main__":
+    main()
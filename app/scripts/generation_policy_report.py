@@ -0,0 +1,59 @@
+"""
+Distribuição dos completion_tokens por tipo de turno, a partir do consumo
+gravado nos passos (usage.turn_type, usage.completion_tokens), e o
+max_tokens sugerido para cada tipo (p99 com folga).
+
+Compare com GENERATION_POLICY em app/services/ai_orchestrator.py.
+
+Uso: python -m app.scripts.generation_policy_report
+     REPORT_MAX_STEPS=20000 python -m app.scripts.generation_policy_report
+"""
+import math, os
+from collections import defaultdict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.services.ai_orchestrator import GENERATION_POLICY
+from app.services.firebase_admin_svc import firestore_client
+
+MAX_STEPS = int(os.environ.get("REPORT_MAX_STEPS", "5000"))
+# Folga sobre o p99, arredondada para cima em blocos de 50 tokens
+HEADROOM = 1.3
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    tokens = defaultdict(list)
+    truncated_budget = defaultdict(int)
+    for doc in firestore_client().collection_group("steps").limit(MAX_STEPS).stream():
+        usage = (doc.to_dict() or {}).get("usage") or {}
+        if "turn_type" not in usage:
+            continue  # passos gravados antes da política
+        tokens[usage["turn_type"]].append(usage["completion_tokens"])
+        if usage.get("max_tokens", 0) > GENERATION_POLICY.get(usage["turn_type"], {}).get("max_tokens", 0):
+            truncated_budget[usage["turn_type"]] += 1
+
+    if not tokens:
+        print("Nenhum passo com usage.turn_type ainda.")
+        return
+
+    print(f"{'tipo':<10}{'passos':>8}{'p50':>7}{'p95':>7}{'p99':>7}{'máx':>7}{'refeitos':>10}{'atual':>8}{'sugerido':>10}")
+    for turn_type in GENERATION_POLICY:
+        values = sorted(tokens.get(turn_type, []))
+        if not values:
+            continue
+        p99 = percentile(values, 0.99)
+        suggested = int(math.ceil(p99 * HEADROOM / 50) * 50)
+        print(
+            f"{turn_type:<10}{len(values):>8}{percentile(values, 0.5):>7}{percentile(values, 0.95):>7}"
+            f"{p99:>7}{values[-1]:>7}{truncated_budget[turn_type]:>10}"
+            f"{GENERATION_POLICY[turn_type]['max_tokens']:>8}{suggested:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Servidor local que imita o endpoint de certificados do Google e emite ID
+tokens assinados pela mesma chave, para testar a verificação sem rede.
+
+    uvicorn app.scripts.google_certs_standin:app --port 9099
+    GOOGLE_CERTS_URL=http://localhost:9099/certs
+    curl "http://localhost:9099/token?uid=user123&email=a@b.com"
+"""
+import datetime
+import os
+import time
+import uuid
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from fastapi import FastAPI, Response
+from google.auth import crypt, jwt
+
+PROJECT_ID = os.environ.get("FIREBASE_PROJECT_ID", "rpg-ia-project")
+MAX_AGE = int(os.environ.get("CERTS_MAX_AGE", "3600"))
+KID = uuid.uuid4().hex
+
+_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+_name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken.standin")])
+_now = datetime.datetime.now(datetime.timezone.utc)
+_cert = (
+    x509.CertificateBuilder()
+    .subject_name(_name)
+    .issuer_name(_name)
+    .public_key(_key.public_key())
+    .serial_number(x509.random_serial_number())
+    .not_valid_before(_now - datetime.timedelta(days=1))
+    .not_valid_after(_now + datetime.timedelta(days=30))
+    .sign(_key, hashes.SHA256())
+)
+CERT_PEM = _cert.public_bytes(serialization.Encoding.PEM).decode()
+KEY_PEM = _key.private_bytes(
+    serialization.Encoding.PEM,
+    serialization.PrivateFormat.PKCS8,
+    serialization.NoEncryption()
+).decode()
+_signer = crypt.RSASigner.from_string(KEY_PEM, key_id=KID)
+
+app = FastAPI(title="google-certs-standin")
+
+
+@app.get("/certs")
+def certs(response: Response):
+    response.headers["Cache-Control"] = f"public, max-age={MAX_AGE}, must-revalidate"
+    return {KID: CERT_PEM}
+
+
+@app.get("/token")
+def token(uid: str = "standin-user", email: str = "standin@example.com", ttl: int = 3600):
+    now = int(time.time())
+    payload = {
+        "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+        "aud": PROJECT_ID,
+        "auth_time": now,
+        "user_id": uid,
+        "sub": uid,
+        "iat": now,
+        "exp": now + ttl,
+        "email": email,
+        "email_verified": True,
+    }
+    return {"id_token": jwt.encode(_signer, payload).decode()}
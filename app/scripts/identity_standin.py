@@ -0,0 +1,67 @@
+"""
+Servidor local que imita o Identity Toolkit / SecureToken (signUp,
+signInWithPassword e refresh) com usuários em memória, para medir o
+throughput de login sem gastar cota do Google.
+
+    uvicorn app.scripts.identity_standin:app --port 9098
+    IDENTITY_TOOLKIT_URL=http://localhost:9098/v1
+    SECURETOKEN_URL=http://localhost:9098/v1
+"""
+import uuid
+from urllib.parse import parse_qs
+
+from fastapi import FastAPI, HTTPException, Request
+
+app = FastAPI(title="identity-toolkit-standin")
+
+_users: dict[str, dict] = {}
+_refresh_tokens: dict[str, str] = {}
+
+
+def _tokens(local_id: str) -> dict:
+    refresh_token = uuid.uuid4().hex
+    _refresh_tokens[refresh_token] = local_id
+    return {
+        "idToken": f"standin-{uuid.uuid4().hex}",
+        "refreshToken": refresh_token,
+        "expiresIn": "3600",
+        "localId": local_id,
+    }
+
+
+@app.post("/v1/accounts:signUp")
+async def sign_up(request: Request):
+    body = await request.json()
+    email = body["email"].lower()
+    if email in _users:
+        raise HTTPException(status_code=400, detail={"error": {"message": "EMAIL_EXISTS"}})
+    _users[email] = {"password": body["password"], "local_id": uuid.uuid4().hex[:28]}
+    return {"email": email, **_tokens(_users[email]["local_id"])}
+
+
+@app.post("/v1/accounts:signInWithPassword")
+async def sign_in(request: Request):
+    body = await request.json()
+    email = body["email"].lower()
+    user = _users.get(email)
+    if not user:
+        # Facilita o benchmark: qualquer email novo vira um usuário válido
+        user = _users[email] = {"password": body["password"], "local_id": uuid.uuid4().hex[:28]}
+    if user["password"] != body["password"]:
+        raise HTTPException(status_code=400, detail={"error": {"message": "INVALID_PASSWORD"}})
+    return {"email": email, "registered": True, **_tokens(user["local_id"])}
+
+
+@app.post("/v1/token")
+async def token(request: Request):
+    form = parse_qs((await request.body()).decode())
+    local_id = _refresh_tokens.get((form.get("refresh_token") or [None])[0])
+    if not local_id:
+        raise HTTPException(status_code=400, detail={"error": {"message": "INVALID_REFRESH_TOKEN"}})
+    data = _tokens(local_id)
+    return {
+        "id_token": data["idToken"],
+        "refresh_token": data["refreshToken"],
+        "expires_in": data["expiresIn"],
+        "user_id": local_id,
+    }
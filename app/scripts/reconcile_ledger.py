@@ -0,0 +1,25 @@
+import asyncio, os
+from dotenv import load_dotenv
+from app.services.ledger_reconciliation import LedgerReconciler
+
+load_dotenv()
+
+async def main():
+    max_pages = os.environ.get("RECONCILE_MAX_PAGES")
+    report = await LedgerReconciler().run(max_pages=int(max_pages) if max_pages else None)
+    print(f"Transações processadas: {report.transactions_processed} ({report.pages} páginas)")
+    print(f"Usuários verificados: {report.users_touched}")
+    if not report.reached_head:
+        print("Parou antes do fim da coleção: saldos de user_coins não comparados nesta execução.")
+    elif report.users_pending:
+        print(f"Usuários com movimento durante a execução (ficam para a próxima): {report.users_pending}")
+    print(f"Cursor: {report.cursor_created_at} / {report.cursor_transaction_id}")
+    if not report.drifts:
+        print("Nenhuma divergência encontrada.")
+    for drift in report.drifts:
+        print(drift.model_dump())
+    if report.drifts_found > len(report.drifts):
+        print(f"... mais {report.drifts_found - len(report.drifts)} divergências (ver logs)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,25 @@
+import asyncio, os, time
+from dotenv import load_dotenv
+from app.services.payment_reconciliation import StripePaymentReconciler
+
+load_dotenv()
+
+async def main():
+    since = os.environ.get("RECONCILE_SINCE")  # unix timestamp; padrão = marca salva
+    start = time.perf_counter()
+    report = await StripePaymentReconciler().run(since=int(since) if since else None)
+    elapsed = time.perf_counter() - start
+    rate = report.sessions_seen / elapsed * 60 if elapsed else 0
+    print(f"Sessões conferidas: {report.sessions_seen} em {elapsed:.1f}s ({rate:.0f}/min, {report.pages} páginas)")
+    print(f"Pagas: {report.sessions_paid} | Já creditadas: {report.already_credited} | Recentes (ficam com o webhook): {report.skipped_recent}")
+    print(f"Marca d'água: {report.watermark_start} -> {report.watermark_end}")
+    print(f"Creditadas agora: {len(report.credited)}")
+    for session_id in report.credited:
+        print(f"  + {session_id}")
+    for session_id, reason in report.skipped.items():
+        print(f"  - {session_id}: {reason}")
+    for session_id, error in report.errors.items():
+        print(f"  ! {session_id}: {error}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
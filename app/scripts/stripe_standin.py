@@ -0,0 +1,62 @@
+"""
+Servidor local que imita a listagem de checkout sessions do Stripe, para
+testar e medir a reconciliação de pagamentos sem tocar na conta real.
+
+    STANDIN_SESSIONS=5000 uvicorn app.scripts.stripe_standin:app --port 12111
+    STRIPE_API_BASE=http://localhost:12111 python -m app.scripts.reconcile_payments
+"""
+import os
+import time
+
+from fastapi import FastAPI, Request
+
+TOTAL = int(os.environ.get("STANDIN_SESSIONS", "1000"))
+NOW = int(time.time())
+
+# Mais recentes primeiro, como a API real
+SESSIONS = [
+    {
+        "id": f"cs_test_{i:06d}",
+        "object": "checkout.session",
+        "created": NOW - i,
+        "status": "complete",
+        "payment_status": "paid" if i % 10 else "unpaid",
+        "amount_total": 600,
+        "metadata": {
+            "user_id": f"standin_user_{i % 50}",
+            "package_id": "pack_100",
+            "coins": "500",
+            "package_name": "Pacote Iniciante",
+        },
+    }
+    for i in range(TOTAL)
+]
+_index = {s["id"]: n for n, s in enumerate(SESSIONS)}
+
+app = FastAPI(title="stripe-standin")
+
+
+@app.get("/v1/checkout/sessions")
+def list_sessions(request: Request):
+    params = request.query_params
+    limit = min(int(params.get("limit", 10)), 100)
+    created_gte = int(params.get("created[gte]", 0))
+    status = params.get("status")
+
+    start = _index[params["starting_after"]] + 1 if params.get("starting_after") else 0
+    data = []
+    n = start
+    while n < len(SESSIONS) and len(data) < limit + 1:
+        s = SESSIONS[n]
+        if s["created"] < created_gte:
+            break
+        if status is None or s["status"] == status:
+            data.append(s)
+        n += 1
+
+    return {
+        "object": "list",
+        "url": "/v1/checkout/sessions",
+        "has_more": len(data) > limit,
+        "data": data[:limit],
+    }
@@ -1,15 +1,37 @@
+import asyncio
 import os
 import json
 from typing import List, Dict, Optional
 import httpx
 from fastapi import HTTPException
 
+from app.core.cancellation import DeadlineExceeded, expired, timeout
+from app.core.circuit_breaker import llm_breaker
+from app.core.tracing import tracer
+from app.services.llm_usage import llm_usage
+
 SITE_URL = os.getenv("OPENROUTER_SITE_URL", "http://localhost:8000")
 SITE_NAME = os.getenv("OPENROUTER_SITE_NAME", "RPG-IA-Backend")
 API_KEY = os.getenv("OPENROUTER_API_KEY")
+# Teto de uma chamada; o prazo da requisição pode encurtar
+TIMEOUT_SECONDS = float(os.getenv("OPENROUTER_TIMEOUT_SECONDS", "30"))
 
 MODEL = "openai/gpt-4o-mini"
 
+# US$ por milhão de tokens (entrada, entrada lida do cache, saída), usado
+# só quando o OpenRouter não devolve o custo da chamada em usage.cost
+PRICES_PER_MTOK = {
+    "openai/gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+
+# Formato da resposta do modelo: "json" (padrão) ou "compact" (linhas com
+# prefixo curto, menos tokens de saída; ver SYSTEM_PROMPT_COMPACT)
+OUTPUT_FORMAT = os.getenv("OPENROUTER_OUTPUT_FORMAT", "json")
+
+# Provedores que só cacheiam o prompt com breakpoint explícito
+# (cache_control); OpenAI e outros cacheiam prefixos repetidos sozinhos
+CACHE_CONTROL_PREFIXES = ("anthropic/", "google/")
+
 # ==========================================
 # SYSTEM PROMPT MELHORADO
 # ==========================================
@@ -85,6 +107,79 @@ EXEMPLOS DE BOAS ESCOLHAS (quando NÃO é game over):
 ✅ Bom: ["Enfrentar o dragão de frente", "Procurar uma passagem secreta"]
 """
 
+# Mesmo jogo, resposta em linhas: sem chaves, aspas nem escapes JSON.
+# Expandida de volta para {text, choices, state} por _parse_compact.
+SYSTEM_PROMPT_COMPACT = """
+Você é um motor de narrativa interativa para um jogo de aventura baseado em escolhas.
+
+RESPONDA SEMPRE NESTE FORMATO DE LINHAS, SEM NADA ANTES OU DEPOIS:
+T: texto narrativo simples
+C: opção 1
+C: opção 2
+S: <hp>|<local>|<fim>
+
+- T: a narração (uma linha só)
+- C: uma linha por escolha
+- S: HP atual (número inteiro), local atual (ex: floresta, caverna, cidade)
+  e fim = 1 se a história acabou, 0 se continua
+
+🚨 REGRAS CRÍTICAS DE GAME OVER:
+
+MARQUE fim = 1 IMEDIATAMENTE quando:
+1. HP chegar a 0 ou menos
+2. Personagem morrer (qualquer causa: queda, explosão, envenenamento, etc)
+3. Situação impossível de sobreviver (desintegração, esmagamento, afogamento)
+4. História chegar a uma conclusão definitiva (vitória total ou derrota absoluta)
+
+QUANDO fim = 1:
+- NÃO escreva linhas C: (SEM OPÇÕES)
+- T deve descrever o FINAL definitivo
+- NÃO dê opções de "tentar algo" ou "continuar"
+- Use palavras finais como "FIM", "GAME OVER", ou "FIM DA JORNADA"
+
+❌ EXEMPLO ERRADO - NUNCA FAÇA ISSO:
+T: Você cai no abismo e morre.
+C: Tentar se segurar
+C: Gritar por ajuda
+S: 0|abismo|0
+
+✅ EXEMPLO CORRETO:
+T: Você cai no abismo infinito. A escuridão te envolve enquanto sua vida se esvai. GAME OVER.
+S: 0|abismo|1
+
+REGRAS DE FORMATO:
+- Nunca use JSON
+- Se fim = 1, não há linhas C:
+- O jogador começa com 10 de HP
+
+REGRAS DE NARRATIVA:
+1. COERÊNCIA: Continue EXATAMENTE de onde a história parou
+2. CONSEQUÊNCIAS: As escolhas do jogador devem ter impacto real
+3. PROGRESSÃO: A história deve avançar, não ficar em loops
+4. HP: Diminua HP em situações de perigo:
+   - Perigo leve: -1 ou -2 HP
+   - Perigo médio: -3 ou -4 HP
+   - Perigo mortal: -5 ou mais HP
+5. VITÓRIA: Após 10-15 escolhas bem-sucedidas, crie um clímax, resolução e marque fim = 1
+6. local: Use para indicar a localização atual (ex: "floresta", "caverna", "cidade")
+7. ESCOLHAS (quando não é game over): Crie opções variadas e interessantes:
+   - Ação direta vs. abordagem cautelosa
+   - Combate vs. negociação
+   - Risco vs. segurança
+8. DESCRIÇÕES: Seja visual e envolvente, mas conciso (2-4 frases)
+9. TENSÃO: Aumente gradualmente a dificuldade
+10. LÓGICA: Se HP = 0 ou morte óbvia, SEMPRE marque fim = 1
+
+EXEMPLOS DE BOAS ESCOLHAS (quando NÃO é game over):
+❌ Ruim: C: Ir para esquerda / C: Ir para direita
+✅ Bom: C: Enfrentar o dragão de frente / C: Procurar uma passagem secreta
+"""
+
+SYSTEM_PROMPTS = {
+    "json": SYSTEM_PROMPT,
+    "compact": SYSTEM_PROMPT_COMPACT,
+}
+
 # ==========================================
 # PARSING
 # ==========================================
@@ -124,7 +219,11 @@ def _parse_json_strict(content: str, current_hp: int = 10) -> Dict:
             raise ValueError("JSON inválido da IA")
         data = json.loads(blob)
 
-    # Garantir campos
+    return _normalize(data, current_hp)
+
+
+def _normalize(data: Dict, current_hp: int) -> Dict:
+    """Garante os campos do passo, venha do formato que vier."""
     state = data.get("state", {})
     player_hp = max(0, state.get("player_hp", current_hp))
     is_game_over = state.get("is_game_over", False)
@@ -140,46 +239,193 @@ def _parse_json_strict(content: str, current_hp: int = 10) -> Dict:
     }
 
 
+def _parse_compact(content: str, current_hp: int = 10) -> Dict:
+    """
+    Expande a resposta em linhas (SYSTEM_PROMPT_COMPACT) para o formato do
+    passo. Linhas sem prefixo continuam a anterior (narração quebrada em
+    várias linhas); se não vier nenhuma linha T: o modelo respondeu JSON e
+    o parser de JSON assume.
+    """
+    text_lines, choices, state = [], [], {}
+    current = None
+    for raw in content.strip().strip("`").splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        tag, sep, value = line.partition(":")
+        tag = tag.strip().upper()
+        if sep and tag in ("T", "C", "S"):
+            value = value.strip()
+            current = tag
+            if tag == "T":
+                text_lines.append(value)
+            elif tag == "C":
+                if value:
+                    choices.append(value)
+            else:
+                state = _parse_compact_state(value, current_hp)
+        elif current == "T":
+            text_lines.append(line)
+        elif current == "C" and choices:
+            choices[-1] = f"{choices[-1]} {line}"
+
+    if not text_lines:
+        return _parse_json_strict(content, current_hp)
+
+    return _normalize({"text": " ".join(text_lines), "choices": choices, "state": state}, current_hp)
+
+
+def _parse_compact_state(value: str, current_hp: int) -> Dict:
+    """'<hp>|<local>|<fim>' → state; campos faltando ficam com o padrão."""
+    parts = [part.strip() for part in value.split("|")]
+    state = {}
+    try:
+        state["player_hp"] = int(parts[0])
+    except (ValueError, IndexError):
+        state["player_hp"] = current_hp
+    if len(parts) > 1 and parts[1]:
+        state["room_type"] = parts[1]
+    if len(parts) > 2:
+        state["is_game_over"] = parts[2].lower() in ("1", "sim", "true")
+    return state
+
+
+PARSERS = {
+    "json": _parse_json_strict,
+    "compact": _parse_compact,
+}
+
+
 # ==========================================
 # IA CALL
 # ==========================================
 
-async def _chat_once(user_prompt: str, current_hp: int = 10) -> Dict:
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        response = await client.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {API_KEY}",
-                "HTTP-Referer": SITE_URL,
-                "X-Title": SITE_NAME,
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": MODEL,
-                "messages": [
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": user_prompt}
-                ],
-                "temperature": 0.7,
-                "max_tokens": 800,
-            }
-        )
-
-    content = response.json()["choices"][0]["message"]["content"]
-    return _parse_json_strict(content, current_hp)
+class TruncatedOutputError(Exception):
+    """O modelo parou por max_tokens (finish_reason == "length")."""
+
+    def __init__(self, usage: Dict):
+        self.usage = usage
+        super().__init__("Resposta do modelo cortada por max_tokens")
+
+
+async def _chat_once(
+    messages: List[dict],
+    current_hp: int = 10,
+    output_format: str = OUTPUT_FORMAT,
+    params: Optional[Dict] = None,
+    uid: Optional[str] = None,
+    story_id: Optional[str] = None
+) -> Dict:
+    params = params or GENERATION_POLICY["mid"]
+    # O timeout respeita o prazo da requisição; se a requisição for
+    # cancelada (cliente desconectou) o cancelamento fecha a conexão com o
+    # OpenRouter e a geração para de consumir tokens
+    call_timeout = timeout(TIMEOUT_SECONDS)
+
+    # Erros e lentidão do OpenRouter contam para o circuit breaker; aberto,
+    # a chamada falha na hora com CircuitOpenError (503 para o cliente)
+    with llm_breaker.guard(), tracer.start_as_current_span("llm.chat", attributes={
+        "gen_ai.system": "openrouter",
+        "gen_ai.request.model": MODEL,
+        "gen_ai.request.max_tokens": params["max_tokens"],
+        "gen_ai.request.temperature": params["temperature"],
+    }) as span:
+        async with httpx.AsyncClient(timeout=call_timeout) as client:
+            post = client.post(
+                "https://openrouter.ai/api/v1/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {API_KEY}",
+                    "HTTP-Referer": SITE_URL,
+                    "X-Title": SITE_NAME,
+                    "Content-Type": "application/json",
+                },
+                json={
+                    "model": MODEL,
+                    "messages": messages,
+                    "temperature": params["temperature"],
+                    "max_tokens": params["max_tokens"],
+                    **({"stop": STOP_SEQUENCES[output_format]} if STOP_SEQUENCES[output_format] else {}),
+                    # Pede o custo da chamada junto com a contagem de tokens
+                    "usage": {"include": True},
+                }
+            )
+            try:
+                response = await asyncio.wait_for(post, call_timeout)
+            except (asyncio.TimeoutError, httpx.TimeoutException):
+                if expired():
+                    raise DeadlineExceeded("Prazo da requisição esgotado durante a geração")
+                raise
+
+        span.set_attribute("http.response.status_code", response.status_code)
+        response.raise_for_status()
+        data = response.json()
+        usage = _usage_from(data)
+        span.set_attribute("gen_ai.usage.input_tokens", usage["prompt_tokens"])
+        span.set_attribute("gen_ai.usage.output_tokens", usage["completion_tokens"])
+        span.set_attribute("gen_ai.usage.cache_read.input_tokens", usage["cached_tokens"])
+        span.set_attribute("gen_ai.response.model", usage["model"])
+        # Registra antes de validar: resposta cortada, ilegível ou descartada
+        # depois (reserva recusada) também foi paga
+        if uid:
+            llm_usage.record(uid, story_id, usage)
+
+        choice = data["choices"][0]
+        content = choice["message"]["content"]
+        finish_reason = choice.get("finish_reason")
+        span.set_attribute("gen_ai.response.finish_reasons", [finish_reason or "unknown"])
+
+    # Fora do breaker: resposta cortada não é falha do provedor
+    if finish_reason == "length":
+        raise TruncatedOutputError(usage)
+
+    result = PARSERS[output_format](content, current_hp)
+    result["usage"] = usage
+    return result
+
+
+def _usage_from(data: Dict) -> Dict:
+    """Consumo da chamada a partir do bloco `usage` do OpenRouter."""
+    usage = data.get("usage") or {}
+    model = data.get("model") or MODEL
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    completion_tokens = usage.get("completion_tokens") or 0
+    # Parte do prompt servida do cache do provedor (já incluída em prompt_tokens)
+    cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+
+    cost = usage.get("cost")
+    if cost is None:
+        price_in, price_cached, price_out = PRICES_PER_MTOK.get(model, PRICES_PER_MTOK[MODEL])
+        cost = (
+            (prompt_tokens - cached_tokens) * price_in
+            + cached_tokens * price_cached
+            + completion_tokens * price_out
+        ) / 1_000_000
+
+    return {
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": usage.get("total_tokens") or prompt_tokens + completion_tokens,
+        "cost_usd": float(cost),
+    }
 
 
 # ==========================================
-# MAIN
+# PROMPT
 # ==========================================
 
-async def generate_next_step(
-    theme: str,
-    character: str,
-    history: List[dict],
-    max_choices: int = 4
-) -> Dict:
+def _story_context(theme: str, character: str) -> str:
+    """Parte do prompt que não muda durante a história."""
+    return f"""
+=== HISTÓRIA ===
+Tema: {theme}
+Personagem: {character}
+"""
+
 
+def _build_turn_prompt(history: List[dict]) -> tuple:
+    """Monta o prompt do turno a partir do histórico. Retorna (prompt, hp atual)."""
     # 🔥 BUSCA SEGURA DO HP
     current_hp = 10  # default
     if history:
@@ -202,8 +448,6 @@ async def generate_next_step(
         history_text += "=========================\n"
 
     user_prompt = f"""
-Tema: {theme}
-Personagem: {character}
 HP atual: {current_hp}
 
 {history_text}
@@ -212,13 +456,145 @@ Continue a história de forma COERENTE com o que já aconteceu.
 Crie novas situações interessantes baseadas nas escolhas anteriores.
 """
 
+    return user_prompt, current_hp
+
+
+def _build_messages(
+    theme: str,
+    character: str,
+    history: List[dict],
+    model: str = MODEL,
+    output_format: str = OUTPUT_FORMAT
+) -> tuple:
+    """
+    Mensagens da chamada, com o prefixo estável na frente para o cache de
+    prompt do provedor: SYSTEM_PROMPT e o contexto da história (tema e
+    personagem) saem byte a byte iguais em todos os turnos da história; só
+    a mensagem do usuário (HP e histórico recente) muda.
+    Retorna (mensagens, hp atual).
+    """
+    static_prefix = [
+        {"type": "text", "text": SYSTEM_PROMPTS[output_format]},
+        {"type": "text", "text": _story_context(theme, character)},
+    ]
+    if model.startswith(CACHE_CONTROL_PREFIXES):
+        static_prefix[-1]["cache_control"] = {"type": "ephemeral"}
+
+    user_prompt, current_hp = _build_turn_prompt(history)
+    messages = [
+        {"role": "system", "content": static_prefix},
+        {"role": "user", "content": user_prompt},
+    ]
+    return messages, current_hp
+
+
+# ==========================================
+# GENERATION POLICY
+# ==========================================
+
+# Parâmetros por tipo de turno. Enquanto não houver consumo gravado por
+# tipo, todos mantêm o orçamento anterior de 800 tokens. Quando os passos
+# tiverem usage.turn_type, cada max_tokens passa a ser o sugerido por
+# app/scripts/generation_policy_report.py (p99 do tipo com folga).
+# Respostas cortadas são refeitas uma vez com TRUNCATION_RETRY_MAX_TOKENS.
+GENERATION_POLICY = {
+    # Cena de abertura: apresenta mundo e personagem, mais longa e variada
+    "opening": {"max_tokens": 800, "temperature": 0.9},
+    # Turno comum no meio da história
+    "mid": {"max_tokens": 800, "temperature": 0.7},
+    # HP baixo: provável desfecho, mais coerência que invenção
+    "danger": {"max_tokens": 800, "temperature": 0.6},
+    # Reta final (clímax e resolução pedidos pelo SYSTEM_PROMPT)
+    "climax": {"max_tokens": 800, "temperature": 0.6},
+}
+TRUNCATION_RETRY_MAX_TOKENS = 1000
+
+# A partir deste passo a história entra na reta final
+CLIMAX_FROM_INDEX = 10
+# HP a partir do qual o turno é tratado como perigo
+DANGER_HP = 3
+
+# Cortam a resposta quando o modelo começa um segundo passo
+STOP_SEQUENCES = {
+    "json": [],
+    "compact": ["\nT:"],
+}
+
+_generation_stats = {
+    "calls": {turn_type: 0 for turn_type in GENERATION_POLICY},
+    "truncated": {turn_type: 0 for turn_type in GENERATION_POLICY},
+}
+
+
+def _turn_type(history: List[dict]) -> str:
+    if not history:
+        return "opening"
+    last_step = history[-1]
+    if (last_step.get("state") or {}).get("player_hp", 10) <= DANGER_HP:
+        return "danger"
+    if last_step["index"] + 1 >= CLIMAX_FROM_INDEX:
+        return "climax"
+    return "mid"
+
+
+def _merge_usage(first: Dict, second: Dict) -> Dict:
+    """Soma o consumo de duas tentativas (a cortada também foi paga)."""
+    merged = dict(second)
+    merged["calls"] = first.get("calls", 1) + second.get("calls", 1)
+    for field in ("prompt_tokens", "cached_tokens", "completion_tokens", "total_tokens", "cost_usd"):
+        merged[field] = first.get(field, 0) + second.get(field, 0)
+    return merged
+
+
+def generation_stats() -> Dict:
+    return {
+        "policy": GENERATION_POLICY,
+        "calls": dict(_generation_stats["calls"]),
+        "truncated_retries": dict(_generation_stats["truncated"]),
+    }
+
+
+# ==========================================
+# MAIN
+# ==========================================
+
+async def generate_next_step(
+    theme: str,
+    character: str,
+    history: List[dict],
+    max_choices: int = 4,
+    uid: Optional[str] = None,
+    story_id: Optional[str] = None
+) -> Dict:
+
+    messages, current_hp = _build_messages(theme, character, history)
+
     last_index = history[-1]["index"] + 1 if history else 0
-    result = await _chat_once(user_prompt, current_hp)
+    turn_type = _turn_type(history)
+    params = GENERATION_POLICY[turn_type]
+    _generation_stats["calls"][turn_type] += 1
+
+    try:
+        result = await _chat_once(messages, current_hp, params=params, uid=uid, story_id=story_id)
+    except TruncatedOutputError as e:
+        # Só refaz com orçamento maior quando a resposta realmente não coube
+        _generation_stats["truncated"][turn_type] += 1
+        params = {**params, "max_tokens": TRUNCATION_RETRY_MAX_TOKENS}
+        try:
+            result = await _chat_once(messages, current_hp, params=params, uid=uid, story_id=story_id)
+        except TruncatedOutputError as retry_error:
+            # Nem o orçamento maior coube: mesma falha de uma resposta ilegível
+            raise ValueError("Resposta da IA cortada por max_tokens") from retry_error
+        result["usage"] = _merge_usage(e.usage, result["usage"])
+
+    if result.get("usage"):
+        result["usage"].update(turn_type=turn_type, max_tokens=params["max_tokens"])
 
     return {
         "index": last_index,
         "text": result["text"],
         "choices": result["choices"][:max_choices],
         "state": result["state"],
-        "model": MODEL
+        "model": MODEL,
+        "usage": result.get("usage")
     }
\ No newline at end of file
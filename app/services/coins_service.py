@@ -1,18 +1,23 @@
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from typing import Optional, List
+import asyncio
+import logging
 import uuid
 
-from google.cloud.firestore_v1 import FieldFilter
 
 from app.models.coins import (
     CoinTransaction,
     UserCoins,
     CoinPackage,
-    InsufficientCoinsError
+    CoinHold
 )
 
+from app.core.container import container
+from app.core.circuit_breaker import firestore_breaker, guarded_methods, unguarded
+from app.core.tracing import traced_methods
 from app.services.firebase_admin_svc import firestore_client
 
+logger = logging.getLogger(__name__)
 
 # =======================
 # Constantes
@@ -21,6 +26,18 @@ INITIAL_BONUS_COINS = 200
 STORY_CREATION_COST = 5
 CHOICE_COST = 5
 
+# Tempo máximo que uma reserva (hold) segura as moedas antes de expirar
+HOLD_TTL_SECONDS = 120
+
+
+class InsufficientBalanceError(Exception):
+    """Saldo disponível menor que o valor solicitado"""
+
+    def __init__(self, balance: int, required: int):
+        self.balance = balance
+        self.required = required
+        super().__init__(f"Saldo insuficiente. Possui {balance}, precisa de {required}.")
+
 
 # =======================
 # Pacotes disponíveis
@@ -50,52 +67,65 @@ COIN_PACKAGES = [
 ]
 
 
+@guarded_methods(firestore_breaker)
+@traced_methods("firestore.coins", **{"db.system": "firestore"})
 class CoinsService:
-    def __init__(self):
-        self.db = firestore_client()
+    def __init__(self, db=None):
+        self.db = db or firestore_client()
         self.users_coins_ref = self.db.collection("user_coins")
         self.transactions_ref = self.db.collection("coin_transactions")
+        self.holds_ref = self.db.collection("coin_holds")
+        # Um doc por compra creditada (id = reference_id, a sessão do Stripe)
+        self.credits_ref = self.db.collection("coin_credits")
 
     # =========================================================
     # Inicialização segura (idempotente)
     # =========================================================
-    async def initialize_user_coins(self, user_id: str) -> UserCoins:
-        user_doc_ref = self.users_coins_ref.document(user_id)
-        doc = user_doc_ref.get()
-
-        if doc.exists:
-            return UserCoins(**doc.to_dict())
-
-        user_coins = UserCoins(
-            user_id=user_id,
-            balance=INITIAL_BONUS_COINS,
-            total_earned=INITIAL_BONUS_COINS,
-            total_spent=0,
-            last_transaction_at=datetime.utcnow(),
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
-        )
-
-        user_doc_ref.set(
-            user_coins.model_dump(),
-            merge=True
-        )
+    def _initialize(self, user_id: str) -> UserCoins:
+        """
+        Cria o doc de saldo com o bônus numa transação: dois primeiros
+        acessos simultâneos não dão o bônus duas vezes.
+        """
+        from google.cloud import firestore
+
+        user_ref = self.users_coins_ref.document(user_id)
+
+        @firestore.transactional
+        def initialize(transaction) -> UserCoins:
+            doc = user_ref.get(transaction=transaction)
+            if doc.exists:
+                return UserCoins(**doc.to_dict())
+
+            user_coins = UserCoins(
+                user_id=user_id,
+                balance=INITIAL_BONUS_COINS,
+                total_earned=INITIAL_BONUS_COINS,
+                total_spent=0,
+                last_transaction_at=datetime.utcnow(),
+                created_at=datetime.utcnow(),
+                updated_at=datetime.utcnow()
+            )
+            ledger = self._new_transaction(
+                user_id=user_id,
+                amount=INITIAL_BONUS_COINS,
+                transaction_type="initial_bonus",
+                description="Bônus de boas-vindas",
+                balance_after=INITIAL_BONUS_COINS
+            )
+            transaction.create(user_ref, user_coins.model_dump())
+            transaction.set(self.transactions_ref.document(ledger.transaction_id), ledger.model_dump())
+            return user_coins
 
-        await self._create_transaction(
-            user_id=user_id,
-            amount=INITIAL_BONUS_COINS,
-            transaction_type="initial_bonus",
-            description="Bônus de boas-vindas",
-            balance_after=INITIAL_BONUS_COINS
-        )
+        return initialize(self.db.transaction())
 
-        return user_coins
+    async def initialize_user_coins(self, user_id: str) -> UserCoins:
+        return await asyncio.to_thread(self._initialize, user_id)
 
     # =========================================================
     # Saldo
     # =========================================================
     async def get_user_balance(self, user_id: str) -> UserCoins:
-        doc = self.users_coins_ref.document(user_id).get()
+        doc = await asyncio.to_thread(self.users_coins_ref.document(user_id).get)
 
         if not doc.exists:
             return await self.initialize_user_coins(user_id)
@@ -107,45 +137,275 @@ class CoinsService:
         return user_coins.balance >= required_coins
 
     # =========================================================
-    # Débito
+    # Alteração de saldo (débito e crédito)
     # =========================================================
-    async def deduct_coins(
+    def _apply(
         self,
         user_id: str,
         amount: int,
+        transaction_type: str,
         description: str,
         reference_id: Optional[str] = None
-    ) -> UserCoins:
-
-        user_coins = await self.get_user_balance(user_id)
-
-        if user_coins.balance < amount:
-            raise InsufficientCoinsError(
-                f"Saldo insuficiente. Possui {user_coins.balance}, precisa de {amount}."
+    ) -> Optional[UserCoins]:
+        """
+        Soma `amount` (negativo no débito) ao saldo e registra a transação
+        numa única transação do Firestore, como _reserve e _commit: nenhuma
+        alteração concorrente do mesmo saldo se perde.
+
+        Um crédito com reference_id cria coin_credits/<reference_id> na
+        mesma transação: o webhook e a reconciliação creditando a mesma
+        sessão ao mesmo tempo conflitam nesse doc e só um credita.
+        Retorna None se o usuário ainda não tem doc de saldo.
+        """
+        from google.cloud import firestore
+        from google.cloud.firestore_v1 import FieldFilter
+
+        user_ref = self.users_coins_ref.document(user_id)
+        credit_ref = self.credits_ref.document(reference_id) if reference_id and amount > 0 else None
+
+        @firestore.transactional
+        def apply(transaction) -> Optional[UserCoins]:
+            # Proteção contra duplicidade (webhook / retry / reconciliação)
+            existing = False
+            if credit_ref is not None:
+                existing = credit_ref.get(transaction=transaction).exists or any(
+                    # Compras creditadas antes de coin_credits existir
+                    self.transactions_ref
+                    .where(filter=FieldFilter("reference_id", "==", reference_id))
+                    .limit(1)
+                    .stream(transaction=transaction)
+                )
+
+            doc = user_ref.get(transaction=transaction)
+            if not doc.exists:
+                return None
+            user_coins = UserCoins(**doc.to_dict())
+
+            if existing:
+                logger.info("Transação duplicada ignorada", extra={"fields": {
+                    "user_id": user_id,
+                    "reference_id": reference_id,
+                }})
+                return user_coins
+
+            if user_coins.balance + amount < 0:
+                raise InsufficientBalanceError(user_coins.balance, -amount)
+
+            user_coins.balance += amount
+            if amount > 0:
+                user_coins.total_earned += amount
+            else:
+                user_coins.total_spent -= amount
+            user_coins.last_transaction_at = datetime.utcnow()
+            user_coins.updated_at = datetime.utcnow()
+
+            ledger = self._new_transaction(
+                user_id=user_id,
+                amount=amount,
+                transaction_type=transaction_type,
+                description=description,
+                reference_id=reference_id,
+                balance_after=user_coins.balance
             )
+            if credit_ref is not None:
+                transaction.create(credit_ref, {
+                    "user_id": user_id,
+                    "amount": amount,
+                    "transaction_id": ledger.transaction_id,
+                    "created_at": ledger.created_at,
+                })
+            transaction.set(user_ref, user_coins.model_dump(), merge=True)
+            transaction.set(self.transactions_ref.document(ledger.transaction_id), ledger.model_dump())
+            return user_coins
+
+        return apply(self.db.transaction())
+
+    async def _apply_balance_change(self, user_id: str, amount: int, *args) -> UserCoins:
+        user_coins = await asyncio.to_thread(self._apply, user_id, amount, *args)
+        if user_coins is None:
+            await self.initialize_user_coins(user_id)
+            user_coins = await asyncio.to_thread(self._apply, user_id, amount, *args)
+        return user_coins
 
-        new_balance = user_coins.balance - amount
-
-        user_coins.balance = new_balance
-        user_coins.total_spent += amount
-        user_coins.last_transaction_at = datetime.utcnow()
-        user_coins.updated_at = datetime.utcnow()
+    async def deduct_coins(
+        self,
+        user_id: str,
+        amount: int,
+        description: str,
+        reference_id: Optional[str] = None
+    ) -> UserCoins:
+        return await self._apply_balance_change(user_id, -amount, "debit", description, reference_id)
 
-        self.users_coins_ref.document(user_id).set(
-            user_coins.model_dump(),
-            merge=True
+    # =========================================================
+    # Reservas (hold → commit / release)
+    # =========================================================
+    def _held_amount(self, user_id: str, transaction=None) -> int:
+        """
+        Soma as reservas ativas do usuário, expirando as vencidas (dentro
+        da transação, quando chamada por uma).
+        """
+        from google.cloud.firestore_v1 import FieldFilter
+
+        now = datetime.now(timezone.utc)
+        held = 0
+
+        docs = (
+            self.holds_ref
+            .where(filter=FieldFilter("user_id", "==", user_id))
+            .where(filter=FieldFilter("status", "==", "active"))
+            .stream(transaction=transaction)
         )
-
-        await self._create_transaction(
+        for doc in docs:
+            hold = CoinHold(**doc.to_dict())
+            if hold.expires_at <= now:
+                if transaction is not None:
+                    transaction.update(doc.reference, {"status": "expired"})
+                else:
+                    doc.reference.update({"status": "expired"})
+                continue
+            held += hold.amount
+
+        return held
+
+    async def get_available_balance(self, user_id: str) -> int:
+        """
+        Saldo descontando as reservas ainda ativas. As leituras rodam em
+        threads para não bloquear o event loop enquanto a IA gera o passo.
+        """
+        doc, held = await asyncio.gather(
+            asyncio.to_thread(self.users_coins_ref.document(user_id).get),
+            asyncio.to_thread(self._held_amount, user_id)
+        )
+        if not doc.exists:
+            user_coins = await self.initialize_user_coins(user_id)
+        else:
+            user_coins = UserCoins(**doc.to_dict())
+        return user_coins.balance - held
+
+    def _reserve(self, hold: CoinHold) -> bool:
+        """
+        Confere o saldo livre e grava a reserva numa transação. A transação
+        também escreve no doc de saldo, então duas reservas simultâneas do
+        mesmo usuário conflitam e uma é refeita vendo a outra.
+        Retorna False se o usuário ainda não tem doc de saldo.
+        """
+        from google.cloud import firestore
+
+        user_ref = self.users_coins_ref.document(hold.user_id)
+
+        @firestore.transactional
+        def reserve(transaction) -> bool:
+            doc = user_ref.get(transaction=transaction)
+            if not doc.exists:
+                return False
+            available = doc.to_dict()["balance"] - self._held_amount(hold.user_id, transaction)
+            if available < hold.amount:
+                raise InsufficientBalanceError(available, hold.amount)
+            transaction.set(self.holds_ref.document(hold.hold_id), hold.model_dump())
+            transaction.update(user_ref, {"updated_at": datetime.utcnow()})
+            return True
+
+        return reserve(self.db.transaction())
+
+    async def reserve_coins(
+        self,
+        user_id: str,
+        amount: int,
+        description: str,
+        reference_id: Optional[str] = None,
+        ttl_seconds: int = HOLD_TTL_SECONDS
+    ) -> CoinHold:
+        """
+        Reserva moedas sem debitar. A reserva deve ser confirmada com
+        commit_hold ou devolvida com release_hold; se nenhum dos dois
+        acontecer, expira sozinha após ttl_seconds.
+        """
+        hold = CoinHold(
+            hold_id=str(uuid.uuid4()),
             user_id=user_id,
-            amount=-amount,
-            transaction_type="debit",
+            amount=amount,
             description=description,
             reference_id=reference_id,
-            balance_after=new_balance
+            expires_at=datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds),
+            created_at=datetime.utcnow()
         )
+        if not await asyncio.to_thread(self._reserve, hold):
+            await self.initialize_user_coins(user_id)
+            await asyncio.to_thread(self._reserve, hold)
+        return hold
+
+    def _commit(self, hold: CoinHold, reference_id: Optional[str]) -> UserCoins:
+        from google.cloud import firestore
+
+        hold_ref = self.holds_ref.document(hold.hold_id)
+        user_ref = self.users_coins_ref.document(hold.user_id)
+
+        @firestore.transactional
+        def commit(transaction) -> UserCoins:
+            hold_doc = hold_ref.get(transaction=transaction)
+            user_doc = user_ref.get(transaction=transaction)
+            status = hold_doc.to_dict().get("status") if hold_doc.exists else hold.status
+            user_coins = UserCoins(**user_doc.to_dict())
+
+            if status == "committed":
+                return user_coins
+            if status == "released":
+                raise ValueError(f"Reserva {hold.hold_id} já foi liberada")
+
+            # Uma reserva expirada ainda é cobrada: o passo já foi entregue
+            user_coins.balance -= hold.amount
+            user_coins.total_spent += hold.amount
+            user_coins.last_transaction_at = datetime.utcnow()
+            user_coins.updated_at = datetime.utcnow()
+
+            ledger = self._new_transaction(
+                user_id=hold.user_id,
+                amount=-hold.amount,
+                transaction_type="debit",
+                description=hold.description,
+                reference_id=reference_id or hold.reference_id,
+                balance_after=user_coins.balance
+            )
+            transaction.set(user_ref, user_coins.model_dump(), merge=True)
+            transaction.update(hold_ref, {"status": "committed"})
+            transaction.set(self.transactions_ref.document(ledger.transaction_id), ledger.model_dump())
+            return user_coins
 
-        return user_coins
+        return commit(self.db.transaction())
+
+    @unguarded
+    async def commit_hold(
+        self,
+        hold: CoinHold,
+        reference_id: Optional[str] = None
+    ) -> UserCoins:
+        """
+        Confirma a reserva: debita o saldo, marca a reserva e registra a
+        transação numa única transação do Firestore (em thread). Nunca é
+        recusada pelo circuito: o passo já foi gravado e tem que ser cobrado.
+        """
+        return await asyncio.to_thread(self._commit, hold, reference_id)
+
+    def _release(self, hold: CoinHold) -> None:
+        from google.cloud import firestore
+
+        hold_ref = self.holds_ref.document(hold.hold_id)
+
+        @firestore.transactional
+        def release(transaction) -> None:
+            doc = hold_ref.get(transaction=transaction)
+            if doc.exists and doc.to_dict().get("status") in ("active", "expired"):
+                transaction.update(hold_ref, {"status": "released"})
+
+        release(self.db.transaction())
+
+    @unguarded
+    async def release_hold(self, hold: CoinHold) -> None:
+        """
+        Devolve a reserva sem debitar (falha na geração, por exemplo). Nunca
+        é recusada pelo circuito, senão as moedas ficam presas até expirar.
+        """
+        await asyncio.to_thread(self._release, hold)
 
     # =========================================================
     # Crédito (COMPRA) - 🔥 CORRIGIDO
@@ -159,70 +419,33 @@ class CoinsService:
         reference_id: Optional[str] = None
     ) -> UserCoins:
         
-        print(f"\n[COINS_SERVICE] Iniciando add_coins:")
-        print(f"  - user_id: {user_id}")
-        print(f"  - amount: {amount}")
-        print(f"  - reference_id: {reference_id}")
-
-        # 🔒 Proteção contra duplicidade (webhook / retry)
-        if reference_id:
-            existing_docs = list(
-                self.transactions_ref
-                .where(filter=FieldFilter("reference_id", "==", reference_id))
-                .limit(1)
-                .stream()
-            )
-            
-            if existing_docs:
-                print(f"[COINS_SERVICE] ⚠️ Transação duplicada detectada! reference_id: {reference_id}")
-                # 🔥 FIX: Retorna o saldo ATUAL do usuário, não o antigo
-                user_coins_updated = await self.get_user_balance(user_id)
-                print(f"[COINS_SERVICE] Saldo atual do usuário: {user_coins_updated.balance}")
-                return user_coins_updated
-
-        # Busca saldo atual
-        user_coins = await self.get_user_balance(user_id)
-        print(f"[COINS_SERVICE] Saldo ANTES: {user_coins.balance}")
+        logger.debug("add_coins", extra={"fields": {
+            "user_id": user_id,
+            "amount": amount,
+            "reference_id": reference_id,
+        }})
 
-        new_balance = user_coins.balance + amount
-
-        user_coins.balance = new_balance
-        user_coins.total_earned += amount
-        user_coins.last_transaction_at = datetime.utcnow()
-        user_coins.updated_at = datetime.utcnow()
-
-        # 🔥 Salvando no Firestore com try/catch
         try:
-            self.users_coins_ref.document(user_id).set(
-                user_coins.model_dump(),
-                merge=True
+            user_coins = await self._apply_balance_change(
+                user_id, amount, transaction_type, description, reference_id
             )
-            print(f"[COINS_SERVICE] ✅ Firestore atualizado! Novo saldo: {new_balance}")
-        except Exception as e:
-            print(f"[COINS_SERVICE] ❌ ERRO ao salvar no Firestore: {e}")
+        except Exception:
+            logger.exception("Erro ao creditar moedas", extra={"fields": {"user_id": user_id}})
             raise
 
-        # Cria transação
-        try:
-            await self._create_transaction(
-                user_id=user_id,
-                amount=amount,
-                transaction_type=transaction_type,
-                description=description,
-                reference_id=reference_id,
-                balance_after=new_balance
-            )
-            print(f"[COINS_SERVICE] ✅ Transação criada com sucesso")
-        except Exception as e:
-            print(f"[COINS_SERVICE] ❌ ERRO ao criar transação: {e}")
-            raise
+        logger.info("Moedas adicionadas", extra={"fields": {
+            "user_id": user_id,
+            "amount": amount,
+            "balance_after": user_coins.balance,
+            "reference_id": reference_id,
+        }})
 
         return user_coins
 
     # =========================================================
     # Transações
     # =========================================================
-    async def _create_transaction(
+    def _new_transaction(
         self,
         user_id: str,
         amount: int,
@@ -230,8 +453,8 @@ class CoinsService:
         description: str,
         balance_after: int,
         reference_id: Optional[str] = None
-    ):
-        transaction = CoinTransaction(
+    ) -> CoinTransaction:
+        return CoinTransaction(
             transaction_id=str(uuid.uuid4()),
             user_id=user_id,
             amount=amount,
@@ -242,16 +465,12 @@ class CoinsService:
             created_at=datetime.utcnow()
         )
 
-        self.transactions_ref.document(transaction.transaction_id).set(
-            transaction.model_dump(),
-            merge=True
-        )
-
     async def get_user_transactions(
         self,
         user_id: str,
         limit: int = 50
     ) -> List[CoinTransaction]:
+        from google.cloud.firestore_v1 import FieldFilter
 
         query = (
             self.transactions_ref
@@ -260,7 +479,7 @@ class CoinsService:
             .limit(limit)
         )
 
-        docs = query.stream()
+        docs = await asyncio.to_thread(lambda: list(query.stream()))
         return [CoinTransaction(**doc.to_dict()) for doc in docs]
 
     # =========================================================
@@ -277,4 +496,4 @@ class CoinsService:
 
 
 # Instância global
-coins_service = CoinsService()
+coins_service = container.register("coins_service", CoinsService)
@@ -1,9 +1,13 @@
 import os
 import json
+import logging
 import threading
-import firebase_admin
-from firebase_admin import auth, credentials, firestore
+from google.auth import jwt as google_jwt
 from app.core.config import settings
+from app.core.tracing import traced
+from app.services.google_certs import google_certs
+
+logger = logging.getLogger(__name__)
 
 # Controle de init único (thread-safe)
 _admin_lock = threading.Lock()
@@ -21,6 +25,10 @@ def _init_admin_if_needed():
         if _app_initialized:
             return
 
+        # Import tardio: o Admin SDK é pesado e só é preciso aqui
+        import firebase_admin
+        from firebase_admin import credentials
+
         print(f"\n{'='*60}")
         print(f"[FIREBASE] Inicializando Firebase Admin SDK...")
         print(f"{'='*60}")
@@ -127,63 +135,96 @@ def _init_admin_if_needed():
         _app_initialized = True
 
 
+def _decode_id_token(id_token: str, clock_skew_seconds: int = 60) -> dict:
+    """
+    Mesmas regras do auth.verify_id_token do Admin SDK, mas usando os
+    certificados em memória de google_certs (sem HTTP no caminho da requisição).
+    """
+    header = google_jwt.decode_header(id_token)
+    kid = header.get("kid")
+    if not kid:
+        raise ValueError('Firebase ID token has no "kid" claim.')
+    if header.get("alg") != "RS256":
+        raise ValueError(f'Firebase ID token has incorrect algorithm: {header.get("alg")}')
+
+    cert = google_certs.get_cert(kid)
+    if cert is None:
+        raise ValueError(f"Certificado não encontrado para kid '{kid}'")
+
+    decoded = google_jwt.decode(
+        id_token,
+        certs=cert,
+        audience=settings.firebase_project_id,
+        clock_skew_in_seconds=clock_skew_seconds
+    )
+
+    subject = decoded.get("sub")
+    if not isinstance(subject, str) or not subject or len(subject) > 128:
+        raise ValueError('Firebase ID token has an invalid "sub" (subject) claim.')
+
+    decoded["uid"] = subject
+    return decoded
+
+
+@traced("auth.verify_id_token")
 def verify_id_token(id_token: str) -> dict:
-    """Verifica e decodifica o ID Token via Admin SDK."""
-    _init_admin_if_needed()
-    
-    print(f"\n[VERIFY] Iniciando validação do token...")
-    print(f"[VERIFY] Project ID esperado: {settings.firebase_project_id}")
-    
+    """Verifica e decodifica o ID Token contra os certificados em memória."""
     try:
         # Valida o token com folga de 60 segundos (para clock skew)
-        decoded = auth.verify_id_token(id_token, clock_skew_seconds=60)
-        
-        print(f"[VERIFY] ✅ Token decodificado com sucesso!")
-        print(f"[VERIFY] User ID: {decoded.get('user_id')}")
-        print(f"[VERIFY] Email: {decoded.get('email')}")
-        print(f"[VERIFY] Token aud (audience): {decoded.get('aud')}")
-        print(f"[VERIFY] Token iss (issuer): {decoded.get('iss')}")
-        
+        decoded = _decode_id_token(id_token, clock_skew_seconds=60)
+
         # Validações adicionais
         aud = decoded.get("aud")
         iss = decoded.get("iss")
         
         if aud != settings.firebase_project_id:
-            print(f"[VERIFY] ⚠️  WARNING: token.aud ({aud}) != settings.project ({settings.firebase_project_id})")
-            print(f"[VERIFY] ❌ Token é de outro projeto Firebase!")
             raise Exception(f"Token audience mismatch: esperado '{settings.firebase_project_id}', recebido '{aud}'")
         
         expected_iss = f"https://securetoken.google.com/{settings.firebase_project_id}"
         if iss != expected_iss:
-            print(f"[VERIFY] ⚠️  WARNING: token.iss ({iss}) != esperado ({expected_iss})")
-            print(f"[VERIFY] ❌ Token issuer inválido!")
             raise Exception(f"Token issuer mismatch: esperado '{expected_iss}', recebido '{iss}'")
         
-        print(f"[VERIFY] ✅ Todas as validações passaram!\n")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Token decodificado", extra={"fields": {
+                "uid": decoded.get("user_id"),
+                "aud": aud,
+                "iss": iss,
+            }})
         return decoded
         
     except Exception as e:
-        print(f"[VERIFY] ❌ ERRO na validação:")
-        print(f"[VERIFY] Tipo: {type(e).__name__}")
-        print(f"[VERIFY] Mensagem: {str(e)}\n")
+        logger.debug("Falha na validação do token", extra={"fields": {
+            "error_type": type(e).__name__,
+            "error": str(e),
+        }})
         raise
 
 
 def get_user(uid: str):
     """Obtém dados do usuário pelo UID."""
     _init_admin_if_needed()
+    from firebase_admin import auth
     return auth.get_user(uid)
 
 
 def set_custom_claims(uid: str, claims: dict):
     """Define custom claims para um usuário."""
     _init_admin_if_needed()
+    from firebase_admin import auth
     auth.set_custom_user_claims(uid, claims)
 
 
+def revoke_refresh_tokens(uid: str):
+    """Revoga os refresh tokens do usuário (não saem ID tokens novos deles)."""
+    _init_admin_if_needed()
+    from firebase_admin import auth
+    auth.revoke_refresh_tokens(uid)
+
+
 def firestore_client():
-    """Retorna o cliente Firestore."""
+    """Retorna o cliente Firestore (o SDK reaproveita o mesmo cliente por app)."""
     _init_admin_if_needed()
+    from firebase_admin import firestore
     return firestore.client()
 
 
@@ -192,5 +233,6 @@ __all__ = [
     "verify_id_token",
     "get_user",
     "set_custom_claims",
+    "revoke_refresh_tokens",
     "firestore_client",
 ]
@@ -1,20 +1,55 @@
+from typing import Optional
 import httpx
 from app.core.config import settings
 
-BASE = "https://identitytoolkit.googleapis.com/v1"
-SECURETOKEN = "https://securetoken.googleapis.com/v1"
+BASE = settings.identity_toolkit_url
+SECURETOKEN = settings.securetoken_url
+
+# Cliente único (pool + HTTP/2) reaproveitado entre logins; aberto no lifespan
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=10,
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=settings.identity_http_max_connections,
+            max_keepalive_connections=settings.identity_http_max_keepalive,
+        ),
+    )
+
+
+async def start_client() -> None:
+    global _client
+    if _client is None:
+        _client = _build_client()
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    # Scripts fora do app (sem lifespan) também funcionam
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
+
 
 async def signup_email_password(email: str, password: str) -> dict:
     url = f"{BASE}/accounts:signUp?key={settings.firebase_api_key}"
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.post(url, json={"email": email, "password": password, "returnSecureToken": True})
+    r = await _get_client().post(url, json={"email": email, "password": password, "returnSecureToken": True})
     r.raise_for_status()
     return r.json()
 
 async def signin_email_password(email: str, password: str) -> dict:
     url = f"{BASE}/accounts:signInWithPassword?key={settings.firebase_api_key}"
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.post(url, json={"email": email, "password": password, "returnSecureToken": True})
+    r = await _get_client().post(url, json={"email": email, "password": password, "returnSecureToken": True})
     r.raise_for_status()
     return r.json()
 
@@ -22,7 +57,6 @@ async def refresh_id_token(refresh_token: str) -> dict:
     url = f"{SECURETOKEN}/token?key={settings.firebase_api_key}"
     payload = {"grant_type": "refresh_token", "refresh_token": refresh_token}
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.post(url, data=payload, headers=headers)
+    r = await _get_client().post(url, data=payload, headers=headers)
     r.raise_for_status()
     return r.json()
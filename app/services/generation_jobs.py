@@ -0,0 +1,395 @@
+import asyncio
+import logging
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from app.core.cancellation import set_deadline
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.config import settings
+from app.core.container import container
+from app.core.logging_config import request_id_var
+from app.services.firebase_admin_svc import firestore_client
+from app.services.story_service import S
+
+logger = logging.getLogger(__name__)
+
+# Intervalo da varredura que recupera jobs pendentes (retries e restarts)
+POLL_INTERVAL_SECONDS = 5
+# Backoff entre tentativas: 2s, 4s, 8s...
+RETRY_BASE_SECONDS = 2
+# Folga sobre o prazo da geração antes de considerar o worker perdido
+LEASE_MARGIN_SECONDS = 30
+# Status de um job que ainda vai rodar (ou está rodando)
+ACTIVE_STATUSES = ("queued", "retry", "running")
+
+# Job em execução no worker; o passo gravado pelo turno leva esse id
+job_id_var: ContextVar[Optional[str]] = ContextVar("job_id", default=None)
+
+# Handler de um tipo de job: recebe (story_id, uid, **params) e devolve o StepOut
+JobHandler = Callable[..., Awaitable]
+
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str):
+    """Registra a função de turno que executa os jobs de um tipo (usado pelas rotas)."""
+    def register(func: JobHandler) -> JobHandler:
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+class JobQueueFullError(Exception):
+    """Fila de geração cheia: o cliente deve tentar de novo mais tarde."""
+
+
+class JobInProgressError(Exception):
+    """Já existe um job pendente para a mesma história."""
+
+    def __init__(self, job_id: str):
+        super().__init__(job_id)
+        self.job_id = job_id
+
+
+class GenerationJobQueue:
+    """
+    Fila de gerações assíncronas, persistida em `generation_jobs`.
+
+    A rota grava o job e responde 202 na hora; um pool de workers roda o
+    turno (reserva, LLM, gravação do passo e débito) com o mesmo código das
+    rotas síncronas e guarda o StepOut no job para o polling do cliente.
+
+    Uma história tem no máximo um job ativo: a criação grava o job e
+    `stories/<id>.active_job_id` na mesma transação, e o fim do job limpa
+    o campo. Cada tentativa assume o job numa transação com lease em
+    next_attempt_at; jobs em `running` cujo worker sumiu voltam para a
+    fila quando o lease vence.
+
+    O passo gravado pelo turno leva o job_id. Ao assumir o job:
+      - se já existe passo com esse job_id (restart no meio, falha depois
+        de gravar), ele vira o resultado do job;
+      - se a história avançou por outro caminho desde a criação, o pedido
+        ficou velho e o job falha com 409.
+
+    A varredura de jobs vencidos usa o índice composto (status,
+    next_attempt_at) de firestore.indexes.json.
+    """
+
+    def __init__(self, workers: int, max_attempts: int, max_pending: int, job_timeout: float, db=None):
+        self.db = db or firestore_client()
+        self.jobs_ref = self.db.collection("generation_jobs")
+        self.stories_ref = self.db.collection("stories")
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.max_pending = max_pending
+        self.job_timeout = job_timeout
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._queued: set[str] = set()
+        self._running: set[str] = set()
+        self._tasks: list[asyncio.Task] = []
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+
+    # =========================================================
+    # Criação e consulta (chamado pelas rotas)
+    # =========================================================
+    async def enqueue(self, kind: str, story_id: str, uid: str, expected_step_id: Optional[str], **params) -> dict:
+        """Persiste o job e o coloca na fila. Retorna o documento do job."""
+        if len(self._queued) + len(self._running) >= self.max_pending:
+            raise JobQueueFullError()
+
+        now = datetime.now(timezone.utc)
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "kind": kind,
+            "story_id": story_id,
+            "uid": uid,
+            "params": params,
+            "expected_step_id": expected_step_id,
+            "status": "queued",
+            "attempts": 0,
+            "last_error": None,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "next_attempt_at": now,
+        }
+        active_job_id = await asyncio.to_thread(self._create, job)
+        if active_job_id:
+            raise JobInProgressError(active_job_id)
+        self._push(job["job_id"])
+        return job
+
+    def _create(self, job: dict) -> Optional[str]:
+        """
+        Grava o job e o marca como ativo na história, numa transação. Se a
+        história já tem um job ativo (de qualquer processo) nada é gravado
+        e o id dele é devolvido.
+        """
+        from google.cloud import firestore
+
+        story_ref = self.stories_ref.document(job["story_id"])
+        job_ref = self.jobs_ref.document(job["job_id"])
+
+        @firestore.transactional
+        def create(transaction) -> Optional[str]:
+            story = story_ref.get(transaction=transaction)
+            active_job_id = (story.to_dict() or {}).get("active_job_id") if story.exists else None
+            if active_job_id:
+                # O campo pode ter ficado de um job que terminou sem limpá-lo
+                active = self.jobs_ref.document(active_job_id).get(transaction=transaction)
+                if active.exists and active.to_dict()["status"] in ACTIVE_STATUSES:
+                    return active_job_id
+            transaction.create(job_ref, job)
+            transaction.update(story_ref, {"active_job_id": job["job_id"]})
+            return None
+
+        return create(self.db.transaction())
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        doc = await asyncio.to_thread(self.jobs_ref.document(job_id).get)
+        return doc.to_dict() if doc.exists else None
+
+    def _push(self, job_id: str) -> None:
+        if job_id not in self._queued and job_id not in self._running:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    # =========================================================
+    # Processamento
+    # =========================================================
+    def _claim(self, job_id: str) -> Optional[dict]:
+        """
+        Assume o job numa transação: só um worker (de qualquer processo) o
+        pega por vez, e o lease em next_attempt_at devolve à fila um job
+        cujo worker sumiu no meio.
+        """
+        from google.cloud import firestore
+
+        ref = self.jobs_ref.document(job_id)
+
+        @firestore.transactional
+        def claim(transaction) -> Optional[dict]:
+            doc = ref.get(transaction=transaction)
+            if not doc.exists:
+                return None
+            job = doc.to_dict()
+            now = datetime.now(timezone.utc)
+            if job["status"] not in ACTIVE_STATUSES or job["next_attempt_at"] > now:
+                return None
+            job["attempts"] += 1
+            transaction.update(ref, {
+                "status": "running",
+                "attempts": job["attempts"],
+                "updated_at": now,
+                "next_attempt_at": now + timedelta(seconds=self.job_timeout + LEASE_MARGIN_SECONDS),
+            })
+            return job
+
+        return claim(self.db.transaction())
+
+    def _close(self, job: dict, fields: dict) -> None:
+        """Grava o fim do job e libera a história, se o job ativo dela é este."""
+        from google.cloud import firestore
+
+        story_ref = self.stories_ref.document(job["story_id"])
+        job_ref = self.jobs_ref.document(job["job_id"])
+
+        @firestore.transactional
+        def close(transaction) -> None:
+            story = story_ref.get(transaction=transaction)
+            transaction.update(job_ref, fields)
+            if story.exists and (story.to_dict() or {}).get("active_job_id") == job["job_id"]:
+                transaction.update(story_ref, {"active_job_id": None})
+
+        close(self.db.transaction())
+
+    async def _finish(self, job: dict, result: Optional[dict] = None, error: Optional[dict] = None) -> None:
+        now = datetime.now(timezone.utc)
+        await asyncio.to_thread(self._close, job, {
+            "status": "failed" if error else "done",
+            "result": result,
+            "error": error,
+            "updated_at": now,
+            "finished_at": now,
+        })
+        if error:
+            self.failed += 1
+        else:
+            self.completed += 1
+
+    async def _earlier_outcome(self, job: dict) -> Optional[dict]:
+        """
+        O desfecho já decidido do job, sem rodar o turno: o passo gravado
+        por uma tentativa anterior ou o 409 de um pedido velho.
+        """
+        step, story = await asyncio.gather(
+            asyncio.to_thread(S.job_step, job["story_id"], job["job_id"]),
+            asyncio.to_thread(S.get_story, job["story_id"]),
+        )
+        if step:
+            return {"result": {
+                "story_id": job["story_id"],
+                **{field: step.get(field) for field in ("step_id", "index", "text", "choices", "created_at", "state")},
+            }}
+        if story and story.get("current_step_id") != job["expected_step_id"]:
+            return {"error": {"status_code": 409, "detail": "A história avançou desde o pedido"}}
+        return None
+
+    async def _process(self, job_id: str) -> None:
+        ref = self.jobs_ref.document(job_id)
+        job = await asyncio.to_thread(self._claim, job_id)
+        if job is None:
+            return  # já terminou ou outro worker está com ele
+
+        handler = JOB_HANDLERS.get(job["kind"])
+        if handler is None:
+            await self._finish(job, error={"status_code": 400, "detail": f"Tipo de job desconhecido: {job['kind']}"})
+            return
+
+        # Cada job tem o prazo de uma rota de geração
+        set_deadline(self.job_timeout)
+
+        outcome = await self._earlier_outcome(job)
+        if outcome is not None:
+            await self._finish(job, **outcome)
+            return
+
+        attempts = job["attempts"]
+        try:
+            result = await handler(job["story_id"], job["uid"], **job["params"])
+        except asyncio.CancelledError:
+            # Shutdown: a reserva já foi devolvida pelo turno; o job volta
+            # para a fila e o poller o retoma depois do restart
+            await asyncio.shield(asyncio.to_thread(ref.update, {
+                "status": "queued",
+                "updated_at": datetime.now(timezone.utc),
+                "next_attempt_at": datetime.now(timezone.utc),
+            }))
+            raise
+        except HTTPException as e:
+            if e.status_code < 500:
+                # Erro do pedido (saldo, escolha inválida, permissão): não adianta repetir
+                await self._finish(job, error={"status_code": e.status_code, "detail": e.detail})
+                return
+            await self._retry(ref, job, attempts, str(e.detail))
+            return
+        except CircuitOpenError as e:
+            await self._retry(ref, job, attempts, str(e), min_delay=e.retry_after)
+            return
+        except Exception as e:
+            await self._retry(ref, job, attempts, str(e) or type(e).__name__)
+            return
+
+        await self._finish(job, result=result.model_dump())
+
+    async def _retry(self, ref, job: dict, attempts: int, error: str, min_delay: float = 0) -> None:
+        if attempts >= self.max_attempts:
+            logger.error("Job de geração falhou", extra={"fields": {
+                "job_id": job["job_id"],
+                "story_id": job["story_id"],
+                "attempts": attempts,
+                "error": error,
+            }})
+            await asyncio.to_thread(ref.update, {"last_error": error})
+            await self._finish(job, error={"status_code": 500, "detail": "Não foi possível gerar o passo"})
+            return
+
+        self.retried += 1
+        logger.warning("Falha no job de geração", extra={"fields": {
+            "job_id": job["job_id"],
+            "attempts": attempts,
+            "error": error,
+        }})
+        delay = max(min_delay, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        now = datetime.now(timezone.utc)
+        await asyncio.to_thread(ref.update, {
+            "status": "retry",
+            "last_error": error,
+            "updated_at": now,
+            "next_attempt_at": now + timedelta(seconds=delay),
+        })
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            self._running.add(job_id)
+            token = request_id_var.set(f"job-{job_id}")
+            job_token = job_id_var.set(job_id)
+            try:
+                await self._process(job_id)
+            except Exception:
+                logger.exception("Erro inesperado no worker de gerações", extra={"fields": {"job_id": job_id}})
+            finally:
+                job_id_var.reset(job_token)
+                request_id_var.reset(token)
+                self._running.discard(job_id)
+                self._queue.task_done()
+
+    def _due_job_ids(self) -> list[str]:
+        from google.cloud.firestore_v1 import FieldFilter
+
+        now = datetime.now(timezone.utc)
+        ids = []
+        for status in ACTIVE_STATUSES:
+            docs = (
+                self.jobs_ref
+                .where(filter=FieldFilter("status", "==", status))
+                .where(filter=FieldFilter("next_attempt_at", "<=", now))
+                .limit(100)
+                .stream()
+            )
+            ids.extend(doc.id for doc in docs)
+        return ids
+
+    async def _poller(self) -> None:
+        """Reenfileira jobs vencidos: retries, workers perdidos e o que ficou de um restart."""
+        while True:
+            try:
+                for job_id in await asyncio.to_thread(self._due_job_ids):
+                    self._push(job_id)
+            except Exception as e:
+                logger.warning("Erro ao buscar jobs pendentes", extra={"fields": {"error": str(e)}})
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+    # =========================================================
+    # Ciclo de vida (lifespan)
+    # =========================================================
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._poller()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": len(self._queued),
+            "running": len(self._running),
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+
+# Instância global
+generation_jobs = container.register("generation_jobs", lambda: GenerationJobQueue(
+    workers=settings.generation_job_workers,
+    max_attempts=settings.generation_job_max_attempts,
+    max_pending=settings.generation_job_max_pending,
+    job_timeout=settings.llm_request_timeout_seconds,
+))
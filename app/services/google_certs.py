@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from contextlib import suppress
+from typing import Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+# Sem Cache-Control, assume a validade típica dos certificados do Google
+DEFAULT_MAX_AGE_SECONDS = 3600
+# Intervalo entre tentativas quando o download falha
+RETRY_SECONDS = 30
+# Evita rajadas de downloads quando chegam tokens com "kid" desconhecido
+MIN_FORCED_REFRESH_INTERVAL = 30
+
+
+class GoogleCertsKeyset:
+    """
+    Certificados x509 usados para assinar os ID tokens do Firebase, mantidos
+    em memória. Uma task em background (iniciada no lifespan) renova o
+    conjunto antes do max-age expirar, então a verificação dos tokens não
+    faz chamadas HTTP no caminho da requisição. Se a task atrasar, o último
+    conjunto continua valendo e ela é acordada.
+
+    Só há download dentro da requisição sem nenhum conjunto carregado
+    (scripts, sem lifespan) ou com um kid desconhecido (rotação); nos dois
+    casos um único download fica em andamento e as outras threads esperam
+    e reaproveitam o resultado.
+    """
+
+    def __init__(self, url: str, refresh_margin_seconds: int):
+        self.url = url
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self._certs: Dict[str, str] = {}
+        self._expires_at = 0.0
+        self._last_refresh = 0.0
+        self._last_attempt = 0.0
+        self._lock = threading.Lock()
+        self._download_lock = threading.Lock()
+        # Loop e evento da task de renovação, para acordá-la de outras threads
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    # =========================================================
+    # Download
+    # =========================================================
+    def _apply(self, response: httpx.Response) -> None:
+        response.raise_for_status()
+        certs = response.json()
+        match = _MAX_AGE_RE.search(response.headers.get("cache-control", ""))
+        max_age = int(match.group(1)) if match else DEFAULT_MAX_AGE_SECONDS
+
+        with self._lock:
+            self._certs = certs
+            self._last_refresh = time.time()
+            self._expires_at = self._last_refresh + max_age
+
+    async def refresh(self) -> None:
+        self._last_attempt = time.time()
+        async with httpx.AsyncClient(timeout=10) as client:
+            response = await client.get(self.url)
+        self._apply(response)
+
+    def refresh_sync(self) -> None:
+        """Download bloqueante; use _refresh_once no caminho da requisição."""
+        self._last_attempt = time.time()
+        with httpx.Client(timeout=10) as client:
+            response = client.get(self.url)
+        self._apply(response)
+
+    def _refresh_once(self, seen: float) -> None:
+        """
+        Download bloqueante com um só em andamento: quem esperou pelo lock
+        enquanto outra thread baixava usa o conjunto que ela trouxe.
+        """
+        with self._download_lock:
+            if self._last_refresh != seen:
+                return
+            self.refresh_sync()
+
+    def _request_refresh(self) -> None:
+        """Acorda a task de renovação (chamado de qualquer thread)."""
+        if self._loop is None or self._wake is None:
+            return
+        if time.time() - self._last_attempt < RETRY_SECONDS:
+            return  # acabou de tentar; não martela o Google se ele estiver fora
+        with suppress(RuntimeError):  # loop já fechado (shutdown)
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def run_refresher(self) -> None:
+        """Loop de renovação: baixa, dorme até perto do vencimento (ou até ser acordado), repete."""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                await self.refresh()
+                delay = max(
+                    RETRY_SECONDS,
+                    self._expires_at - time.time() - self.refresh_margin_seconds
+                )
+            except Exception as e:
+                logger.warning("Erro ao atualizar certificados", extra={"fields": {"error": str(e)}})
+                delay = RETRY_SECONDS
+            self._wake.clear()
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), delay)
+
+    # =========================================================
+    # Consulta
+    # =========================================================
+    def get_cert(self, kid: Optional[str]) -> Optional[str]:
+        if not self._certs:
+            # Nada carregado ainda (sem a task do lifespan)
+            self._refresh_once(self._last_refresh)
+        elif time.time() >= self._expires_at:
+            # Vencido: o último conjunto continua valendo até a task renovar
+            self._request_refresh()
+
+        seen = self._last_refresh
+        cert = self._certs.get(kid)
+        if cert is None and time.time() - seen > MIN_FORCED_REFRESH_INTERVAL:
+            # Rotação de chaves: o Google publicou um kid novo antes do vencimento
+            self._refresh_once(seen)
+            cert = self._certs.get(kid)
+        return cert
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._certs),
+            "expires_in": max(0, int(self._expires_at - time.time())),
+            "last_refresh": self._last_refresh,
+            "stale": bool(self._certs) and time.time() >= self._expires_at,
+        }
+
+
+# Instância global
+google_certs = GoogleCertsKeyset(
+    url=settings.google_certs_url,
+    refresh_margin_seconds=settings.google_certs_refresh_margin_seconds,
+)
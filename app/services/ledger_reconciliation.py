@@ -0,0 +1,231 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import logging
+import uuid
+
+from google.cloud.firestore_v1 import FieldFilter
+
+from app.models.coins import LedgerDrift, LedgerSnapshot, ReconciliationReport
+from app.services.firebase_admin_svc import firestore_client
+
+logger = logging.getLogger(__name__)
+
+# =======================
+# Constantes
+# =======================
+# Cada página vira um batch com até PAGE_SIZE snapshots + o cursor;
+# o Firestore aceita no máximo 500 escritas por batch.
+PAGE_SIZE = 400
+CURSOR_DOC_ID = "cursor"
+# Cada execução volta esse intervalo antes do cursor. O created_at é
+# gerado no cliente antes do commit, então uma transação pode ficar visível
+# depois que o cursor já passou do seu horário; o Firestore encerra
+# transações em 270s, então o atraso não passa disso.
+CURSOR_OVERLAP_SECONDS = 300
+# Divergências guardadas no relatório; as demais só são contadas e logadas
+MAX_REPORTED_DRIFTS = 100
+
+
+class LedgerReconciler:
+    """
+    Reconciliação incremental de user_coins com coin_transactions.
+
+    Percorre as transações em ordem de (created_at, transaction_id) a partir
+    do último cursor salvo (menos CURSOR_OVERLAP_SECONDS) e acumula cada
+    página em snapshots por usuário (saldo recalculado + última transação
+    somada). As alterações de saldo de um usuário são serializadas pelo doc
+    de saldo, então a transação que já está no snapshot marca até onde o
+    intervalo revisitado já foi somado. Só uma página fica em memória por
+    vez, então o custo de memória não cresce com o tamanho da coleção.
+
+    Só os usuários tocados nesta execução são conferidos:
+      - ledger: o saldo recalculado tem que bater com o balance_after da
+        última transação somada (independe do que chegou durante a execução);
+      - user_coins: só quando a execução chega ao fim da coleção, o saldo
+        atual é comparado, pulando os usuários que movimentaram depois do
+        cursor (last_transaction_at mais novo que a última transação somada).
+    Um saldo alterado sem transação aparece na próxima movimentação do usuário.
+    """
+
+    def __init__(self, page_size: int = PAGE_SIZE):
+        self.db = firestore_client()
+        self.page_size = page_size
+        self.transactions_ref = self.db.collection("coin_transactions")
+        self.users_coins_ref = self.db.collection("user_coins")
+        self.snapshots_ref = self.db.collection("ledger_snapshots")
+        self.state_ref = self.db.collection("ledger_reconciliation").document(CURSOR_DOC_ID)
+
+    # =========================================================
+    # Cursor global
+    # =========================================================
+    def _load_cursor(self) -> tuple[Optional[datetime], Optional[str]]:
+        doc = self.state_ref.get()
+        if not doc.exists:
+            return None, None
+        data = doc.to_dict()
+        return data.get("last_created_at"), data.get("last_transaction_id")
+
+    def _page(self, cursor_created_at, cursor_transaction_id) -> List[dict]:
+        query = (
+            self.transactions_ref
+            .order_by("created_at")
+            .order_by("transaction_id")
+        )
+        if cursor_created_at is None:
+            pass
+        elif cursor_transaction_id is None:
+            # Primeira página: revisita o intervalo de sobreposição
+            query = query.start_after([cursor_created_at - timedelta(seconds=CURSOR_OVERLAP_SECONDS)])
+        else:
+            query = query.start_after([cursor_created_at, cursor_transaction_id])
+        return [doc.to_dict() for doc in query.limit(self.page_size).stream()]
+
+    # =========================================================
+    # Execução
+    # =========================================================
+    async def run(self, max_pages: Optional[int] = None) -> ReconciliationReport:
+        """Processa as transações novas desde a última execução e reporta drift."""
+        report = ReconciliationReport(run_id=str(uuid.uuid4()))
+        cursor_created_at, cursor_transaction_id = self._load_cursor()
+        page_cursor = (cursor_created_at, None)
+
+        while max_pages is None or report.pages < max_pages:
+            page = self._page(*page_cursor)
+            if not page:
+                report.reached_head = True
+                break
+
+            last = page[-1]
+            page_cursor = (last["created_at"], last["transaction_id"])
+            # O intervalo revisitado não recua o cursor salvo
+            if cursor_created_at is None or page_cursor > (cursor_created_at, cursor_transaction_id):
+                cursor_created_at, cursor_transaction_id = page_cursor
+
+            report.transactions_processed += self._fold_page(
+                page, report.run_id, (cursor_created_at, cursor_transaction_id)
+            )
+            report.pages += 1
+
+            if len(page) < self.page_size:
+                report.reached_head = True
+                break
+
+        report.cursor_created_at = cursor_created_at
+        report.cursor_transaction_id = cursor_transaction_id
+        self._check_drift(report)
+        return report
+
+    def _fold_page(self, page: List[dict], run_id: str, cursor: tuple) -> int:
+        """
+        Soma a página nos snapshots e grava tudo + cursor em um único batch.
+        Retorna quantas transações eram novas (o resto já estava somado).
+        """
+        deltas: Dict[str, List[dict]] = {}
+        for tx in page:
+            deltas.setdefault(tx["user_id"], []).append(tx)
+
+        refs = [self.snapshots_ref.document(user_id) for user_id in deltas]
+        existing = {
+            doc.id: LedgerSnapshot(**doc.to_dict())
+            for doc in self.db.get_all(refs)
+            if doc.exists
+        }
+
+        batch = self.db.batch()
+        folded = 0
+        for ref, (user_id, txs) in zip(refs, deltas.items()):
+            snapshot = existing.get(user_id) or LedgerSnapshot(user_id=user_id)
+            if snapshot.last_created_at is not None:
+                seen = (snapshot.last_created_at, snapshot.last_transaction_id)
+                txs = [tx for tx in txs if (tx["created_at"], tx["transaction_id"]) > seen]
+            if not txs:
+                continue
+            folded += len(txs)
+            snapshot.computed_balance += sum(tx["amount"] for tx in txs)
+            snapshot.transactions_count += len(txs)
+            snapshot.last_created_at = txs[-1]["created_at"]
+            snapshot.last_transaction_id = txs[-1]["transaction_id"]
+            snapshot.last_balance_after = txs[-1].get("balance_after")
+            snapshot.last_run_id = run_id
+            snapshot.updated_at = datetime.utcnow()
+            batch.set(ref, snapshot.model_dump())
+
+        batch.set(self.state_ref, {
+            "last_created_at": cursor[0],
+            "last_transaction_id": cursor[1],
+            "updated_at": datetime.utcnow(),
+        })
+        batch.commit()
+        return folded
+
+    def _check_drift(self, report: ReconciliationReport) -> None:
+        """Confere, página a página, os snapshots tocados nesta execução."""
+        last_user_id = None
+
+        while True:
+            query = (
+                self.snapshots_ref
+                .where(filter=FieldFilter("last_run_id", "==", report.run_id))
+                .order_by("user_id")
+                .limit(self.page_size)
+            )
+            if last_user_id is not None:
+                query = query.start_after([last_user_id])
+            snapshots = [LedgerSnapshot(**doc.to_dict()) for doc in query.stream()]
+            if not snapshots:
+                break
+
+            stored = {}
+            if report.reached_head:
+                refs = [self.users_coins_ref.document(s.user_id) for s in snapshots]
+                stored = {doc.id: doc.to_dict() for doc in self.db.get_all(refs) if doc.exists}
+
+            for snapshot in snapshots:
+                for drift in self._snapshot_drifts(snapshot, stored, report):
+                    self._report_drift(report, drift)
+
+            report.users_touched += len(snapshots)
+            last_user_id = snapshots[-1].user_id
+            if len(snapshots) < self.page_size:
+                break
+
+    def _report_drift(self, report: ReconciliationReport, drift: LedgerDrift) -> None:
+        report.drifts_found += 1
+        logger.warning("Divergência no ledger", extra={"fields": drift.model_dump()})
+        if len(report.drifts) < MAX_REPORTED_DRIFTS:
+            report.drifts.append(drift)
+
+    def _snapshot_drifts(self, snapshot: LedgerSnapshot, stored: Dict[str, dict],
+                         report: ReconciliationReport) -> List[LedgerDrift]:
+        drifts = []
+        if (
+            snapshot.last_balance_after is not None
+            and snapshot.last_balance_after != snapshot.computed_balance
+        ):
+            drifts.append(LedgerDrift(
+                user_id=snapshot.user_id,
+                stored_balance=snapshot.last_balance_after,
+                computed_balance=snapshot.computed_balance,
+                difference=snapshot.last_balance_after - snapshot.computed_balance,
+                source="ledger"
+            ))
+
+        if not report.reached_head:
+            return drifts
+
+        user_coins = stored.get(snapshot.user_id) or {}
+        last_transaction_at = user_coins.get("last_transaction_at")
+        if last_transaction_at and snapshot.last_created_at and last_transaction_at > snapshot.last_created_at:
+            # Movimentou depois do cursor: a transação entra na próxima execução
+            report.users_pending += 1
+            return drifts
+
+        balance = user_coins.get("balance")
+        if balance != snapshot.computed_balance:
+            drifts.append(LedgerDrift(
+                user_id=snapshot.user_id,
+                stored_balance=balance,
+                computed_balance=snapshot.computed_balance,
+                difference=(balance or 0) - snapshot.computed_balance
+            ))
+        return drifts
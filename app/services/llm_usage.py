@@ -0,0 +1,197 @@
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.core.container import container
+from app.services.firebase_admin_svc import firestore_client
+
+logger = logging.getLogger(__name__)
+
+# Contadores somados por chamada ao LLM
+FIELDS = ("calls", "prompt_tokens", "cached_tokens", "completion_tokens", "cost_usd")
+
+# Limite de escritas de um batch do Firestore
+BATCH_SIZE = 450
+
+
+def _model_key(model: str) -> str:
+    """Nome do modelo como chave de mapa no Firestore (sem '/' nem '.')."""
+    return model.replace("/", "__").replace(".", "_")
+
+
+class LlmUsageRecorder:
+    """
+    Consumo de tokens e custo do LLM por usuário, história e modelo.
+
+    Cada geração soma nos contadores em memória; um flusher periódico
+    grava os deltas com Increment (sem ler antes) em:
+      - llm_usage/user_<uid>   totais do usuário e por modelo
+      - llm_usage/model_<key>  totais do modelo
+      - stories/<id>.usage     totais da história
+    Se um batch do flush falhar, os deltas dele e dos seguintes voltam
+    para a memória e saem no próximo.
+    """
+
+    def __init__(self, flush_interval: float, db=None):
+        self.db = db or firestore_client()
+        self.usage_ref = self.db.collection("llm_usage")
+        self.stories_ref = self.db.collection("stories")
+        self.flush_interval = flush_interval
+        self._users: Dict[str, Dict[str, Counter]] = defaultdict(lambda: defaultdict(Counter))
+        self._stories: Dict[str, Counter] = defaultdict(Counter)
+        self._models: Dict[str, Counter] = defaultdict(Counter)
+        # Totais desde o início do processo, para /health/metrics
+        self._totals: Dict[str, Counter] = defaultdict(Counter)
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.flush_errors = 0
+
+    # =========================================================
+    # Registro (chamado a cada resposta do LLM)
+    # =========================================================
+    @staticmethod
+    def _delta(usage: dict) -> Counter:
+        return Counter({
+            "calls": usage.get("calls", 1),
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "cached_tokens": usage.get("cached_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "cost_usd": usage.get("cost_usd", 0.0),
+        })
+
+    def record(self, uid: str, story_id: Optional[str], usage: Optional[dict]) -> None:
+        """
+        Soma uma chamada. Sem story_id (a história ainda não existe) só
+        usuário e modelo são contados; a história entra por record_story.
+        """
+        if not usage:
+            return
+        model = usage.get("model", "desconhecido")
+        delta = self._delta(usage)
+        self._users[uid][model].update(delta)
+        if story_id:
+            self._stories[story_id].update(delta)
+        self._models[model].update(delta)
+        self._totals[model].update(delta)
+
+    def record_story(self, story_id: str, usage: Optional[dict]) -> None:
+        """Atribui à história um consumo já contado para usuário e modelo."""
+        if usage:
+            self._stories[story_id].update(self._delta(usage))
+
+    # =========================================================
+    # Flush
+    # =========================================================
+    def _take(self) -> tuple:
+        pending = (self._users, self._stories, self._models)
+        self._users = defaultdict(lambda: defaultdict(Counter))
+        self._stories = defaultdict(Counter)
+        self._models = defaultdict(Counter)
+        return pending
+
+    def _writes(self, pending: tuple) -> list:
+        """Uma escrita por documento: (ref, dados, origem, chave, contadores)."""
+        from google.cloud.firestore import Increment
+
+        def increments(counter: Counter) -> dict:
+            return {field: Increment(counter[field]) for field in FIELDS if counter[field]}
+
+        users, stories, models = pending
+        now = datetime.now(timezone.utc)
+        writes = []
+        for uid, by_model in users.items():
+            total = sum(by_model.values(), Counter())
+            writes.append((self.usage_ref.document(f"user_{uid}"), {
+                "uid": uid,
+                **increments(total),
+                "models": {_model_key(model): increments(counter) for model, counter in by_model.items()},
+                "updated_at": now,
+            }, "user", uid, by_model))
+        for model, counter in models.items():
+            writes.append((self.usage_ref.document(f"model_{_model_key(model)}"), {
+                "model": model,
+                **increments(counter),
+                "updated_at": now,
+            }, "model", model, counter))
+        for story_id, counter in stories.items():
+            writes.append((self.stories_ref.document(story_id), {"usage": increments(counter)}, "story", story_id, counter))
+        return writes
+
+    def _restore(self, writes: list) -> None:
+        for _, _, origin, key, counters in writes:
+            if origin == "user":
+                for model, counter in counters.items():
+                    self._users[key][model].update(counter)
+            elif origin == "model":
+                self._models[key].update(counters)
+            else:
+                self._stories[key].update(counters)
+
+    def _commit(self, writes: list) -> None:
+        batch = self.db.batch()
+        for ref, data, *_ in writes:
+            batch.set(ref, data, merge=True)
+        batch.commit()
+
+    async def flush(self) -> None:
+        pending = self._take()
+        if not any(pending):
+            return
+        writes = self._writes(pending)
+        for start in range(0, len(writes), BATCH_SIZE):
+            try:
+                await asyncio.to_thread(self._commit, writes[start:start + BATCH_SIZE])
+            except Exception as e:
+                # Cada batch é atômico: os anteriores já foram gravados e
+                # só o que falta volta para a memória
+                self.flush_errors += 1
+                self._restore(writes[start:])
+                logger.warning("Erro ao gravar consumo do LLM", extra={"fields": {"error": str(e)}})
+                return
+        self.flushes += 1
+
+    async def _flusher(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    # =========================================================
+    # Ciclo de vida (lifespan)
+    # =========================================================
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._flusher())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()  # não perde o que ainda está em memória
+
+    def stats(self) -> dict:
+        return {
+            "flush_interval": self.flush_interval,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "pending_users": len(self._users),
+            "pending_stories": len(self._stories),
+            "models": {
+                model: {
+                    **{field: counter[field] for field in FIELDS},
+                    # Fração do prompt servida do cache do provedor
+                    "cache_hit_ratio": round(counter["cached_tokens"] / counter["prompt_tokens"], 3)
+                    if counter["prompt_tokens"] else 0.0,
+                }
+                for model, counter in self._totals.items()
+            },
+        }
+
+
+# Instância global
+llm_usage = container.register("llm_usage", lambda: LlmUsageRecorder(
+    flush_interval=settings.llm_usage_flush_seconds,
+))
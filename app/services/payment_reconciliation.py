@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from google.cloud.firestore_v1 import FieldFilter
+
+from app.models.coins import PaymentReconciliationReport
+from app.services.coins_service import coins_service
+from app.services.firebase_admin_svc import firestore_client
+from app.services.stripe_service import stripe_service
+
+logger = logging.getLogger(__name__)
+
+# Máximo permitido pela API de listagem do Stripe
+PAGE_SIZE = 100
+# Limite de valores em um filtro "in" do Firestore
+IN_QUERY_LIMIT = 30
+# Vida máxima de um checkout no Stripe (expires_at <= created + 24h): uma
+# sessão criada antes da marca ainda pode ser paga até esse tempo depois
+CHECKOUT_MAX_LIFETIME_SECONDS = 24 * 60 * 60
+# Sessões mais novas que isso ficam com o webhook (que pode estar na fila);
+# a próxima execução as revisita pela janela acima. O Stripe não informa
+# quando o checkout foi concluído, então conta a partir do created.
+RECENT_SESSION_GRACE_SECONDS = 10 * 60
+
+
+class StripePaymentReconciler:
+    """
+    Confere os checkouts concluídos no Stripe desde a última marca d'água
+    (menos a vida máxima de um checkout, para pegar sessões abertas antes
+    da última execução e pagas depois dela) contra as compras registradas
+    em coin_transactions e credita, pelo caminho idempotente de add_coins
+    (atômico por sessão), o que algum webhook perdido deixou para trás.
+    Sessões com metadata inválido nunca vão ser creditadas: ficam no
+    relatório (skipped) sem segurar a marca d'água.
+
+    As páginas do Stripe são lidas uma por vez (a próxima já é buscada
+    enquanto a atual é conferida), então a memória fica limitada a duas
+    páginas independentemente do volume.
+    """
+
+    def __init__(self, page_size: int = PAGE_SIZE, db=None):
+        self.db = db or firestore_client()
+        self.page_size = page_size
+        self.transactions_ref = self.db.collection("coin_transactions")
+        self.state_ref = self.db.collection("stripe_reconciliation").document("watermark")
+
+    # =========================================================
+    # Marca d'água (created do checkout mais recente já conferido)
+    # =========================================================
+    def _load_watermark(self) -> int:
+        doc = self.state_ref.get()
+        return int(doc.to_dict().get("created", 0)) if doc.exists else 0
+
+    def _save_watermark(self, created: int) -> None:
+        self.state_ref.set({"created": created, "updated_at": datetime.utcnow()})
+
+    # =========================================================
+    # Stripe
+    # =========================================================
+    async def _fetch_page(self, since: int, starting_after: Optional[str]):
+        params = {
+            "limit": self.page_size,
+            "status": "complete",
+            "created": {"gte": since},
+        }
+        if starting_after:
+            params["starting_after"] = starting_after
+        return await stripe_service.run(stripe_service.sdk.checkout.Session.list, **params)
+
+    # =========================================================
+    # Conferência
+    # =========================================================
+    def _credited_ids(self, session_ids: List[str]) -> set[str]:
+        docs = (
+            self.transactions_ref
+            .where(filter=FieldFilter("reference_id", "in", session_ids))
+            .stream()
+        )
+        return {doc.to_dict()["reference_id"] for doc in docs}
+
+    async def _reconcile_page(self, sessions: list, report: PaymentReconciliationReport) -> None:
+        paid = [s for s in sessions if s.get("payment_status") == "paid"]
+        report.sessions_paid += len(paid)
+        grace_start = time.time() - RECENT_SESSION_GRACE_SECONDS
+        recent = [s for s in paid if s["created"] > grace_start]
+        report.skipped_recent += len(recent)
+        paid = [s for s in paid if s["created"] <= grace_start]
+        if not paid:
+            return
+
+        ids = [s["id"] for s in paid]
+        chunks = [ids[i:i + IN_QUERY_LIMIT] for i in range(0, len(ids), IN_QUERY_LIMIT)]
+        results = await asyncio.gather(*(
+            asyncio.to_thread(self._credited_ids, chunk) for chunk in chunks
+        ))
+        credited = set().union(*results)
+        report.already_credited += len(credited)
+
+        for session in paid:
+            if session["id"] in credited:
+                continue
+            metadata = session.get("metadata") or {}
+            if not metadata.get("user_id") or not str(metadata.get("coins", "")).isdigit():
+                # Erro permanente: repetir não resolve, então não prende a marca
+                report.skipped[session["id"]] = "metadata sem user_id/coins válidos"
+                logger.error("Compra paga sem metadata válido", extra={"fields": {
+                    "session_id": session["id"],
+                    "metadata": metadata,
+                }})
+                continue
+            try:
+                await coins_service.add_coins(
+                    user_id=metadata["user_id"],
+                    amount=int(metadata["coins"]),
+                    transaction_type="purchase",
+                    description=f"Compra de {metadata.get('package_name', 'Pacote')} (reconciliação)",
+                    reference_id=session["id"]
+                )
+                report.credited.append(session["id"])
+                logger.warning("Compra sem crédito reconciliada", extra={"fields": {
+                    "session_id": session["id"],
+                    "user_id": metadata["user_id"],
+                    "coins": metadata["coins"],
+                }})
+            except Exception as e:
+                report.errors[session["id"]] = str(e)
+
+    # =========================================================
+    # Execução
+    # =========================================================
+    async def run(self, since: Optional[int] = None) -> PaymentReconciliationReport:
+        watermark = self._load_watermark() if since is None else since
+        report = PaymentReconciliationReport(watermark_start=watermark, watermark_end=watermark)
+        # Revisita a janela em que sessões já vistas ainda podiam ser pagas;
+        # o que já foi creditado sai barato (uma consulta "in" por página)
+        lookback = max(0, watermark - CHECKOUT_MAX_LIFETIME_SECONDS) if since is None else since
+
+        next_page = asyncio.create_task(self._fetch_page(lookback, None))
+        while next_page is not None:
+            page = await next_page
+            sessions = [s.to_dict() for s in page.data]
+
+            # Já busca a próxima página enquanto confere esta
+            next_page = None
+            if page.has_more and sessions:
+                next_page = asyncio.create_task(self._fetch_page(lookback, sessions[-1]["id"]))
+
+            report.pages += 1
+            report.sessions_seen += len(sessions)
+            if sessions:
+                report.watermark_end = max(report.watermark_end, *(s["created"] for s in sessions))
+            await self._reconcile_page(sessions, report)
+
+        # Só avança a marca se tudo foi creditado; senão a próxima execução
+        # revisita o intervalo (add_coins é idempotente)
+        if not report.errors and report.watermark_end > watermark:
+            self._save_watermark(report.watermark_end)
+
+        return report
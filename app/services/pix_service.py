@@ -1,15 +1,109 @@
+import io
 import os
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Optional
+
+from app.models.coins import CoinPackage
+
+# =========================================================
+# CRC16-CCITT (polinômio 0x1021, valor inicial 0xFFFF)
+# =========================================================
+def _build_crc16_table() -> list[int]:
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return table
+
+_CRC16_TABLE = _build_crc16_table()
+
+
+def crc16_ccitt(data: bytes) -> str:
+    """CRC exigido pelo BR Code, em 4 dígitos hexadecimais maiúsculos."""
+    crc = 0xFFFF
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC16_TABLE[((crc >> 8) ^ byte) & 0xFF]
+    return f"{crc:04X}"
+
+
+# =========================================================
+# TLV (EMV Merchant Presented QR)
+# =========================================================
+def _tlv(tag: str, value: str) -> str:
+    if len(value) > 99:
+        raise ValueError(f"Campo {tag} excede 99 caracteres")
+    return f"{tag}{len(value):02d}{value}"
+
+
+def _normalize(text: str, max_len: int) -> str:
+    """Remove acentos e caracteres fora do ASCII e corta no limite do campo."""
+    ascii_text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return ascii_text.strip()[:max_len]
+
+
+def _sanitize_txid(txid: str) -> str:
+    # txid aceita só [A-Za-z0-9], até 25 caracteres; "***" = sem identificador
+    cleaned = re.sub(r"[^A-Za-z0-9]", "", txid)[:25]
+    return cleaned or "***"
+
 
 class PixService:
     def __init__(self):
         self.pix_key = os.getenv("PIX_KEY")
         self.merchant = os.getenv("PIX_MERCHANT", "Doação")
         self.city = os.getenv("PIX_CITY", "GOIANIA")
+        self.txid_template = os.getenv("PIX_TXID_TEMPLATE", "RPG{package_id}")
+
+        # Payloads e PNGs dependem só de (valor, txid): cache por instância
+        self._payload_cache = lru_cache(maxsize=1024)(self._build_payload)
+        self._qrcode_cache = lru_cache(maxsize=256)(self._render_qrcode)
 
     def get_pix_key(self):
         return self.pix_key
 
+    def _build_payload(self, amount_cents: int, txid: str) -> str:
+        merchant_account = _tlv("00", "br.gov.bcb.pix") + _tlv("01", self.pix_key or "")
+
+        payload = (
+            _tlv("00", "01")
+            + _tlv("26", merchant_account)
+            + _tlv("52", "0000")
+            + _tlv("53", "986")
+        )
+        if amount_cents > 0:
+            payload += _tlv("54", f"{amount_cents / 100:.2f}")
+        payload += (
+            _tlv("58", "BR")
+            + _tlv("59", _normalize(self.merchant, 25))
+            + _tlv("60", _normalize(self.city, 15))
+            + _tlv("62", _tlv("05", txid))
+            + "6304"
+        )
+        return payload + crc16_ccitt(payload.encode("utf-8"))
+
+    def build_payload(self, amount: float = 0.0, txid: Optional[str] = None) -> str:
+        """BR Code (copia e cola) para o valor e txid informados."""
+        return self._payload_cache(round(amount * 100), _sanitize_txid(txid or "***"))
+
     def generate_static_payload(self):
-        # Payload PIX estático simples
-        payload = f"00020126360014BR.GOV.BCB.PIX0114{self.pix_key}52040000530398654040.005802BR5913{self.merchant}6009{self.city}62070503***6304"
-        return payload
+        # Payload PIX estático, sem valor definido
+        return self.build_payload()
+
+    def payload_for_package(self, package: CoinPackage) -> str:
+        txid = self.txid_template.format(package_id=package.package_id)
+        return self.build_payload(package.price_brl, txid)
+
+    def _render_qrcode(self, payload: str) -> bytes:
+        # Import tardio: só quem gera PNG paga o custo de carregar o qrcode/PIL
+        import qrcode
+
+        buffer = io.BytesIO()
+        qrcode.make(payload, box_size=8, border=2).save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def qrcode_png(self, payload: str) -> bytes:
+        return self._qrcode_cache(payload)
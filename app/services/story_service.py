@@ -1,10 +1,21 @@
 from uuid import uuid4
 from datetime import datetime
+from app.core.cancellation import timeout
+from app.core.config import settings
+from app.core.container import container
+from app.core.circuit_breaker import firestore_breaker, guarded_methods
+from app.core.tracing import traced_methods
 from app.services.firebase_admin_svc import firestore_client
 
+@guarded_methods(firestore_breaker)
+@traced_methods("firestore.stories", **{"db.system": "firestore"})
 class StoryService:
-    def __init__(self):
-        self.db = firestore_client()
+    def __init__(self, db=None):
+        self.db = db or firestore_client()
+
+    def _timeout(self):
+        # Timeout padrão das chamadas, encurtado pelo prazo da requisição
+        return timeout(settings.firestore_timeout_seconds)
 
     def new_story(self, uid, theme, character):
         story_id = str(uuid4())
@@ -19,7 +30,7 @@ class StoryService:
             "current_step_id": None,
         }
 
-        self.db.collection("stories").document(story_id).set(story_data)
+        self.db.collection("stories").document(story_id).set(story_data, timeout=self._timeout())
         return story_id
 
     def add_step(
@@ -28,7 +39,9 @@ class StoryService:
          index: int,
          text: str,
          choices: list,
-         state: dict | None = None  # 🔥 PARÂMETRO ADICIONADO
+         state: dict | None = None,  # 🔥 PARÂMETRO ADICIONADO
+         usage: dict | None = None,  # tokens e custo da geração deste passo
+         job_id: str | None = None  # job de geração que gravou o passo
         ):
         step_id = str(uuid4())
         step_data = {
@@ -38,25 +51,49 @@ class StoryService:
              "text": text,
              "choices": choices,
              "state": state or {},  # 🔥 SALVANDO STATE
+             "usage": usage,
+             "job_id": job_id,
              "created_at": datetime.utcnow(),
         }
 
-        self.db.collection("stories").document(story_id).collection("steps").document(step_id).set(step_data)
+        self.db.collection("stories").document(story_id).collection("steps").document(step_id).set(step_data, timeout=self._timeout())
         self.db.collection("stories").document(story_id).update({
             "current_step_id": step_id,
             "updated_at": datetime.utcnow()
-        })
+        }, timeout=self._timeout())
 
         return step_id
 
     def get_story(self, story_id):
-        doc = self.db.collection("stories").document(story_id).get()
+        doc = self.db.collection("stories").document(story_id).get(timeout=self._timeout())
         return doc.to_dict() if doc.exists else None
 
+    def job_step(self, story_id, job_id):
+        """O passo gravado pelo job de geração, se houver."""
+        steps_ref = self.db.collection("stories").document(story_id).collection("steps")
+        docs = steps_ref.where("job_id", "==", job_id).limit(1).get(timeout=self._timeout())
+        return docs[0].to_dict() if docs else None
+
     def get_step(self, story_id, step_id):
-        doc = self.db.collection("stories").document(story_id).collection("steps").document(step_id).get()
+        doc = self.db.collection("stories").document(story_id).collection("steps").document(step_id).get(timeout=self._timeout())
         return doc.to_dict() if doc.exists else None
 
+    def get_current_steps(self, stories):
+        """Passo atual de várias histórias em uma única chamada (get_all)."""
+        refs = [
+            self.db.collection("stories").document(story["story_id"])
+                   .collection("steps").document(story["current_step_id"])
+            for story in stories if story.get("current_step_id")
+        ]
+        if not refs:
+            return {}
+        steps = {}
+        for doc in self.db.get_all(refs, timeout=self._timeout()):
+            if doc.exists:
+                step = doc.to_dict()
+                steps[step["story_id"]] = step
+        return steps
+
     def choose(self, story_id, step_id, choice_index):
         """Marca uma escolha no passo atual"""
         step_ref = self.db.collection("stories").document(story_id)\
@@ -65,27 +102,32 @@ class StoryService:
         step_ref.update({
             "chosen_choice": choice_index,  # 🔥 SALVA QUAL ESCOLHA FOI FEITA
             "chosen_at": datetime.utcnow()
-        })
+        }, timeout=self._timeout())
         
         # Atualiza o timestamp da história
         self.db.collection("stories").document(story_id).update({
             "updated_at": datetime.utcnow()
-        })
+        }, timeout=self._timeout())
 
     def recent_history(self, story_id, k=10):
         steps_ref = self.db.collection("stories").document(story_id).collection("steps")
         query = steps_ref.order_by("index").limit_to_last(k)
-        return [doc.to_dict() for doc in query.get()]
+        return [doc.to_dict() for doc in query.get(timeout=self._timeout())]
 
     def list_user_stories(self, uid, limit=50):
         query = self.db.collection("stories").where("owner_uid", "==", uid)\
                       .order_by("created_at", direction="DESCENDING").limit(limit)
-        return [doc.to_dict() for doc in query.stream()]
+        return [doc.to_dict() for doc in query.stream(timeout=self._timeout())]
   
     def list_steps(self, story_id):
+        return list(self.iter_steps(story_id))
+
+    def iter_steps(self, story_id):
+        """Passos em ordem, lidos conforme o stream do Firestore avança."""
         steps_ref = self.db.collection("stories").document(story_id).collection("steps")
         query = steps_ref.order_by("index")
-        return [doc.to_dict() for doc in query.stream()]
+        for doc in query.stream(timeout=self._timeout()):
+            yield doc.to_dict()
 
 
-S = StoryService()
\ No newline at end of file
+S = container.register("story_service", StoryService)
\ No newline at end of file
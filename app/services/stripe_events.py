@@ -0,0 +1,276 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.container import container
+from app.services.coins_service import coins_service
+from app.services.firebase_admin_svc import firestore_client
+from app.services.stripe_service import stripe_service
+
+logger = logging.getLogger(__name__)
+
+# Intervalo da varredura que recupera eventos pendentes (retries e restarts)
+POLL_INTERVAL_SECONDS = 15
+# Backoff entre tentativas: 5s, 10s, 20s, 40s...
+RETRY_BASE_SECONDS = 5
+# Prazo de um evento em `processing`; vencido, o worker é dado como perdido
+# (cancelado no meio, processo morto) e o evento volta para a fila
+PROCESSING_LEASE_SECONDS = 120
+
+EventHandler = Callable[[dict], Awaitable[None]]
+
+
+# =========================================================
+# Handlers por tipo de evento
+# =========================================================
+async def handle_checkout_completed(event: dict) -> None:
+    session = event["data"]["object"]
+
+    # Só processa se pagamento foi confirmado
+    if session.get("payment_status") != "paid":
+        logger.info("Pagamento não confirmado", extra={"fields": {
+            "session_id": session.get("id"),
+            "payment_status": session.get("payment_status"),
+        }})
+        return
+
+    metadata = session.get("metadata") or {}
+    user_id = metadata.get("user_id")
+    coins = metadata.get("coins")
+    package_name = metadata.get("package_name", "Pacote")
+
+    if not user_id:
+        raise ValueError("user_id não encontrado no metadata")
+    if not coins:
+        raise ValueError("coins não encontrado no metadata")
+
+    updated_coins = await coins_service.add_coins(
+        user_id=user_id,
+        amount=int(coins),
+        transaction_type="purchase",
+        description=f"Compra de {package_name}",
+        reference_id=session["id"]  # Usa session ID como reference
+    )
+
+    # A sessão paga não pode ser reaproveitada num próximo clique em "Comprar"
+    if metadata.get("package_id"):
+        stripe_service.forget_checkout_session(user_id, metadata["package_id"])
+
+    logger.info("Pagamento processado", extra={"fields": {
+        "event_id": event.get("id"),
+        "session_id": session["id"],
+        "user_id": user_id,
+        "coins": int(coins),
+        "new_balance": updated_coins.balance,
+    }})
+
+
+HANDLERS: Dict[str, EventHandler] = {
+    "checkout.session.completed": handle_checkout_completed,
+}
+
+
+class StripeEventQueue:
+    """
+    Fila de eventos do webhook do Stripe, persistida em `stripe_events`.
+
+    O webhook só grava o evento bruto (doc id = event.id, então duplicados
+    são descartados pelo próprio Firestore) e responde na hora. Um pool de
+    workers processa os eventos com retry e backoff; depois de
+    `max_attempts` falhas o evento vai para dead letter.
+    """
+
+    def __init__(self, workers: int, max_attempts: int, db=None):
+        self.db = db or firestore_client()
+        self.events_ref = self.db.collection("stripe_events")
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._queued: set[str] = set()
+        self._tasks: list[asyncio.Task] = []
+
+    # =========================================================
+    # Ingestão (chamado pelo webhook)
+    # =========================================================
+    async def enqueue(self, event_id: str, event_type: str, payload: bytes) -> bool:
+        """Persiste o evento. Retorna False se o event.id já foi recebido."""
+        from google.api_core.exceptions import AlreadyExists
+
+        now = datetime.now(timezone.utc)
+        try:
+            await asyncio.to_thread(self.events_ref.document(event_id).create, {
+                "event_id": event_id,
+                "type": event_type,
+                "payload": payload.decode("utf-8"),
+                "status": "pending",
+                "attempts": 0,
+                "last_error": None,
+                "received_at": now,
+                "next_attempt_at": now,
+            })
+        except AlreadyExists:
+            return False
+
+        self._push(event_id)
+        return True
+
+    def _push(self, event_id: str) -> None:
+        if event_id not in self._queued:
+            self._queued.add(event_id)
+            self._queue.put_nowait(event_id)
+
+    # =========================================================
+    # Processamento
+    # =========================================================
+    def _claim(self, event_id: str) -> Optional[dict]:
+        """
+        Assume o evento numa transação: só um worker (de qualquer processo)
+        o pega por vez, e o lease em next_attempt_at devolve à fila um
+        evento cujo worker sumiu no meio.
+        """
+        from google.cloud import firestore
+
+        ref = self.events_ref.document(event_id)
+
+        @firestore.transactional
+        def claim(transaction) -> Optional[dict]:
+            doc = ref.get(transaction=transaction)
+            if not doc.exists:
+                return None
+            data = doc.to_dict()
+            now = datetime.now(timezone.utc)
+            if data["status"] not in ("pending", "retry", "processing") or data["next_attempt_at"] > now:
+                return None
+            data["attempts"] = data.get("attempts", 0) + 1
+            transaction.update(ref, {
+                "status": "processing",
+                "attempts": data["attempts"],
+                "next_attempt_at": now + timedelta(seconds=PROCESSING_LEASE_SECONDS),
+            })
+            return data
+
+        return claim(self.db.transaction())
+
+    async def _process(self, event_id: str) -> None:
+        ref = self.events_ref.document(event_id)
+        data = await asyncio.to_thread(self._claim, event_id)
+        if data is None:
+            return
+
+        handler = HANDLERS.get(data["type"])
+        if handler is None:
+            await asyncio.to_thread(ref.update, {"status": "ignored"})
+            return
+
+        attempts = data["attempts"]
+        try:
+            await handler(json.loads(data["payload"]))
+        except asyncio.CancelledError:
+            # Shutdown no meio: o evento volta a pending e é retomado (add_coins
+            # é idempotente pelo session id, então repetir não credita duas vezes)
+            await asyncio.shield(asyncio.to_thread(ref.update, {
+                "status": "pending",
+                "attempts": attempts - 1,  # interrupção não conta como falha
+                "next_attempt_at": datetime.now(timezone.utc),
+            }))
+            raise
+        except Exception as e:
+            if attempts >= self.max_attempts:
+                status = "dead_letter"
+                logger.error("Evento do Stripe movido para dead letter", extra={"fields": {
+                    "event_id": event_id,
+                    "event_type": data["type"],
+                    "attempts": attempts,
+                    "error": str(e),
+                }})
+            else:
+                status = "retry"
+                logger.warning("Falha ao processar evento do Stripe", extra={"fields": {
+                    "event_id": event_id,
+                    "attempts": attempts,
+                    "error": str(e),
+                }})
+            delay = RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+            await asyncio.to_thread(ref.update, {
+                "status": status,
+                "last_error": str(e),
+                "next_attempt_at": datetime.now(timezone.utc) + timedelta(seconds=delay),
+            })
+            return
+
+        await asyncio.to_thread(ref.update, {
+            "status": "done",
+            "last_error": None,
+            "processed_at": datetime.now(timezone.utc),
+        })
+
+    async def _worker(self) -> None:
+        while True:
+            event_id = await self._queue.get()
+            self._queued.discard(event_id)
+            try:
+                await self._process(event_id)
+            except Exception:
+                logger.exception("Erro inesperado no worker de eventos", extra={"fields": {"event_id": event_id}})
+            finally:
+                self._queue.task_done()
+
+    def _due_event_ids(self) -> list[str]:
+        from google.cloud.firestore_v1 import FieldFilter
+
+        now = datetime.now(timezone.utc)
+        ids = []
+        # processing vencido: lease expirou (worker cancelado ou processo morto).
+        # Igualdade em status + intervalo em next_attempt_at usam o índice
+        # composto de firestore.indexes.json
+        for status in ("pending", "retry", "processing"):
+            docs = (
+                self.events_ref
+                .where(filter=FieldFilter("status", "==", status))
+                .where(filter=FieldFilter("next_attempt_at", "<=", now))
+                .limit(100)
+                .stream()
+            )
+            ids.extend(doc.id for doc in docs)
+        return ids
+
+    async def _poller(self) -> None:
+        """Reenfileira eventos vencidos: retries, leases expirados e o que ficou de um restart."""
+        while True:
+            try:
+                for event_id in await asyncio.to_thread(self._due_event_ids):
+                    self._push(event_id)
+            except Exception as e:
+                logger.warning("Erro ao buscar eventos pendentes", extra={"fields": {"error": str(e)}})
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+    # =========================================================
+    # Ciclo de vida (lifespan)
+    # =========================================================
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._poller()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+        }
+
+
+# Instância global
+stripe_event_queue = container.register("stripe_event_queue", lambda: StripeEventQueue(
+    workers=settings.stripe_webhook_workers,
+    max_attempts=settings.stripe_webhook_max_attempts,
+))
@@ -1,16 +1,123 @@
-import stripe
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import Optional
 from app.core.config import settings
+from app.core.container import container
+from app.core.tracing import traced, tracer
 from app.models.coins import CoinPackage
 
-# Configurar Stripe
-stripe.api_key = settings.stripe_secret_key
+
+def _load_stripe():
+    """Importa e configura o SDK do Stripe (import pesado, feito no primeiro uso)."""
+    import stripe
+
+    stripe.api_key = settings.stripe_secret_key
+    if settings.stripe_api_base:
+        stripe.api_base = settings.stripe_api_base
+    return stripe
+
 
 class StripeService:
     """Serviço para gerenciar pagamentos via Stripe"""
     
     def __init__(self):
         self.api_key = settings.stripe_secret_key
+        # O SDK do Stripe é síncrono: as chamadas rodam em um pool limitado
+        # para não travar o event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.stripe_executor_workers,
+            thread_name_prefix="stripe"
+        )
+        # (user_id, package_id) -> (expira_em, {"session_id", "checkout_url"}),
+        # em ordem de expiração (ver _remember_session)
+        self._open_sessions: dict[tuple[str, str], tuple[float, dict]] = {}
+        self._inflight: dict[tuple[str, str], asyncio.Future] = {}
+        self._sdk = None
+
+    @property
+    def sdk(self):
+        """Módulo `stripe` já configurado."""
+        if self._sdk is None:
+            self._sdk = _load_stripe()
+        return self._sdk
+
+    async def run(self, func, *args, **kwargs):
+        """Executa uma chamada bloqueante do SDK no pool do Stripe."""
+        loop = asyncio.get_running_loop()
+        name = getattr(func, "__qualname__", getattr(func, "__name__", "call"))
+        with tracer.start_as_current_span(f"stripe.{name}", attributes={"rpc.system": "stripe"}):
+            return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def get_or_create_checkout_session(
+        self,
+        package: CoinPackage,
+        user_id: str,
+        user_email: str
+    ) -> dict:
+        """
+        Reaproveita a sessão de checkout aberta para (usuário, pacote) se ela
+        foi criada há menos de STRIPE_CHECKOUT_REUSE_SECONDS e o Stripe
+        confirma que ainda está aberta; cliques repetidos em "Comprar" ao
+        mesmo tempo compartilham a mesma criação.
+        """
+        key = (user_id, package.package_id)
+        cached = self._open_sessions.get(key)
+        if cached and cached[0] > time.monotonic():
+            if await self._still_open(cached[1]["session_id"]):
+                return cached[1]
+            if self._open_sessions.get(key) is cached:
+                del self._open_sessions[key]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            data = await self.run(self.create_checkout_session, package, user_id, user_email)
+            self._remember_session(key, data)
+            future.set_result(data)
+            return data
+        except BaseException as e:
+            future.set_exception(e)
+            # Evita "exception was never retrieved" quando ninguém mais esperava
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def _remember_session(self, key: tuple[str, str], data: dict) -> None:
+        """
+        Guarda a sessão e descarta as vencidas. Todas vivem o mesmo tempo,
+        então a ordem de inserção é a de expiração: as vencidas estão
+        sempre no começo do dict.
+        """
+        now = time.monotonic()
+        self._open_sessions.pop(key, None)
+        self._open_sessions[key] = (now + settings.stripe_checkout_reuse_seconds, data)
+        while self._open_sessions:
+            oldest = next(iter(self._open_sessions))
+            if self._open_sessions[oldest][0] > now:
+                break
+            del self._open_sessions[oldest]
+
+    async def _still_open(self, session_id: str) -> bool:
+        """
+        O cache é de cada processo: a sessão pode ter sido paga (webhook
+        tratado em outro worker) ou expirada desde que entrou nele.
+        """
+        try:
+            session = await self.run(self.sdk.checkout.Session.retrieve, session_id)
+        except Exception:
+            return False  # na dúvida, uma sessão nova é sempre segura
+        return getattr(session, "status", None) == "open"
+
+    def forget_checkout_session(self, user_id: str, package_id: str) -> None:
+        """Descarta a sessão em cache (pagamento concluído)."""
+        self._open_sessions.pop((user_id, package_id), None)
     
     def create_checkout_session(
         self,
@@ -22,7 +129,7 @@ class StripeService:
         Cria uma sessão de checkout do Stripe
         """
         try:
-            session = stripe.checkout.Session.create(
+            session = self.sdk.checkout.Session.create(
                 payment_method_types=['card'],
                 line_items=[
                     {
@@ -59,10 +166,11 @@ class StripeService:
             print(f"[STRIPE] Erro ao criar checkout session: {e}")
             raise Exception(f"Erro ao criar sessão de pagamento: {str(e)}")
     
+    @traced("stripe.verify_webhook_signature")
     def verify_webhook_signature(self, payload: bytes, signature: str) -> dict:
         """Verifica a assinatura do webhook"""
         try:
-            event = stripe.Webhook.construct_event(
+            event = self.sdk.Webhook.construct_event(
                 payload,
                 signature,
                 settings.stripe_webhook_secret
@@ -77,5 +185,11 @@ class StripeService:
         return settings.stripe_publishable_key
 
 
+def _build_stripe_service() -> StripeService:
+    service = StripeService()
+    service.sdk  # o import do SDK acontece no warm-up, não no primeiro checkout
+    return service
+
+
 # Instância global
-stripe_service = StripeService()
\ No newline at end of file
+stripe_service = container.register("stripe_service", _build_stripe_service)
\ No newline at end of file
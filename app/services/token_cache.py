@@ -0,0 +1,127 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.core.config import settings
+
+# Vida máxima de um ID token do Firebase (as sessões nunca passam dela):
+# depois disso uma revogação não tem mais o que barrar
+REVOCATION_TTL_SECONDS = 3600
+
+
+class VerifiedTokenCache:
+    """
+    Cache LRU de ID tokens já verificados.
+
+    A chave é o SHA-256 do token (o token em si nunca fica em memória) e cada
+    entrada expira no `exp` do token menos uma folga. revoke_user (logout)
+    tira os tokens do usuário do cache e guarda o instante da revogação:
+    tokens emitidos antes dele (iat) são recusados por is_revoked até o
+    último deles expirar. A revogação vale para este processo; nos outros
+    o token morre no exp, e o refresh token já foi revogado no Firebase.
+    """
+
+    def __init__(self, max_entries: int, skew_seconds: int):
+        self.max_entries = max_entries
+        self.skew_seconds = skew_seconds
+        self._entries: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # uid -> instante da revogação
+        self._revoked: dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, decoded = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # Cada chamador recebe a sua cópia: mexer nas claims não altera o cache
+        return copy.deepcopy(decoded)
+
+    def put(self, token: str, decoded: dict) -> None:
+        exp = decoded.get("exp")
+        if not exp:
+            return
+        expires_at = float(exp) - self.skew_seconds
+        if expires_at <= time.time() or self.is_revoked(decoded):
+            return
+
+        key = self._key(token)
+        decoded = copy.deepcopy(decoded)
+        with self._lock:
+            self._entries[key] = (expires_at, decoded)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(self._key(token), None)
+
+    def revoke_user(self, uid: str) -> int:
+        """
+        Revoga os tokens do usuário emitidos até agora e os remove do
+        cache. Retorna quantos saíram do cache.
+        """
+        now = time.time()
+        with self._lock:
+            keys = [k for k, (_, d) in self._entries.items() if d.get("uid") == uid]
+            for k in keys:
+                del self._entries[k]
+            self._revoked[uid] = now
+            for other, revoked_at in list(self._revoked.items()):
+                if revoked_at < now - REVOCATION_TTL_SECONDS:
+                    del self._revoked[other]
+        return len(keys)
+
+    def is_revoked(self, claims: dict) -> bool:
+        """
+        Token (ID ou sessão) emitido antes de uma revogação do usuário. O iat
+        é em segundos inteiros: como no validSince do Firebase, um token do
+        mesmo segundo do logout (relogin logo em seguida) continua valendo.
+        """
+        revoked_at = self._revoked.get(claims.get("uid"))
+        return revoked_at is not None and claims.get("iat", 0) < int(revoked_at)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "revoked_users": len(self._revoked),
+        }
+
+
+# Instância global
+token_cache = VerifiedTokenCache(
+    max_entries=settings.token_cache_max_entries,
+    skew_seconds=settings.token_cache_skew_seconds,
+)
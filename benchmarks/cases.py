@@ -0,0 +1,165 @@
+"""
+Casos do benchmark. Cada caso é uma função que recebe o número de
+iterações e devolve quantas operações executou; o runner cuida do tempo.
+"""
+import asyncio
+import itertools
+import uuid
+from datetime import datetime, timezone
+
+from benchmarks.fakes import LLM_OUTPUTS, LLM_OUTPUTS_COMPACT, install_fake_firestore, install_fake_llm
+
+from app.models.coins import CoinTransaction
+from app.models.story import StepOut
+from app.services.ai_orchestrator import _build_messages, _extract_last_json_object, _parse_compact, _parse_json_strict
+
+CASES = {}
+
+
+def case(name: str):
+    def register(func):
+        CASES[name] = func
+        return func
+    return register
+
+
+# =========================================================
+# Parser da saída do LLM
+# =========================================================
+def _parser_case(name: str, func, text: str):
+    @case(name)
+    def run(iterations: int) -> int:
+        for _ in range(iterations):
+            func(text)
+        return iterations
+
+
+for _output_name in ("clean", "chatty", "braces_in_text", "deep_nesting"):
+    _parser_case(f"parse.extract_last_json.{_output_name}", _extract_last_json_object, LLM_OUTPUTS[_output_name])
+
+for _output_name, _text in LLM_OUTPUTS.items():
+    _parser_case(f"parse.json_strict.{_output_name}", _parse_json_strict, _text)
+
+for _output_name, _text in LLM_OUTPUTS_COMPACT.items():
+    _parser_case(f"parse.compact.{_output_name}", _parse_compact, _text)
+
+
+# =========================================================
+# Prompt
+# =========================================================
+_HISTORY = [
+    {
+        "index": i,
+        "text": "Você atravessa a ponte de cordas sobre o rio de lava. " * 4,
+        "choices": ["Correr", "Andar devagar", "Voltar"],
+        "chosen_choice": i % 3,
+        "state": {"player_hp": 10 - i % 5, "room_type": "ponte", "is_game_over": False},
+    }
+    for i in range(10)
+]
+
+
+@case("prompt.build.history_10")
+def prompt_build(iterations: int) -> int:
+    for _ in range(iterations):
+        _build_messages("Masmorra do dragão", "Ladino meio-elfo", _HISTORY)
+    return iterations
+
+
+@case("prompt.build.empty_history")
+def prompt_build_empty(iterations: int) -> int:
+    for _ in range(iterations):
+        _build_messages("Masmorra do dragão", "Ladino meio-elfo", [])
+    return iterations
+
+
+# =========================================================
+# Modelos pydantic
+# =========================================================
+_STEP = {
+    "story_id": str(uuid.uuid4()),
+    "step_id": str(uuid.uuid4()),
+    "index": 7,
+    "text": _HISTORY[0]["text"],
+    "choices": _HISTORY[0]["choices"],
+    "created_at": datetime.now(timezone.utc),
+    "state": _HISTORY[0]["state"],
+}
+
+_TRANSACTION = {
+    "transaction_id": str(uuid.uuid4()),
+    "user_id": "bench_user",
+    "amount": -5,
+    "balance_after": 195,
+    "transaction_type": "debit",
+    "description": "Escolha na história: Correr",
+    "reference_id": _STEP["story_id"],
+    "created_at": datetime.now(timezone.utc),
+}
+
+
+@case("models.step_out.validate")
+def step_out_validate(iterations: int) -> int:
+    for _ in range(iterations):
+        StepOut.model_validate(_STEP)
+    return iterations
+
+
+@case("models.coin_transaction.validate")
+def coin_transaction_validate(iterations: int) -> int:
+    for _ in range(iterations):
+        CoinTransaction.model_validate(_TRANSACTION)
+    return iterations
+
+
+# =========================================================
+# Fluxo completo pela app ASGI
+# =========================================================
+CHOICES_PER_STORY = 5
+_api_client = None
+_api_loop = None
+_api_db = None
+_api_user = {"uid": "bench_user", "email": "bench@example.com"}
+_uids = itertools.count()
+
+
+def _api():
+    """App com Firestore e LLM falsos, montada uma vez só."""
+    global _api_client, _api_loop, _api_db
+    if _api_client is None:
+        import httpx
+        from app.deps.auth import firebase_current_user
+        from app.main import app
+
+        _api_db = install_fake_firestore()
+        install_fake_llm()
+        app.dependency_overrides[firebase_current_user] = lambda: dict(_api_user)
+        _api_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+        _api_loop = asyncio.new_event_loop()
+    return _api_client
+
+
+async def _story_loop(stories: int) -> int:
+    client = _api()
+    requests = 0
+    for _ in range(stories):
+        # Banco limpo e usuário novo por história: o custo não cresce com as
+        # rodadas e o bônus inicial paga o loop inteiro
+        _api_db.data.clear()
+        _api_user["uid"] = f"bench_user_{next(_uids)}"
+        r = await client.post("/stories", json={"theme_prompt": "Masmorra do dragão", "character_prompt": "Ladino"})
+        r.raise_for_status()
+        story_id = r.json()["story_id"]
+        for _ in range(CHOICES_PER_STORY):
+            r = await client.post(f"/stories/{story_id}/choose", json={"choice_index": 0})
+            r.raise_for_status()
+        requests += 1 + CHOICES_PER_STORY
+    return requests
+
+
+@case("api.stories_choose_loop")
+def stories_choose_loop(iterations: int) -> int:
+    # Uma iteração é uma história inteira (1 criação + 5 escolhas); as
+    # operações contadas são requisições
+    _api()
+    return _api_loop.run_until_complete(_story_loop(iterations))
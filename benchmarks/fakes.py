@@ -0,0 +1,339 @@
+"""
+Fakes em memória para os benchmarks: Firestore (só o que os serviços
+usam) e a chamada ao LLM. Nada aqui abre conexão de rede.
+"""
+import copy
+import json
+import os
+import threading
+import uuid
+from itertools import cycle
+
+# Settings exige essas variáveis; valores falsos bastam para os benchmarks
+for _name, _value in {
+    "FIREBASE_PROJECT_ID": "bench-project",
+    "FIREBASE_API_KEY": "bench-key",
+    "STRIPE_SECRET_KEY": "sk_test_bench",
+    "STRIPE_PUBLISHABLE_KEY": "pk_test_bench",
+    "STRIPE_WEBHOOK_SECRET": "whsec_bench",
+    "RATE_LIMIT_LLM_PER_MINUTE": "1000000",
+    "RATE_LIMIT_READ_PER_MINUTE": "1000000",
+    "SESSION_TOKEN_SECRETS": "bench:bench-secret",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+
+# =========================================================
+# Firestore
+# =========================================================
+_OPS = {
+    "==": lambda v, x: v == x,
+    "!=": lambda v, x: v != x,
+    "<": lambda v, x: v is not None and v < x,
+    "<=": lambda v, x: v is not None and v <= x,
+    ">": lambda v, x: v is not None and v > x,
+    ">=": lambda v, x: v is not None and v >= x,
+    "in": lambda v, x: v in x,
+}
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.id = path[-1]
+
+    def get(self, *args, **kwargs):
+        return FakeSnapshot(self, self.db.data.get(self.path))
+
+    def set(self, data, merge=False, **kwargs):
+        if merge and self.path in self.db.data:
+            self.db.data[self.path].update(copy.deepcopy(data))
+        else:
+            self.db.data[self.path] = copy.deepcopy(data)
+
+    def create(self, data, **kwargs):
+        from google.api_core.exceptions import AlreadyExists
+
+        if self.path in self.db.data:
+            raise AlreadyExists(f"{'/'.join(self.path)} já existe")
+        self.db.data[self.path] = copy.deepcopy(data)
+
+    def update(self, data, **kwargs):
+        if self.path not in self.db.data:
+            raise KeyError("/".join(self.path))
+        self.db.data[self.path].update(copy.deepcopy(data))
+
+    def delete(self, **kwargs):
+        self.db.data.pop(self.path, None)
+
+    def collection(self, name):
+        return FakeCollection(self.db, self.path + (name,))
+
+
+class FakeQuery:
+    def __init__(self, collection, filters=(), orders=(), limit=None, to_last=False):
+        self.collection_ref = collection
+        self.filters = tuple(filters)
+        self.orders = tuple(orders)
+        self.limit_value = limit
+        self.to_last = to_last
+
+    def _copy(self, **changes):
+        fields = dict(
+            filters=self.filters, orders=self.orders,
+            limit=self.limit_value, to_last=self.to_last,
+        )
+        fields.update(changes)
+        return FakeQuery(self.collection_ref, **fields)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self.filters + ((field_path, op_string, value),))
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._copy(orders=self.orders + ((field, str(direction).upper().endswith("DESCENDING")),))
+
+    def limit(self, count):
+        return self._copy(limit=count, to_last=False)
+
+    def limit_to_last(self, count):
+        return self._copy(limit=count, to_last=True)
+
+    def stream(self, *args, **kwargs):
+        db, base = self.collection_ref.db, self.collection_ref.path
+        rows = [
+            (path, data) for path, data in db.data.items()
+            if len(path) == len(base) + 1 and path[:-1] == base
+            and all(_OPS[op](data.get(field), value) for field, op, value in self.filters)
+        ]
+        for field, descending in reversed(self.orders):
+            rows.sort(key=lambda row: row[1].get(field), reverse=descending)
+        if self.limit_value is not None:
+            rows = rows[-self.limit_value:] if self.to_last else rows[:self.limit_value]
+        return iter([FakeSnapshot(FakeDocument(db, path), copy.deepcopy(data)) for path, data in rows])
+
+    def get(self, *args, **kwargs):
+        return list(self.stream())
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        super().__init__(self)
+
+    def document(self, doc_id=None):
+        return FakeDocument(self.db, self.path + (doc_id or str(uuid.uuid4()),))
+
+
+class FakeBatch:
+    def __init__(self):
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(lambda: ref.set(data, merge=merge))
+
+    def update(self, ref, data):
+        self._ops.append(lambda: ref.update(data))
+
+    def delete(self, ref):
+        self._ops.append(ref.delete)
+
+    def commit(self):
+        for op in self._ops:
+            op()
+        self._ops = []
+
+
+class FakeTransaction(FakeBatch):
+    """
+    Transação para @firestore.transactional: serializa as transações do
+    banco com um lock (sem contenção, nunca aborta) e aplica as escritas
+    no commit.
+    """
+
+    _read_only = False
+    _max_attempts = 1
+
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+        self._id = None
+
+    def _clean_up(self):
+        self._ops = []
+
+    def _begin(self, retry_id=None):
+        self.db.lock.acquire()
+        self._id = uuid.uuid4().bytes
+
+    def _release(self):
+        if self._id is not None:
+            self._id = None
+            self.db.lock.release()
+
+    def create(self, ref, data):
+        self._ops.append(lambda: ref.create(data))
+
+    def _commit(self):
+        try:
+            self.commit()
+        finally:
+            self._release()
+        return []
+
+    def _rollback(self):
+        self._ops = []
+        self._release()
+
+
+class FakeFirestore:
+    """Cliente Firestore em memória: documentos num dict por caminho."""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.RLock()
+
+    def transaction(self, **kwargs):
+        return FakeTransaction(self)
+
+    def collection(self, name):
+        return FakeCollection(self, (name,))
+
+    def batch(self):
+        return FakeBatch()
+
+    def get_all(self, references, *args, **kwargs):
+        return [ref.get() for ref in references]
+
+
+# =========================================================
+# LLM
+# =========================================================
+def llm_output(index: int, game_over: bool = False) -> str:
+    """Resposta no formato do SYSTEM_PROMPT, do tamanho das reais."""
+    return json.dumps({
+        "text": (
+            f"Capítulo {index}. A tocha tremula enquanto você desce a escada de pedra. "
+            "Um cheiro de enxofre sobe das profundezas e, ao longe, correntes arrastam "
+            "no chão. Um goblin de olhos amarelos bloqueia a passagem estreita."
+        ),
+        "choices": [] if game_over else [
+            "Enfrentar o goblin com a espada",
+            "Tentar negociar a passagem",
+            "Procurar outro caminho pelas sombras",
+        ],
+        "state": {"player_hp": 0 if game_over else 8, "room_type": "caverna", "is_game_over": game_over},
+    }, ensure_ascii=False)
+
+
+# Saídas reais que o parser precisa aguentar
+LLM_OUTPUTS = {
+    "clean": llm_output(3),
+    "fenced": "```json\n" + llm_output(3) + "\n```",
+    "chatty": "Claro! Aqui está o próximo passo da aventura:\n\n" + llm_output(3) + "\n\nEspero que goste!",
+    "braces_in_text": json.dumps({
+        "text": "O mago desenha {runas} no ar e diz: \"}{ não é magia\". " * 6,
+        "choices": ["Copiar as {runas}", "Fugir"],
+        "state": {"player_hp": 7, "room_type": "torre", "is_game_over": False},
+    }, ensure_ascii=False),
+    "two_objects": '{"rascunho": true, "text": "ignorar"}\n' + llm_output(4),
+    "deep_nesting": "Pensando... " + "{" * 200 + "}" * 200 + " " + llm_output(5),
+}
+
+
+def llm_output_compact(index: int, game_over: bool = False) -> str:
+    """O mesmo passo de llm_output no formato do SYSTEM_PROMPT_COMPACT."""
+    step = json.loads(llm_output(index, game_over))
+    state = step["state"]
+    lines = [f"T: {step['text']}"]
+    lines += [f"C: {choice}" for choice in step["choices"]]
+    lines.append(f"S: {state['player_hp']}|{state['room_type']}|{int(state['is_game_over'])}")
+    return "\n".join(lines)
+
+
+LLM_OUTPUTS_COMPACT = {
+    "clean": llm_output_compact(3),
+    "game_over": llm_output_compact(9, game_over=True),
+    "wrapped_text": llm_output_compact(3).replace(". ", ".\n", 2),
+    "json_fallback": llm_output(3),
+}
+
+
+def install_fake_llm():
+    """Troca a chamada HTTP ao OpenRouter por respostas prontas (mesmo parser)."""
+    from app.services import ai_orchestrator
+
+    outputs = cycle([LLM_OUTPUTS["clean"], LLM_OUTPUTS["chatty"], LLM_OUTPUTS["fenced"]])
+
+    async def fake_chat_once(messages: list, current_hp: int = 10, **kwargs):
+        return ai_orchestrator._parse_json_strict(next(outputs), current_hp)
+
+    ai_orchestrator._chat_once = fake_chat_once
+
+
+def install_replay_llm(respond):
+    """
+    Mantém o _chat_once real (breaker, spans, parser) e troca só o HTTP:
+    `respond(payload) -> (conteúdo, usage, segundos)` decide a resposta do
+    "OpenRouter" e quanto ela demora.
+    """
+    import asyncio
+    import types
+
+    import httpx
+
+    from app.services import ai_orchestrator
+
+    async def handler(request):
+        content, usage, seconds = respond(json.loads(request.content))
+        await asyncio.sleep(seconds)
+        return httpx.Response(200, json={
+            "model": ai_orchestrator.MODEL,
+            "choices": [{"message": {"content": content}}],
+            "usage": usage,
+        })
+
+    class ReplayClient(httpx.AsyncClient):
+        def __init__(self, *args, **kwargs):
+            kwargs["transport"] = httpx.MockTransport(handler)
+            super().__init__(*args, **kwargs)
+
+    ai_orchestrator.httpx = types.SimpleNamespace(
+        AsyncClient=ReplayClient,
+        TimeoutException=httpx.TimeoutException,
+    )
+
+
+def install_fake_firestore() -> FakeFirestore:
+    """Aponta os singletons que usam o Firestore para um banco em memória."""
+    from app.services.coins_service import CoinsService, coins_service
+    from app.services.generation_jobs import GenerationJobQueue, generation_jobs
+    from app.services.llm_usage import LlmUsageRecorder, llm_usage
+    from app.services.story_service import S, StoryService
+
+    db = FakeFirestore()
+    S.override(StoryService(db=db))
+    coins_service.override(CoinsService(db=db))
+    llm_usage.override(LlmUsageRecorder(flush_interval=3600, db=db))
+    generation_jobs.override(GenerationJobQueue(workers=2, max_attempts=3, max_pending=50, job_timeout=60, db=db))
+    return db
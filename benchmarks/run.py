@@ -0,0 +1,110 @@
+"""
+Suíte de benchmarks dos caminhos quentes do motor de histórias.
+
+Uso (na raiz do repositório):
+    python -m benchmarks.run                    # compara com benchmarks/baseline.json
+    python -m benchmarks.run --update-baseline  # grava os números atuais como baseline
+    python -m benchmarks.run --only parse.      # só os casos com esse prefixo
+
+Cada caso roda em rodadas de pelo menos --min-time segundos; vale a
+melhor de --repeat rodadas, em operações por segundo (como o timeit: o
+ruído da máquina só deixa as rodadas mais lentas). Sai com código 1
+se algum caso ficar mais de --threshold (fração) abaixo da baseline;
+casos abaixo de 1 ms por operação oscilam mais entre execuções e usam
+--micro-threshold. Um caso que passa do limite é medido de novo
+--confirm vezes (com uma pausa entre elas) e só conta como regressão
+se continuar abaixo: uma lentidão passageira da máquina não derruba o CI.
+
+A baseline depende da máquina: grave uma nova ao trocar de ambiente.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.cases import CASES
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+# Acima disso (ops/s), cada operação leva menos de 1 ms
+MICRO_OPS_PER_SECOND = 1000
+# Pausa antes de cada nova medida de um caso suspeito
+CONFIRM_PAUSE_SECONDS = 1.0
+
+
+def measure(func, min_time: float, repeat: int) -> float:
+    """Operações por segundo (melhor de `repeat` rodadas calibradas)."""
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        func(iterations)
+        if time.perf_counter() - start >= min_time / 4 or iterations >= 1 << 22:
+            break
+        iterations *= 2
+
+    rates = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ops = func(iterations)
+        rates.append(ops / (time.perf_counter() - start))
+    return max(rates)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--micro-threshold", type=float, default=0.35)
+    parser.add_argument("--min-time", type=float, default=0.3)
+    parser.add_argument("--repeat", type=int, default=9)
+    parser.add_argument("--confirm", type=int, default=3)
+    parser.add_argument("--only", default="")
+    args = parser.parse_args()
+
+    # Os logs da app atrapalham a leitura dos números
+    logging.disable(logging.WARNING)
+
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    results, regressions = {}, []
+
+    print(f"{'caso':<44}{'ops/s':>14}{'baseline':>14}{'Δ':>9}")
+    for name, func in CASES.items():
+        if not name.startswith(args.only):
+            continue
+        rate = measure(func, args.min_time, args.repeat)
+
+        base = baseline.get(name)
+        if base:
+            threshold = args.micro_threshold if base >= MICRO_OPS_PER_SECOND else args.threshold
+            for _ in range(0 if args.update_baseline else args.confirm):
+                if rate / base - 1 >= -threshold:
+                    break
+                time.sleep(CONFIRM_PAUSE_SECONDS)
+                rate = max(rate, measure(func, args.min_time, args.repeat))
+            delta = rate / base - 1
+            flag = "  ❌" if delta < -threshold else ""
+            print(f"{name:<44}{rate:>14,.0f}{base:>14,.0f}{delta:>+9.1%}{flag}")
+            if flag:
+                regressions.append(name)
+        else:
+            print(f"{name:<44}{rate:>14,.0f}{'-':>14}{'':>9}")
+        results[name] = round(rate, 1)
+
+    if args.update_baseline:
+        BASELINE_PATH.write_text(json.dumps({**baseline, **results}, indent=2, sort_keys=True) + "\n")
+        print(f"\nBaseline gravada em {BASELINE_PATH}")
+        return 0
+
+    if regressions:
+        print(
+            f"\n{len(regressions)} regressão(ões) acima de {args.threshold:.0%} "
+            f"({args.micro_threshold:.0%} nos casos < 1 ms): {', '.join(regressions)}"
+        )
+        return 1
+    print("\nSem regressões.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Compara os formatos de saída do modelo (json x compact) com um stub de
+replay do OpenRouter: as mesmas respostas, nos dois formatos, passam pelo
+_chat_once real e demoram o que um modelo levaria para gerá-las
+(tempo até o primeiro token + tempo por token de saída).
+
+Uso (na raiz do repositório):
+    python -m benchmarks.wire_format
+    python -m benchmarks.wire_format --turns 50 --ttft-ms 300 --per-token-ms 12
+
+Sem o tiktoken instalado os tokens são aproximados (palavras e sequências
+de pontuação); a diferença entre os formatos é o que interessa.
+"""
+import argparse
+import asyncio
+import re
+import statistics
+import time
+
+from benchmarks.fakes import install_replay_llm, llm_output, llm_output_compact
+
+from app.services import ai_orchestrator
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except ImportError:  # opcional
+    _encoding = None
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]+")
+
+FORMATS = {
+    "json": llm_output,
+    "compact": llm_output_compact,
+}
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(_TOKEN_RE.findall(text))
+
+
+def turn_outputs(turns: int, render) -> list:
+    """Uma história inteira: a última resposta é o game over."""
+    return [render(i, game_over=(i == turns - 1)) for i in range(turns)]
+
+
+async def run_format(name: str, turns: int, ttft: float, per_token: float) -> dict:
+    outputs = turn_outputs(turns, FORMATS[name])
+    queue = iter(outputs)
+
+    def respond(payload):
+        content = next(queue)
+        tokens = count_tokens(content)
+        usage = {"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens}
+        return content, usage, ttft + tokens * per_token
+
+    install_replay_llm(respond)
+    messages, _ = ai_orchestrator._build_messages("Masmorra do dragão", "Ladino", [], output_format=name)
+
+    async def one():
+        start = time.perf_counter()
+        result = await ai_orchestrator._chat_once(messages, 10, output_format=name)
+        return time.perf_counter() - start, result
+
+    # Turnos em paralelo: cada um mede a própria latência
+    results = await asyncio.gather(*(one() for _ in range(turns)))
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "system_prompt_tokens": count_tokens(ai_orchestrator.SYSTEM_PROMPTS[name]),
+        "output_tokens": statistics.mean(result["usage"]["completion_tokens"] for _, result in results),
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "steps": [(r["text"], r["choices"], r["state"]) for _, r in results],
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--ttft-ms", type=float, default=250.0, help="tempo até o primeiro token")
+    parser.add_argument("--per-token-ms", type=float, default=10.0, help="tempo por token de saída")
+    args = parser.parse_args()
+
+    ttft, per_token = args.ttft_ms / 1000, args.per_token_ms / 1000
+    results = {name: asyncio.run(run_format(name, args.turns, ttft, per_token)) for name in FORMATS}
+
+    base = results["json"]
+    counting = "tiktoken o200k_base" if _encoding is not None else "aproximação (sem tiktoken)"
+    print(f"{args.turns} turnos, TTFT {args.ttft_ms:.0f} ms, {args.per_token_ms:.1f} ms/token, tokens por {counting}\n")
+    print(f"{'formato':<10}{'prompt sys':>12}{'tokens saída':>14}{'Δ':>8}{'p50 (ms)':>11}{'p95 (ms)':>11}{'Δ p50':>8}")
+    for name, r in results.items():
+        print(
+            f"{name:<10}{r['system_prompt_tokens']:>12}{r['output_tokens']:>14.1f}"
+            f"{(r['output_tokens'] / base['output_tokens'] - 1) * 100:>+7.1f}%"
+            f"{r['p50'] * 1000:>11.0f}{r['p95'] * 1000:>11.0f}"
+            f"{(r['p50'] / base['p50'] - 1) * 100:>+7.1f}%"
+        )
+
+    # Os dois formatos precisam virar exatamente os mesmos passos
+    if sorted(map(repr, results["compact"]["steps"])) != sorted(map(repr, base["steps"])):
+        print("\n❌ O formato compact não reproduz os mesmos passos do json")
+        return 1
+    print("\n✅ Mesmos passos nos dois formatos")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,10 @@
+import pytest
+
+# Antes de qualquer import de app.*: define as variáveis que Settings exige
+from benchmarks.fakes import install_fake_firestore
+
+
+@pytest.fixture
+def db():
+    """Firestore em memória com os singletons apontando para ele."""
+    return install_fake_firestore()
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from app.services.coins_service import INITIAL_BONUS_COINS, CoinsService, InsufficientBalanceError
+
+
+@pytest.mark.asyncio
+async def test_parallel_holds_never_overdraw(db):
+    coins = CoinsService(db=db)
+    results = await asyncio.gather(
+        *(coins.reserve_coins("u1", 30, "turno") for _ in range(10)),
+        return_exceptions=True,
+    )
+    holds = [r for r in results if not isinstance(r, Exception)]
+
+    assert len(holds) == INITIAL_BONUS_COINS // 30
+    assert all(isinstance(r, InsufficientBalanceError) for r in results if isinstance(r, Exception))
+
+    await asyncio.gather(*(coins.commit_hold(hold) for hold in holds))
+    # Confirmar de novo (retry) não debita duas vezes
+    await coins.commit_hold(holds[0])
+
+    assert (await coins.get_user_balance("u1")).balance == INITIAL_BONUS_COINS - 30 * len(holds)
+    assert await coins.get_available_balance("u1") == INITIAL_BONUS_COINS - 30 * len(holds)
+
+
+@pytest.mark.asyncio
+async def test_released_hold_returns_coins_and_cannot_be_committed(db):
+    coins = CoinsService(db=db)
+    hold = await coins.reserve_coins("u1", 50, "turno")
+    assert await coins.get_available_balance("u1") == INITIAL_BONUS_COINS - 50
+
+    await coins.release_hold(hold)
+
+    assert await coins.get_available_balance("u1") == INITIAL_BONUS_COINS
+    with pytest.raises(ValueError):
+        await coins.commit_hold(hold)
@@ -0,0 +1,71 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.coins_service import CoinsService
+from app.services.payment_reconciliation import RECENT_SESSION_GRACE_SECONDS, StripePaymentReconciler
+from app.services.stripe_events import handle_checkout_completed
+
+
+def paid_session(session_id: str, created: int, metadata: dict | None = None) -> dict:
+    return {
+        "id": session_id,
+        "created": created,
+        "payment_status": "paid",
+        "metadata": {"user_id": "u1", "coins": "100", "package_id": "pack_100"} if metadata is None else metadata,
+    }
+
+
+def reconciler(db, sessions: list) -> StripePaymentReconciler:
+    """Reconciliação com a listagem do Stripe trocada por uma página fixa."""
+    page = SimpleNamespace(
+        data=[SimpleNamespace(to_dict=lambda session=session: session) for session in sessions],
+        has_more=False,
+    )
+
+    async def fetch_page(since, starting_after):
+        return page
+
+    reconciler = StripePaymentReconciler(db=db)
+    reconciler._fetch_page = fetch_page
+    return reconciler
+
+
+@pytest.mark.asyncio
+async def test_reconciler_and_webhook_credit_session_once(db):
+    coins = CoinsService(db=db)
+    start = (await coins.get_user_balance("u1")).balance
+    session = paid_session("cs_1", int(time.time()) - RECENT_SESSION_GRACE_SECONDS - 60)
+
+    await asyncio.gather(
+        reconciler(db, [session]).run(),
+        handle_checkout_completed({"id": "evt_1", "data": {"object": session}}),
+    )
+    # Entrega atrasada do webhook depois da reconciliação
+    await handle_checkout_completed({"id": "evt_2", "data": {"object": session}})
+
+    assert (await coins.get_user_balance("u1")).balance == start + 100
+    purchases = [
+        tx for path, tx in db.data.items()
+        if path[0] == "coin_transactions" and tx["reference_id"] == "cs_1"
+    ]
+    assert len(purchases) == 1
+
+
+@pytest.mark.asyncio
+async def test_recent_and_invalid_sessions_do_not_hold_the_watermark(db):
+    now = int(time.time())
+    sessions = [
+        paid_session("cs_bad", now - 3600, metadata={}),
+        paid_session("cs_recent", now - 5),
+    ]
+
+    report = await reconciler(db, sessions).run()
+
+    assert report.credited == []
+    assert report.errors == {}
+    assert list(report.skipped) == ["cs_bad"]
+    assert report.skipped_recent == 1
+    assert db.data[("stripe_reconciliation", "watermark")]["created"] == now - 5
@@ -0,0 +1,66 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.services.coins_service import CoinsService
+from app.services.stripe_events import StripeEventQueue
+
+
+def checkout_event(event_id: str, session_id: str, coins: int = 100) -> bytes:
+    return json.dumps({
+        "id": event_id,
+        "type": "checkout.session.completed",
+        "data": {"object": {
+            "id": session_id,
+            "payment_status": "paid",
+            "metadata": {"user_id": "u1", "coins": str(coins), "package_id": "pack_100"},
+        }},
+    }).encode("utf-8")
+
+
+async def balance(db) -> int:
+    return (await CoinsService(db=db).get_user_balance("u1")).balance
+
+
+@pytest.mark.asyncio
+async def test_duplicate_delivery_credits_once(db):
+    queue = StripeEventQueue(workers=1, max_attempts=3, db=db)
+    start = await balance(db)
+
+    assert await queue.enqueue("evt_1", "checkout.session.completed", checkout_event("evt_1", "cs_1"))
+    # Mesmo event.id de novo: descartado na ingestão
+    assert not await queue.enqueue("evt_1", "checkout.session.completed", checkout_event("evt_1", "cs_1"))
+    # Outro evento para a mesma sessão: processado, mas não credita de novo
+    assert await queue.enqueue("evt_2", "checkout.session.completed", checkout_event("evt_2", "cs_1"))
+
+    for event_id in ("evt_1", "evt_1", "evt_2"):
+        await queue._process(event_id)
+
+    assert await balance(db) == start + 100
+    assert db.data[("stripe_events", "evt_1")]["status"] == "done"
+    assert db.data[("stripe_events", "evt_1")]["attempts"] == 1
+    assert db.data[("stripe_events", "evt_2")]["status"] == "done"
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_reclaimed(db):
+    queue = StripeEventQueue(workers=1, max_attempts=3, db=db)
+    start = await balance(db)
+    await queue.enqueue("evt_1", "checkout.session.completed", checkout_event("evt_1", "cs_1"))
+
+    # Um worker assume o evento e morre antes de terminar
+    assert queue._claim("evt_1") is not None
+    assert queue._claim("evt_1") is None
+    assert "evt_1" not in queue._due_event_ids()
+    await queue._process("evt_1")
+    assert await balance(db) == start
+
+    # Lease vencido: o poller devolve o evento à fila e outro worker conclui
+    db.data[("stripe_events", "evt_1")]["next_attempt_at"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+    assert "evt_1" in queue._due_event_ids()
+    await queue._process("evt_1")
+
+    assert await balance(db) == start + 100
+    assert db.data[("stripe_events", "evt_1")]["status"] == "done"
+    assert db.data[("stripe_events", "evt_1")]["attempts"] == 2